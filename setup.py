@@ -31,9 +31,15 @@ setup(
         "pandas",
         "pytest",
         "pyyaml",
+        # scipy.optimize for --search optimize, scipy.stats.qmc for --sample.
+        "scipy>=1.7",
         "selenium",
         "streamlit",
     ],
+    extras_require={
+        # The emulator of --search surrogate.
+        "surrogate": ["scikit-learn"],
+    },
     classifiers=[
         "Programming Language :: Python :: 3",
         "License :: OSI Approved :: MIT License",
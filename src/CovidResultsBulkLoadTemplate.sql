@@ -1,3 +1,7 @@
 bulk insert CovidModel.dbo.CovidPennModel
 from '${CSV_PATH}'
-with (tablock, firstrow=2, fieldterminator=',', rowterminator='\r\n')
\ No newline at end of file
+with (tablock, firstrow=2, fieldterminator=',', rowterminator='\r\n')
+
+bulk insert CovidModel.dbo.CovidPennModelPolicy
+from '${POLICY_CSV_PATH}'
+with (tablock, firstrow=2, fieldterminator=',', rowterminator='\r\n')
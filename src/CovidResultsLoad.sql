@@ -7,7 +7,9 @@ go
 
 --/*
 drop table CovidPennModel;
+drop table CovidPennModelPolicy;
 -- truncate table CovidPennModel;
+-- truncate table CovidPennModelPolicy;
 --*/
 
 /*
@@ -40,12 +42,7 @@ create table CovidPennModel (
   group_param_set_id int not null,
   future_divergence_set_id int not null,
 
-  policy_str varchar(max),
-  policy_hash bigint not null,
-  past_policy_str varchar(max),
-  past_policy_hash bigint not null,
-  future_policy_str varchar(max),
-  future_policy_hash bigint not null,
+  policy_id int not null, -- CovidPennModelPolicy
 
   --mitigation_date_1 date not null,
   --relative_contact_rate_1 real not null,
@@ -82,6 +79,20 @@ create table CovidPennModel (
 
 print 'Table created.';
 
+-- One row per mitigation policy, from the PennModelFit_Policies_*.csv file
+-- written beside the combined output.
+create table CovidPennModelPolicy (
+  policy_id int not null primary key,
+  policy_str varchar(max),
+  policy_hash bigint not null,
+  past_policy_str varchar(max),
+  past_policy_hash bigint not null,
+  future_policy_str varchar(max),
+  future_policy_hash bigint not null
+);
+
+print 'Policy table created.';
+
 /*
 
 date day susceptible infected recovered ever_infected ever_hospitalized
@@ -109,6 +120,11 @@ from 'D:\PennModelFit_Combined_2020-05-24_20200525202844.csv'
 with (tablock, firstrow=2, fieldterminator=',', rowterminator='\r\n')
 ;
 
+bulk insert CovidPennModelPolicy
+from 'D:\PennModelFit_Policies_2020-05-24_20200525202844.csv'
+with (tablock, firstrow=2, fieldterminator=',', rowterminator='\r\n')
+;
+
 print 'Bulk insert complete';
 
 -- date,day,susceptible,infected,recovered,ever_infected,ever_hospitalized,hospitalized,ever_icu,icu,ever_ventilated,ventilated,admits_hospitalized,admits_icu,admits_ventilated,census_hospitalized,census_icu,census_ventilated,param_set_id,region_name,population,market_share,group_param_set_id,mitigation_policy_hash,mitigation_date_1,relative_contact_rate_1,mitigation_date_2,relative_contact_rate_2,mitigation_date_3,relative_contact_rate_3,hospitalized_rate,mse,mse_icu,mse_cum,run_date,end_date_days_back,hospitalized_days,icu_rate,icu_days,ventilated_rate,ventilated_days,current_hospitalized
@@ -146,10 +162,11 @@ from CovidPennModel
 group by group_param_set_id
 having count(distinct mse) > 1
 
-select *
-from CovidPennModel
-where param_set_id = 37 and past_policy_hash=-7906904041677924221 and future_policy_hash=-3162216497309240828
-order by date
+select m.*
+from CovidPennModel m
+join CovidPennModelPolicy p on p.policy_id = m.policy_id
+where m.param_set_id = 37 and p.past_policy_hash=-7906904041677924221 and p.future_policy_hash=-3162216497309240828
+order by m.date
 
 /*
 select distinct
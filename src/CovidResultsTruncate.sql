@@ -1 +1,2 @@
-truncate table CovidModel.dbo.CovidPennModel
\ No newline at end of file
+truncate table CovidModel.dbo.CovidPennModel
+truncate table CovidModel.dbo.CovidPennModelPolicy
\ No newline at end of file
@@ -2,5 +2,14 @@ from .interpolate_dates import interpolate_dates
 from .dataload import *
 from .params import *
 from .misc import *
+from .policies import *
+from .reporting import *
+from .plan import *
+from .search import *
+from .optimize import *
+from .surrogate import *
+from .scoring import *
+from .merge import *
+from .workqueue import *
 from .batch import *
 from .bulk_load_generate import *
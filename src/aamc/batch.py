@@ -9,9 +9,10 @@ import pandas as pd
 import penn_chime.parameters
 from penn_chime.parameters import Parameters, Disposition, Regions
 import penn_chime.models
-from sklearn.metrics import mean_squared_error
+from penn_chime.multiregion import FitCache, ModelRegion, MultiRegionModel
+import numpy as np
 import datetime
-import sys, json, re, os, os.path, shutil
+import sys, json, re, os, os.path, shutil, io, time
 import logging, configparser
 import functools, itertools, traceback, hashlib
 
@@ -20,24 +21,46 @@ USE_FUTURE_DIVERGENCE = True
 INTERPOLATED_DATES_COUNT = 0
 MITIGATION_DATE_LISTING_COUNT = 3
 
+# A sweep projected to take longer than this is refused unless forced.
+SWEEP_TIME_BUDGET_HOURS = 10
+# Consecutive groups timed to plan a sweep: enough for the fit and group
+# model caches to reuse work as they do in the sweep itself.
+CALIBRATION_GROUPS = 24
+# Project derived regions by scaling their base region's projection, where
+# RegionTable.scaled_from and MultiRegionModel find that exact, rather than
+# simulating them.
+SCALE_DERIVED_REGIONS = True
+# Models of recent groups of a sweep, by their (canonical) inputs.
+# Equivalent policies are neighbours in the grid, so a few suffice.
+GROUP_MODEL_CACHE_SIZE = 16
+
 start_time = None
 
+logger = logging.getLogger(__name__)
+
 penn_chime.parameters.PRINT_PARAMS = False
 penn_chime.models.logger.setLevel(logging.CRITICAL)
 
-def data_based_variations(report_date, old_style_inputs):
-    print("data_based_variations")
+def data_based_variations(
+    report_date, old_style_inputs,
+    plan_only=False, force=False, search=SEARCH_GRID, search_options=None,
+    backtest_horizons=(), deadline=None, sample_options=None, queue_options=None,
+    shard=None,
+):
+    logger.debug("data_based_variations")
     hosp_census_df, hosp_census_lookback, report_date = \
         load_qlik_exported_data(report_date)
-    print("LOAD COMPLETE")
-    print(hosp_census_df)
-    print(hosp_census_df.dtypes)
-    print("Patients today: %s" % hosp_census_lookback[0])
+    logger.info("LOAD COMPLETE")
+    logger.debug("%s\n%s", hosp_census_df, hosp_census_df.dtypes)
+    logger.info("Patients today: %s", hosp_census_lookback[0])
     base = dict(BASE_PARAMS)
     base["hosp_census_lookback"] = hosp_census_lookback
     base["current_date"] = report_date
     varying_params_lists = \
         get_varying_params(report_date, INTERPOLATED_DATES_COUNT, USE_FUTURE_DIVERGENCE)
+    if backtest_horizons:
+        # Fit as of the report date; earlier origins are backtested per group.
+        varying_params_lists["end_date_days_back"] = [ 0 ]
     varying_params = [
         varying_params_lists[k] for k in [
             "doubling_time", "relative_contact_rate", "mitigation_date",
@@ -48,125 +71,435 @@ def data_based_variations(report_date, old_style_inputs):
     param_set = (
         base, get_regions(), *varying_params
     )
+    space = ParamSpace(USE_DOUBLING_TIME, *param_set)
+    if sample_options:
+        # Sample within the ranges the grid spans instead of sweeping it.
+        space = SampledParamSpace.from_grid(space, **sample_options)
+    validate_param_space(space, RegionTable.from_space(space, backtest_horizons))
+    if queue_options:
+        queue_options = dict(queue_options)
+        hosts = queue_options.pop("hosts", 1)
+    else:
+        hosts = 1
+    # A shard is planned and swept on its own; its manifest still
+    # describes it as part of the whole space.
+    sweep_space = space if shard is None else space.shard(*shard)
+    if force and not plan_only:
+        # A forced sweep is not refused, so it is not calibrated either.
+        plan = None
+    else:
+        plan = plan_sweep(sweep_space, hosp_census_df, hosts=hosts)
+        logger.info("%s", plan)
+    if plan_only:
+        return False
+    if queue_options and not queue_options["coordinator"]:
+        # The coordinator that published the sweep has checked its plan.
+        logger.info("Working on the sweep queued in %s.", queue_options["directory"])
+    elif search != SEARCH_GRID:
+        logger.info("Search mode '%s' evaluates only part of this grid.", search)
+    elif deadline is not None:
+        logger.info("Stopping at the deadline, %s, if not done.", deadline.isoformat())
+    elif plan is None:
+        logger.info("Running without a sweep plan (--force).")
+    elif plan.verdict == PLAN_REFUSE:
+        logger.error(
+            "REFUSING TO RUN: projected time exceeds %s hours; use --force to run anyway.",
+            SWEEP_TIME_BUDGET_HOURS)
+        return False
+    elif plan.verdict == PLAN_WARN:
+        logger.warning(
+            "WARNING: sweep is close to the %s hour budget.", SWEEP_TIME_BUDGET_HOURS)
     global start_time
     start_time = datetime.datetime.now()
-    print("Beginning fit: %s" % start_time.isoformat())
+    logger.info("Beginning fit: %s", start_time.isoformat())
     output_file_path = os.path.join(get_output_dir(), "PennModelFit_Combined_%s_%s.csv" % (
         report_date.isoformat(), now_timestamp()))
-    find_best_fitting_params(output_file_path, hosp_census_df, *param_set)
+    if shard is not None:
+        output_file_path = output_file_path.replace(".csv", "_%dof%d.csv" % shard)
+    if queue_options:
+        if not run_work_queue(
+                output_file_path, hosp_census_df, space, backtest_horizons,
+                **queue_options):
+            return False
+    else:
+        find_best_fitting_params(
+            output_file_path, hosp_census_df, sweep_space,
+            search, search_options, backtest_horizons, deadline)
+        if shard is not None:
+            write_shard_manifest(output_file_path, space, *shard)
     compl_time = datetime.datetime.now()
-    print("Completed fit: %s" % compl_time.isoformat())
+    logger.info("Completed fit: %s", compl_time.isoformat())
     elapsed_time_secs = (compl_time - start_time).total_seconds()
-    print("Elapsed time: %d:%02d (%s secs)" % (
+    logger.info("Elapsed time: %d:%02d (%s secs)",
         int(elapsed_time_secs % 60), int(elapsed_time_secs / 60),
-         str(elapsed_time_secs)))
+        str(elapsed_time_secs))
+    if shard is not None:
+        logger.info("Wrote shard %d of %d; merge the shards with package.py.", *shard)
+        return False
     if os.path.exists(COPY_PATH):
         copy_file(output_file_path, COPY_PATH)
-    print("OUTPUT FILE BASENAME: %s" % os.path.basename(output_file_path))
+    logger.info("OUTPUT FILE BASENAME: %s", os.path.basename(output_file_path))
+    return True
+
+def run_work_queue(
+    output_file_path, hosp_census_df, space, backtest_horizons=(),
+    directory=None, coordinator=True, range_groups=QUEUE_RANGE_GROUPS,
+):
+    """Sweep the grid together with other processes sharing a work queue.
+
+    The coordinator publishes the ranges of the grid to the queue
+    directory, works on them like any worker and, once every range is
+    done, merges the parts into output_file_path. Returns whether this
+    process wrote the output.
+    """
+    if coordinator:
+        write_params_summary(space)
+        queue = WorkQueue.publish(directory, space, range_groups)
+    else:
+        queue = WorkQueue(directory)
+        queue.attach(space)
+
+    def run_range(view, part_path):
+        find_best_fitting_params(
+            part_path, hosp_census_df, view, backtest_horizons=backtest_horizons,
+            record=False)
+
+    ranges_run = queue.run_worker(space, run_range)
+    logger.info("QUEUE: %s ran %d of %d ranges", queue.worker, ranges_run, len(queue.ranges))
+    if not coordinator:
+        return False
+    queue.merge(output_file_path)
+    logger.info("Merged parts: %s", record_output_path(output_file_path))
+    return True
+
+def record_output_path(output_file_path):
+    """Write the output path to OUTPUT_PATH.txt for loading; returns it as written."""
+    output_path_display = output_file_path.replace("\\", "/")
+    with open("OUTPUT_PATH.txt", "w") as f:
+        print(output_path_display, file=f)
+    return output_path_display
+
+def write_params_summary(space):
+    """Write the parameter and group counts of a sweep to PARAMS.txt."""
+    logger.info("PARAMETER COUNT: %d", len(space))
+    with open("PARAMS.txt", "w") as f:
+        print("PARAMETER COUNT:", len(space), file=f)
+        print("GROUP COUNT:", space.group_count, file=f)
+        print("AXIS SIZES:", space.describe(), file=f)
+
+def plan_sweep(space, hosp_census_df, calibration_groups=CALIBRATION_GROUPS, hosts=1):
+    """Estimate the cost of a sweep from a short calibration run.
+
+    hosts is the number of processes expected to share the sweep.
+    """
+    seconds_per_group, bytes_per_row, measured_rows_per_group = \
+        calibrate_sweep(space, hosp_census_df, calibration_groups)
+    analytic_rows_per_group = rows_per_group(space)
+    if analytic_rows_per_group is None:
+        analytic_rows_per_group = measured_rows_per_group
+    return SweepPlan(
+        space, analytic_rows_per_group, seconds_per_group, bytes_per_row,
+        SWEEP_TIME_BUDGET_HOURS, hosts=hosts)
+
+def calibrate_sweep(space, hosp_census_df, calibration_groups):
+    """Time consecutive groups from the middle of the space, writing to memory.
+
+    The groups are fitted as the sweep fits them, with fit and group model
+    caches of their own, so the time per group includes the work that
+    neighbouring groups share.
+
+    Returns (seconds per group, output bytes per row, output rows per group).
+    """
+    target = CensusTarget(hosp_census_df)
+    region_table = RegionTable.from_space(space)
+    fit_cache = FitCache()
+    project = group_model_cache()
+    policies = PolicyTable.from_space(space)
+    group_ids = space.group_ids()
+    first = max(0, (len(group_ids) - calibration_groups) // 2)
+    sample = group_ids[first:first + calibration_groups]
+    sink = io.StringIO()
+    begin = time.perf_counter()
+    for i, group_param_set_id in enumerate(sample):
+        region_results = fit_group(
+            space.group(group_param_set_id), target, region_table, fit_cache,
+            project=project)
+        predict_for_all_regions(region_results, i == 0, sink, policies)
+    elapsed = time.perf_counter() - begin
+    lines = sink.getvalue().splitlines()
+    header_len, rows = len(lines[0]) + 1, len(lines) - 1
+    bytes_per_row = (len(sink.getvalue()) - header_len) / rows
+    return elapsed / len(sample), bytes_per_row, rows / len(sample)
 
 def find_best_fitting_params(
-    output_file_path,
-    hosp_census_df,
-    base_params, regions, doubling_times,
-    relative_contact_rates, mitigation_dates,
-    hospitalized, rel_icu_rate, rel_vent_rate,
-    end_date_days_back,
-    mitigation_stages,
+    output_file_path, hosp_census_df, space,
+    search=SEARCH_GRID, search_options=None, backtest_horizons=(), deadline=None,
+    record=True,
 ):
+    """Fit every group the search visits, writing each to the output file.
+
+    With a deadline (a datetime), the grid is swept coarse to fine, and
+    the grid, adaptive, warm and surrogate searches stop before a group
+    that could not finish by then. The output and policy table are still
+    written in full for the groups evaluated. The optimizer only writes
+    its best fits once it is done, so it cannot stop at a deadline.
+
+    With record false, as for one range of a work queue, the run's
+    PARAMS.txt, BEST.txt and OUTPUT_PATH.txt are left alone.
+    """
     #print("find_best_fitting_params")
-    best = {}
-    for region in regions:
-        region_name = region["region_name"]
-        best[region_name] = { "score": 1e10, "params": None }
-    hosp_dates = hosp_census_df.dropna().index
-    print("hosp_dates\n", hosp_dates)
-    generate_param_arguments = (
-        base_params, regions, list(doubling_times),
-        list(relative_contact_rates), mitigation_dates,
-        hospitalized, rel_icu_rate, rel_vent_rate,
-        end_date_days_back,
-        mitigation_stages,
-        )
-    params_count = 0
-    with open("PARAMS.txt", "w") as f:
-        for p in generate_param_permutations(USE_DOUBLING_TIME, *generate_param_arguments):
-            print(p, file=f)
-            params_count += 1
-        print("PARAMETER COUNT:", params_count)
-        print("PARAMETER COUNT:", params_count, file=f)
+    if deadline is not None and search == SEARCH_OPTIMIZE:
+        raise ValueError("The optimize search cannot stop at a deadline")
+    target = CensusTarget(hosp_census_df)
+    region_table = RegionTable.from_space(space, backtest_horizons)
+    fit_cache = FitCache()
+    project = group_model_cache()
+    policies = PolicyTable.from_space(space)
+    logger.debug("hosp_dates\n%s", target.dates)
+    search_options = dict(search_options or {})
+    if search == SEARCH_WARM:
+        # Before this run's output file exists.
+        warm_start = load_warm_start(
+            space, os.path.dirname(output_file_path),
+            search_options.pop("previous_output_path", None),
+            search_options.pop("top_k", WARM_START_TOP_K))
+    params_count = len(space)
+    if record:
+        write_params_summary(space)
     #print("EXIT EARLY")
     #sys.exit(0)
-    is_first_batch = True
-    print("Writing to file:", output_file_path)
-    params_progress_count = 0
-    with open(output_file_path, "w") as output_file:
-        region_results = {}
-        for p in generate_param_permutations(USE_DOUBLING_TIME, *generate_param_arguments):
-            params_progress_count += 1
-            record_progress(params_progress_count, params_count)
+    logger.info("Writing to file: %s", output_file_path)
+    # Rows are written on a thread of their own while the next group is fitted.
+    with open(output_file_path, "w") as f, BackgroundWriter(f) as output_file:
+        batches_written = 0
+        groups_done = 0
+        progress = ProgressReporter(params_count)
+        best = BestSoFar() if record else BestSoFar(path=None)
+        stop = Deadline.at(deadline) if deadline is not None else None
+
+        def evaluate(group_param_set_id):
+            nonlocal batches_written, groups_done
+            if stop is not None and stop.expired():
+                raise DeadlineReached()
+            group = space.group(group_param_set_id)
+            groups_done += 1
+            progress.update(groups_done * space.group_size)
             try:
-                current_region_results = predict_one_region(
-                    p, region_results, hosp_dates, hosp_census_df)
-                # When we see the same region a second time, we know that we've seen an
-                # entire cycle and we can record the results and start the next cycle.
-                region_name = p["region_name"]
-                if region_name in region_results:
-                    predict_for_all_regions(
-                        region_results, is_first_batch, output_file)
-                    is_first_batch = False
-                    region_results.clear()
-                    print("CLEAR REGION RESULTS")
-                region_results[region_name] = current_region_results
-                print("Added region results:", region_name)
+                region_results = fit_group(
+                    group, target, region_table, fit_cache, backtest_horizons, project)
             except Exception as e:
-                print("ERROR:")
-                traceback.print_exc()
+                logger.exception("ERROR:")
                 with open(ERRORS_FILE, "a") as errfile:
-                    print("Errors in param set:", p, file=errfile)
+                    print("Errors in param set group:", group, file=errfile)
                     traceback.print_exc(file=errfile)
                 sys.exit(1) # FIXME: REMOVE THIS LINE!!!!!!!!!!!!!!!!!!
-    output_path_display = output_file_path.replace("\\", "/")
-    print("Closed file:", output_path_display)
-    with open("OUTPUT_PATH.txt", "w") as f:
-        print(output_path_display, file=f)
+            mse = predict_for_all_regions(
+                region_results, batches_written == 0, output_file, policies)
+            batches_written += 1
+            best.update(group_param_set_id, mse)
+            return mse
 
-def predict_one_region(p, region_results, hosp_dates, hosp_census_df):
-    # The prediction happens here.
-    m, final_p = get_model_from_params(p, region_results)
-    # DataFrame raw_df holds the results of the model's prediction.
-    predict_df = m.raw_df
-    predict_df = predict_df.dropna() # remove rows with NaN values
-    predict_df = predict_df.set_index(PENNMODEL_COLNAME_DATE);
-    dates_intersection = predict_df.index.intersection(hosp_dates)
-    matched_pred_census_df = predict_df.loc[dates_intersection]
-    matched_hosp_census_df = hosp_census_df.loc[dates_intersection]
-    current_region_results = {
-        "model_predict_df": m.raw_df,
-        "matched_actual_census_df": matched_hosp_census_df,
-        "matched_predict_census_df": matched_pred_census_df,
-        "params": p,
-        "final_params": final_p,
-        "is_derived": bool(p.get("region_derived_from"))
-    }
-    return current_region_results
-
-def record_progress(params_progress_count, params_count):
-    global start_time
-    curr_time = datetime.datetime.now()
-    elapsed_time_secs = int((curr_time - start_time).total_seconds())
-    percent_done = params_progress_count / params_count
-    total_time_est = int(elapsed_time_secs / percent_done)
-    remaining_time_est = total_time_est - elapsed_time_secs
-    progress_message = (
-        ("PROGRESS: %d/%d (%s%%)"
-        % (params_progress_count, params_count, str(round(100 * percent_done, 2))))
-        +
-        (" (time: %d secs elapsed, est %d/%d remaining)"
-        % (elapsed_time_secs, remaining_time_est, total_time_est))
-    )
-    print(progress_message)
-    with open("PROGRESS.txt", "w") as f:
-        print(progress_message, file=f)
+        def write_group(group):
+            nonlocal batches_written
+            region_results = fit_group(
+                group, target, region_table, fit_cache, backtest_horizons, project)
+            predict_for_all_regions(
+                region_results, batches_written == 0, output_file, policies)
+            batches_written += 1
+
+        try:
+            if search == SEARCH_ADAPTIVE:
+                scores = adaptive_search(space, evaluate, **search_options)
+                best_id = min(scores, key=scores.get)
+                logger.info("ADAPTIVE SEARCH: %d of %d groups evaluated; best group %d, MSE = %s",
+                            len(scores), space.group_count, best_id, scores[best_id])
+            elif search == SEARCH_WARM:
+                scores = warm_search(space, evaluate, *warm_start, **search_options)
+                best_id = min(scores, key=scores.get)
+                logger.info("WARM START: %d of %d groups evaluated; best group %d, MSE = %s",
+                            len(scores), space.group_count, best_id, scores[best_id])
+            elif search == SEARCH_SURROGATE:
+                scores = surrogate_search(space, evaluate, **search_options)
+                best_id = min(scores, key=scores.get)
+                logger.info("SURROGATE SEARCH: %d of %d groups evaluated; best group %d, MSE = %s",
+                            len(scores), space.group_count, best_id, scores[best_id])
+            elif search == SEARCH_OPTIMIZE:
+                optimize_fit(
+                    space, target, region_table, write_group, fit_cache, project,
+                    bands_file_path=output_file_path.replace("_Combined_", "_Bands_"),
+                    **search_options)
+            else:
+                # Regions are the innermost axis of the space, so each group
+                # holds one parameter set per region and is recorded as one batch.
+                group_ids = \
+                    coarse_to_fine_order(space) if deadline is not None \
+                    else space.group_ids()
+                for group_param_set_id in group_ids:
+                    evaluate(group_param_set_id)
+        except DeadlineReached:
+            logger.warning("DEADLINE: stopped with %d of %d groups evaluated.",
+                           groups_done, space.group_count)
+        logger.info("%s", best.message())
+    policies.write(policy_table_path(output_file_path))
+    logger.info("Wrote %d policies: %s", len(policies), policy_table_path(output_file_path))
+    logger.info("FIT CACHE: %d hits, %d fits", fit_cache.hits, fit_cache.misses)
+    logger.info("GROUP MODELS: %d reused, %d simulated",
+                project.cache_info().hits, project.cache_info().misses)
+    if record:
+        output_file_path = record_output_path(output_file_path)
+    logger.info("Closed file: %s", output_file_path)
+
+def load_warm_start(space, output_dir, previous_output_path=None, top_k=WARM_START_TOP_K):
+    """Start points and baseline MSE for warm_search, from a previous run.
+
+    Uses the newest completed run in output_dir unless a previous output
+    file is given. Returns ([], None) when there is none, so that the
+    warm search evaluates the full grid.
+    """
+    if previous_output_path is None:
+        previous_output_path = \
+            latest_output_path(output_dir, space.base_params["current_date"])
+    if previous_output_path is None:
+        logger.warning("WARM START: no previous run in %s; searching the full grid.",
+                       output_dir)
+        return [], None
+    fits = load_previous_fits(previous_output_path, top_k)
+    starts = []
+    for i, fit in fits.iterrows():
+        point = warm_start_point(space, fit)
+        if point not in starts:
+            starts.append(point)
+    logger.info("WARM START: %d start points from the %d best groups of %s (MSE %s)",
+                len(starts), len(fits), previous_output_path, fits["mse"].min())
+    return starts, fits["mse"].min()
+
+def optimize_fit(
+    space, target, region_table, write_group, fit_cache=None, project=None,
+    max_evaluations=OPTIMIZER_MAX_EVALUATIONS, fit_hospitalized=False,
+    band_samples=0, bands_file_path=None,
+):
+    """Fit the past stage rates (and optionally hospitalization) by optimizer.
+
+    One optimization runs per end_date_days_back value, starting from the
+    middle of the grid. The best fit is written once for every future
+    divergence variant, with param_set_ids numbered after the grid's.
+    With band_samples, the neighborhood of each best fit is sampled and
+    census percentiles of the plausible samples are written to
+    bands_file_path.
+    """
+    policies = space.axes[PARAM_SPACE_AXES.index("mitigation_stages")]
+    next_param_set_id = space.total + 1
+    band_frames = []
+    for point in partition_starts(space):
+        template_id = group_id_at(space, point)
+        template = space.get(template_id)
+        start = Candidate(
+            [ r for (d, r) in template["mitigation_stages"] ][:len(policies.past_rates)],
+            template["hospitalized"])
+
+        def fit_candidate(candidate):
+            group = candidate_group(space, template_id, candidate)
+            region_results = fit_group(
+                group, target, region_table, fit_cache, project=project)
+            return score_group(region_results), region_results
+
+        best, best_mse, scores = optimize_candidate(
+            start, lambda c: fit_candidate(c)[0],
+            max_evaluations, fit_hospitalized)
+        logger.info("OPTIMIZER: %d evaluations; best %s, MSE = %s (end_date_days_back = %d)",
+                    len(scores), best, best_mse, template["end_date_days_back"])
+        for future_index in range(policies.future_count):
+            write_group(candidate_group(
+                space, template_id, best, future_index, next_param_set_id))
+            next_param_set_id += space.group_size
+        if band_samples:
+            accepted = sample_neighborhood(
+                best, best_mse, fit_candidate, band_samples, fit_hospitalized)
+            logger.info("OPTIMIZER: %d of %d neighborhood samples within tolerance",
+                        len(accepted), band_samples)
+            for sample_number, region_results in enumerate(accepted):
+                for region_name, rr in region_results.items():
+                    df = rr["model_predict_df"][[
+                        PENNMODEL_COLNAME_DATE, PENNMODEL_COLNAME_CENSUS_HOSP,
+                        PENNMODEL_COLNAME_CENSUS_ICU, PENNMODEL_COLNAME_CENSUS_VENT,
+                    ]].copy()
+                    df["region_name"] = region_name
+                    df["end_date_days_back"] = template["end_date_days_back"]
+                    band_frames.append(df)
+    if band_frames:
+        bands_df = percentile_bands(
+            concat_dataframes(band_frames),
+            ["end_date_days_back", "region_name", PENNMODEL_COLNAME_DATE],
+            [PENNMODEL_COLNAME_CENSUS_HOSP, PENNMODEL_COLNAME_CENSUS_ICU,
+             PENNMODEL_COLNAME_CENSUS_VENT])
+        bands_df.to_csv(bands_file_path, index=False)
+        logger.info("Wrote uncertainty bands: %s", bands_file_path)
+
+def candidate_group(space, template_id, candidate, future_index=0, param_set_id=0):
+    """A template group with an off-grid policy and hospitalization."""
+    policies = space.axes[PARAM_SPACE_AXES.index("mitigation_stages")]
+    group = space.group(template_id)
+    for i, p in enumerate(group):
+        p["mitigation_stages"] = policies.policy(candidate.rates, future_index)
+        p["hospitalized"] = candidate.hospitalized
+        p["param_set_id"] = param_set_id + i
+        p["policy_id"] = None
+    return group
+
+def score_group(region_results):
+    """The census MSE of one group, without writing anything."""
+    region_results_nonderived = [
+        r for r in region_results.values() if not r["is_derived"] ]
+    return compute_error(region_results_nonderived)[2]
+
+def fit_group(
+    group, target, region_table, fit_cache=None, backtest_horizons=(), project=None,
+):
+    """Run the model for every region of one group at once, in region order.
+
+    With backtest_horizons, each region result also holds the group's
+    backtest census MSE by horizon (see backtest_group). project, if
+    given, replaces project_group (see group_model_cache).
+    """
+    m, final_params = get_model_from_params(group, region_table, fit_cache, project)
+    backtest_mse = backtest_group(
+        group, target, region_table, fit_cache, backtest_horizons, project)
+    region_results = {}
+    for p, final_p, raw in zip(group, final_params, m.raw):
+        # DataFrame model_predict_df holds the results of the model's
+        # prediction; the census match is taken from the underlying arrays.
+        region_results[p["region_name"]] = {
+            "model_predict_df": pd.DataFrame(data=raw),
+            "census_target": target,
+            "census_match": target.match(raw),
+            "params": p,
+            "final_params": final_p,
+            "is_derived": bool(p.get("region_derived_from")),
+            "backtest_mse": backtest_mse,
+        }
+        logger.debug("Added region results: %s", p["region_name"])
+    return region_results
+
+def backtest_group(group, target, region_table, fit_cache, horizons, project=None):
+    """Census MSE of the group refitted at earlier origins, by horizon.
+
+    For a horizon of h days the group is fitted as of h days before the
+    report date and scored only on the h days after that, which the fit
+    did not see. Refits share the run's fit and model caches, so a
+    horizon costs a projection rather than a fit for most groups.
+    """
+    backtest_mse = {}
+    for h in horizons:
+        shifted = [ dict(p, end_date_days_back=h) for p in group ]
+        m, _ = get_model_from_params(shifted, region_table, fit_cache, project)
+        origin = region_table.current_dates[region_table.days_back_index[h]]
+        matches = [
+            target.match(raw) for p, raw in zip(group, m.raw)
+            if not p.get("region_derived_from") ]
+        window = (origin + datetime.timedelta(days=1),
+                  origin + datetime.timedelta(days=h))
+        backtest_mse[h] = target.score(matches, window)[2][0]
+    return backtest_mse
 
 def common_params(params_list):
     common = {}
@@ -182,7 +515,7 @@ def common_params(params_list):
             common[k] = v
     return common
 
-def predict_for_all_regions(region_results, is_first_batch, output_file):
+def predict_for_all_regions(region_results, is_first_batch, output_file, policies):
     #print("predict_for_all_regions")
     region_results_list = list(region_results.values())
     add_actual_share_census(region_results)
@@ -190,87 +523,70 @@ def predict_for_all_regions(region_results, is_first_batch, output_file):
         r for r in region_results_list
         if r["is_derived"] == False 
     ]
-    actual_df, predict_df, mse, mse_icu, mse_cum = \
+    actual, predicted, mse, mse_icu, mse_cum = \
         compute_error(region_results_nonderived)
-    print("MSE = %s, ICU MSE = %s, CUM MSE = %s" % (str(mse), str(mse_icu), str(mse_cum)))
+    logger.debug("MSE = %s, ICU MSE = %s, CUM MSE = %s", mse, mse_icu, mse_cum)
     params_list = [ r["params"] for r in region_results_list ]
-    combined_model_predict_df = combine_model_predictions(region_results_list, params_list)
+    combined_model_predict_df_list = \
+        combine_model_predictions(region_results_list, params_list)
     first_region = region_results_list[0]
-    display_fit_estimates(actual_df, predict_df, first_region["params"])
+    if logger.isEnabledFor(logging.DEBUG):
+        display_fit_estimates(actual, predicted, first_region["params"])
     write_fit_rows(
         common_params(params_list),
         first_region["final_params"],
-        combined_model_predict_df,
+        combined_model_predict_df_list,
+        first_region["backtest_mse"],
         mse, mse_icu, mse_cum,
         is_first_batch,
-        output_file)
+        output_file,
+        policies)
+    return mse
 
 def combine_model_predictions(region_results_list, params_list):
+    """Tag each region's predictions with its parameter set and group.
+
+    Returns the per-region frames, in region order; they are written one
+    after another rather than concatenated.
+    """
     combined_model_predict_df_list = \
         [ r["model_predict_df"] for r in region_results_list ]
+    group_param_set_id = min(
+        [ r["params"]["param_set_id"] for r in region_results_list ])
     for i in range(len(region_results_list)):
         for prop_name in ["param_set_id", "region_name", "population", "market_share"]:
             combined_model_predict_df_list[i][prop_name] = params_list[i][prop_name]
-    combined_model_predict_df = concat_dataframes(combined_model_predict_df_list)
-    group_param_set_id = min(
-        [ r["params"]["param_set_id"] for r in region_results_list ])
-    combined_model_predict_df["group_param_set_id"] = group_param_set_id
-    combined_model_predict_df["future_divergence_set_id"] = \
-            int(group_param_set_id / get_future_divergence_set_size())
-    return combined_model_predict_df
+        combined_model_predict_df_list[i]["group_param_set_id"] = group_param_set_id
+        combined_model_predict_df_list[i]["future_divergence_set_id"] = \
+                int(group_param_set_id / get_future_divergence_set_size())
+    return combined_model_predict_df_list
 
 def add_actual_share_census(region_results):
     for rr in region_results.values():
         if not rr["is_derived"]:
-            actual_df = rr["matched_actual_census_df"]
-            actual_df = rr["params"]["region_patient_share"] * actual_df
-            rr["actual_share_census_df"] = actual_df
+            mask, _ = rr["census_match"]
+            actual = rr["census_target"].actual[:, mask]
+            rr["actual_share_census"] = rr["params"]["region_patient_share"] * actual
         else:
             derived_from = rr["params"]["region_derived_from"]
             base_region_results = region_results[derived_from]
             derived_scale = rr["params"]["region_derived_scale"]
-            base_region_actual_df = base_region_results["actual_share_census_df"]
-            derived_actual_df = derived_scale * base_region_actual_df
-            rr["actual_share_census_df"] = derived_actual_df
+            rr["actual_share_census"] = \
+                derived_scale * base_region_results["actual_share_census"]
 
 def compute_error(region_results_nonderived):
-    combined_actual_df = concat_dataframes(
-        [r["matched_actual_census_df"] for r in region_results_nonderived ])
-    combined_predict_included_df = concat_dataframes(
-        [r["matched_predict_census_df"] for r in region_results_nonderived ])
-    actual_df = (
-        combined_actual_df
-        .resample("D")[[
-            HOSP_DATA_COLNAME_TESTRESULTCOUNT,
-            HOSP_DATA_COLNAME_ICU_COUNT,
-            HOSP_DATA_COLNAME_CUMULATIVE_COUNT,
-        ]]
-        .max()
-    )
-    #print("actual_df", actual_df)
-    predict_df = (
-        combined_predict_included_df
-        #.region_name.isin(region_names_included)
-        .resample("D")[[
-            PENNMODEL_COLNAME_CENSUS_HOSP,
-            PENNMODEL_COLNAME_CENSUS_ICU,
-            PENNMODEL_COLNAME_EVER_HOSP,
-        ]]
-        .sum()
-    )
-    #print("predict_df", predict_df)
-    mse, mse_icu, mse_cum = [
-        round(mean_squared_error(actual_df[actual_col], predict_df[predict_col]), 2)
-        for actual_col, predict_col in [
-            (HOSP_DATA_COLNAME_TESTRESULTCOUNT, PENNMODEL_COLNAME_CENSUS_HOSP),
-            (HOSP_DATA_COLNAME_ICU_COUNT, PENNMODEL_COLNAME_CENSUS_ICU),
-            (HOSP_DATA_COLNAME_CUMULATIVE_COUNT, PENNMODEL_COLNAME_EVER_HOSP),
-        ]
-    ]
-    return actual_df, predict_df, mse, mse_icu, mse_cum
+    """Actual and summed predicted census over the days the regions cover,
+    with the census, ICU and cumulative MSEs.
+
+    actual and predicted hold one row per column in SCORED_COLUMNS.
+    """
+    target = region_results_nonderived[0]["census_target"]
+    actual, predicted, (mse, mse_icu, mse_cum) = \
+        target.score([ r["census_match"] for r in region_results_nonderived ])
+    return actual, predicted, mse, mse_icu, mse_cum
 
-def display_fit_estimates(actual_df, predict_df, first_region_params):
-    data_len = len(actual_df.index)
+def display_fit_estimates(actual, predicted, first_region_params):
+    data_len = actual.shape[1]
     midpoint_index = int(data_len / 2);
     indices = sorted(set([
         int(x)
@@ -289,51 +605,44 @@ def display_fit_estimates(actual_df, predict_df, first_region_params):
     #    print(predict_df, file=f)
     #    print(predict_df.dtypes, file=f)
     #    print("INDICES:", indices, file=f)
-    actual_endpoints = []
-    for x in indices:
-        #print("INDEX:", x, file=f)
-        actual_df_value = actual_df[HOSP_DATA_COLNAME_TESTRESULTCOUNT].iloc[x]
-        #print("VALUE:", actual_df_value, file=f)
-        actual_endpoints.append(actual_df_value)
-    #actual_endpoints = [
-    #    actual_df[HOSP_DATA_COLNAME_TESTRESULTCOUNT].iloc[x]
-    #    for x in indices ]
-    predict_endpoints = [
-        predict_df[PENNMODEL_COLNAME_CENSUS_HOSP].iloc[x]
-        for x in indices ]
-    mse_endpoints = mean_squared_error(actual_endpoints, predict_endpoints)
-    print(actual_endpoints, predict_endpoints, mse_endpoints)
+    # Row 0 of actual and predicted is the hospital census.
+    actual_endpoints = actual[0, indices]
+    predict_endpoints = predicted[0, indices]
+    mse_endpoints = ((actual_endpoints - predict_endpoints) ** 2).mean()
+    logger.debug("%s %s %s", actual_endpoints, predict_endpoints, mse_endpoints)
 
 def write_fit_rows(
-    p, final_p, predict_df,
+    p, final_p, predict_df_list, backtest_mse,
     mse, mse_icu, mse_cum,
-    is_first_batch, output_file,
+    is_first_batch, output_file, policies,
 ):
     #print("write_fit_rows")
     try:
-        df = predict_df.dropna().set_index(PENNMODEL_COLNAME_DATE)
-        mitigation_policy_summ = \
-            summarize_mitigation_policy(p["current_date"], p["mitigation_stages"])
-        for key, val in mitigation_policy_summ:
-            df[key] = val
-        #df["mitigation_policy_hash"] = mitigation_policy_hash
-        df["hospitalized_rate"] = p["hospitalized"].rate
+        # Columns shared by every row of the group, in output order.
+        fit_columns = [ [ "policy_id", policies.intern(
+            p["mitigation_stages"], p.get("policy_id")) ] ]
+        #fit_columns.append(["mitigation_policy_hash", mitigation_policy_hash])
+        fit_columns.append(["hospitalized_rate", p["hospitalized"].rate])
         if USE_DOUBLING_TIME:
-            df["doubling_time"] = p["doubling_time"]
-        df["mse"] = mse
-        df["mse_icu"] = mse_icu
-        df["mse_cum"] = mse_cum
-        df["run_date"] = p["current_date"]
-        df["end_date_days_back"] = p["end_date_days_back"]
-        df["hospitalized_rate"] = p["hospitalized"].rate
-        df["hospitalized_days"] = p["hospitalized"].days
-        df["icu_rate"] = final_p["icu"].rate
-        df["icu_days"] = final_p["icu"].days
-        df["ventilated_rate"] = final_p["ventilated"].rate
-        df["ventilated_days"] = final_p["ventilated"].days
-        df["current_hospitalized"] = final_p["current_hospitalized"]
+            fit_columns.append(["doubling_time", p["doubling_time"]])
+        fit_columns += [
+            [ "mse", mse ],
+            [ "mse_icu", mse_icu ],
+            [ "mse_cum", mse_cum ],
+        ] + [
+            [ "mse_backtest_%d" % h, e ] for h, e in backtest_mse.items()
+        ] + [
+            [ "run_date", p["current_date"] ],
+            [ "end_date_days_back", p["end_date_days_back"] ],
+            [ "hospitalized_days", p["hospitalized"].days ],
+            [ "icu_rate", final_p["icu"].rate ],
+            [ "icu_days", final_p["icu"].days ],
+            [ "ventilated_rate", final_p["ventilated"].rate ],
+            [ "ventilated_days", final_p["ventilated"].days ],
+            [ "current_hospitalized", final_p["current_hospitalized"] ],
+        ]
     except KeyError as e:
-        print("EXCEPTION IN WRITE:", e, file=sys.stderr)
+        logger.error("EXCEPTION IN WRITE: %s", e)
         with open(ERRORS_FILE, "a") as errfile:
             print(datetime.datetime.now().isoformat(), file=errfile)
             traceback.print_exc(file=errfile)
@@ -341,7 +650,14 @@ def write_fit_rows(
         # Leaving this stop here for now because it's not getting hit.
         # Looks like the sporadic errors we had before are fixed now.
         return
-    df.to_csv(output_file, header=is_first_batch)
+    def fit_rows(predict_df):
+        df = predict_df.dropna().set_index(PENNMODEL_COLNAME_DATE)
+        for key, val in fit_columns:
+            df[key] = val
+        return df
+    write_dataframes(
+        [ fit_rows(df) for df in predict_df_list ], output_file,
+        header=is_first_batch)
     increment_iters()
 
 ITERS = 0
@@ -352,54 +668,43 @@ def increment_iters():
     if ITERS == 1:
         #raise Exception("STOPPING TO DEBUG")
         pass
-    print("ITERATIONS:", ITERS)
+    logger.debug("ITERATIONS: %d", ITERS)
     #if ITERS == 10: sys.exit() # FIXME
-    sys.stdout.flush()
-
-def summarize_mitigation_policy(report_date, mitigation_stages):
-    past_policy = [ ms for ms in mitigation_stages if ms[0] < report_date ]
-    future_policy = [ ms for ms in mitigation_stages if ms[0] >= report_date ]
-    complete_str, past_str, future_str = [
-        mitigation_policy_tostring(mp)
-        for mp in [ mitigation_stages, past_policy, future_policy ]
-    ]
-    hash_function = lambda x: md5(x, 8)
-    summaries = [
-        [ "policy_str", complete_str ],
-        [ "policy_hash", hash_function(complete_str) ],
-        [ "past_str", past_str ],
-        [ "past_policy_hash", hash_function(past_str) ],
-        [ "future_str", future_str ],
-        [ "future_policy_hash", hash_function(future_str) ],
-    ]
-    return summaries
-    """
-    partial_listing = []
-    for i in range(MITIGATION_DATE_LISTING_COUNT):
-        n = str(i + 1)
-        try:
-            partial_listing += [
-                ("mitigation_date_" + n, "mitigation_stages"[i][0]),
-                ("relative_contact_rate_" + n, "mitigation_stages"[i][1]),
-            ]
-        except IndexError:
-            partial_listing += [
-                ("mitigation_date_" + n, None),
-                ("relative_contact_rate_" + n, None),
-            ]
-    return summaries + partial_listing
+
+def get_model_from_params(group, region_table, fit_cache=None, project=None):
+    """The multi-region model of one group, and each region's model params.
+
+    The regions of a group differ only in their region fields, so the
+    first region's params supply everything the regions share.
     """
+    final_params = [ get_model_params(p, region_table) for p in group ]
+    for p in final_params:
+        logger.debug("%s", p)
+    # The parameter space was validated up front by validate_param_space.
+    params_obj = Parameters.from_validated(**final_params[0])
+    regions = []
+    for p, final_p in zip(group, final_params):
+        scaled_from = \
+            region_table.scaled_from[region_table.region_index[p["region_name"]]]
+        if not SCALE_DERIVED_REGIONS or scaled_from is None:
+            scaled_from = (None, 1.0)
+        regions.append(ModelRegion(
+            p["region_name"], final_p["population"], final_p["market_share"],
+            final_p["current_hospitalized"], *scaled_from))
+    project = project or project_group
+    return project(params_obj, tuple(regions), fit_cache), final_params
 
-def mitigation_policy_tostring(mitigation_policy):
-    s = [ "%s:%f" % (d.isoformat(), r) for (d, r) in mitigation_policy ]
-    return ";".join(s)
+def project_group(params_obj, regions, fit_cache):
+    """The model of a group."""
+    return MultiRegionModel(params_obj, regions, fit_cache)
 
-def get_model_from_params(parameters, region_results):
-    p = get_model_params(parameters, region_results)
-    print(p)
-    params_obj = Parameters(**p)
-    m = penn_chime.models.SimSirModel(params_obj)
-    return m, p
+def group_model_cache(max_entries=GROUP_MODEL_CACHE_SIZE):
+    """project_group, simulating once for groups with equal inputs.
+
+    Made for one sweep, so its cache_info() counts that sweep's groups
+    and its models are dropped with it.
+    """
+    return functools.lru_cache(maxsize=max_entries)(project_group)
 
 def delete_old_errors():
     if os.path.exists(ERRORS_FILE):
@@ -15,6 +15,7 @@ BULK_LOAD_TEMPLATE = "CovidResultsBulkLoadTemplate.sql"
 BULK_LOAD_GENERATED = "CovidResultsBulkLoadGenerated.sql"
 
 VAR_NAME_CSV_PATH = "CSV_PATH"
+VAR_NAME_POLICY_CSV_PATH = "POLICY_CSV_PATH"
 
 def _connect(server: str, database: Optional[str] = None):
     connstr = (
@@ -36,7 +37,10 @@ def _get_paths():
 def _generate_sql_from_template(script_dir, full_output_path):
     with open(BULK_LOAD_TEMPLATE) as f:
         template_sql = f.read()
+    # The policy table is written beside the output (see policy_table_path).
+    policy_path = full_output_path.replace("_Combined_", "_Policies_")
     sql = template_sql.replace("${%s}" % VAR_NAME_CSV_PATH, full_output_path)
+    sql = sql.replace("${%s}" % VAR_NAME_POLICY_CSV_PATH, policy_path)
     with open(BULK_LOAD_GENERATED, "w") as f:
         f.write(sql)
     return sql
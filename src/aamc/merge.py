@@ -0,0 +1,135 @@
+#!/usr/bin/python3
+# vim: et ts=8 sts=4 sw=4
+
+from aamc import *
+
+import glob, json, os, os.path, shutil
+
+import pandas as pd
+
+# Buffer size for copying output files.
+MERGE_BUFFER_BYTES = 16 * 1024 * 1024
+# Rows of an output file read at a time when checking its groups.
+MERGE_CHUNK_ROWS = 500000
+
+def merge_csv(input_paths, output_path):
+    """Concatenate CSV files with the same header, writing the header once.
+
+    Files are copied in the order given, in large blocks rather than line
+    by line. An empty file (one with no groups written) is skipped.
+    """
+    header = None
+    with open(output_path, "w", newline="") as f_out:
+        for path in input_paths:
+            with open(path, "r", newline="") as f_in:
+                line = f_in.readline()
+                if not line:
+                    continue
+                if header is None:
+                    header = line
+                    f_out.write(header)
+                elif line != header:
+                    raise ValueError("Header of %s differs from the first file's" % path)
+                shutil.copyfileobj(f_in, f_out, MERGE_BUFFER_BYTES)
+
+def merge_policy_tables(input_paths, output_path):
+    """One policy table from several, each policy once, in id order.
+
+    Grid policy ids are the same in every part of a run (see
+    PolicyTable), so the tables agree wherever they overlap.
+    """
+    tables = [ pd.read_csv(path, dtype=str) for path in input_paths ]
+    merged = pd.concat(tables).drop_duplicates("policy_id")
+    merged = merged.iloc[merged["policy_id"].astype(int).argsort(kind="stable")]
+    merged.to_csv(output_path, index=False)
+
+def shard_manifest_path(output_file_path):
+    """The manifest written beside a shard's output file once it is complete."""
+    return os.path.splitext(output_file_path.replace("_Combined_", "_Shard_"))[0] + ".json"
+
+def write_shard_manifest(output_file_path, space, index, count):
+    """Record which groups of which sweep a shard's output holds."""
+    view = space.shard(index, count)
+    manifest = {
+        "shard": index,
+        "shards": count,
+        "space": space_fingerprint(space),
+        "group_size": space.group_size,
+        # The shard holds group ids first_group, first_group + group_size,
+        # ..., up to but not including stop_group.
+        "first_group": view.ids.start,
+        "stop_group": view.ids.stop,
+        "output": os.path.basename(output_file_path),
+    }
+    write_file_atomic(shard_manifest_path(output_file_path), json.dumps(manifest))
+
+def find_shard_manifests(output_dir, report_date):
+    """The manifests of the newest shard set for a report date, complete or not.
+
+    Shards belong to the same sweep when their space and shard count
+    match; the set of the most recently written manifest is chosen, and
+    for each shard its most recent manifest.
+    """
+    paths = glob.glob(os.path.join(
+        output_dir, "PennModelFit_Shard_%s_*.json" % report_date.isoformat()))
+    manifests = []
+    for path in sorted(paths, key=os.path.getmtime):
+        with open(path) as f:
+            manifest = json.load(f)
+        manifest["path"] = os.path.join(output_dir, manifest["output"])
+        manifests.append(manifest)
+    if not manifests:
+        return []
+    newest = manifests[-1]
+    by_shard = {}
+    for manifest in manifests:
+        if (manifest["space"], manifest["shards"]) == (newest["space"], newest["shards"]):
+            by_shard[manifest["shard"]] = manifest
+    return [ by_shard[i] for i in sorted(by_shard) ]
+
+def check_shards(manifests):
+    """Raise ValueError unless the shards cover their sweep exactly once.
+
+    The manifests must be those of shards 1 to N of one sweep, their group
+    ranges must follow on from each other and cover all of its groups,
+    and each shard's output must hold exactly the groups of its range.
+    """
+    if not manifests:
+        raise ValueError("No shards found")
+    count = manifests[0]["shards"]
+    missing = sorted(set(range(1, count + 1)) - set(m["shard"] for m in manifests))
+    if missing:
+        raise ValueError("Missing shards %s of %d" % (", ".join(map(str, missing)), count))
+    group_size = manifests[0]["group_size"]
+    total = manifests[0]["space"]["parameter_sets"]
+    next_group = 1
+    for manifest in manifests:
+        if manifest["first_group"] != next_group:
+            raise ValueError("Shard %d does not start at group %d" % (
+                manifest["shard"], next_group))
+        next_group = manifest["stop_group"]
+        expected = range(manifest["first_group"], manifest["stop_group"], group_size)
+        found = output_group_ids(manifest["path"])
+        if found != set(expected):
+            raise ValueError("%s holds %d groups, not the %d of its shard" % (
+                manifest["path"], len(found), len(expected)))
+    if next_group != total + 1:
+        raise ValueError("Shards end before the last group")
+
+def output_group_ids(output_file_path):
+    """The group_param_set_ids in an output file, read a column at a time."""
+    group_ids = set()
+    if os.path.getsize(output_file_path) == 0:
+        return group_ids
+    for chunk in pd.read_csv(
+            output_file_path, usecols=["group_param_set_id"], chunksize=MERGE_CHUNK_ROWS):
+        group_ids.update(chunk["group_param_set_id"].unique().tolist())
+    return group_ids
+
+def merge_shards(manifests, output_file_path):
+    """Check a shard set with check_shards and merge it, in group order."""
+    check_shards(manifests)
+    paths = [ m["path"] for m in manifests ]
+    merge_csv(paths, output_file_path)
+    merge_policy_tables(
+        [ policy_table_path(p) for p in paths ], policy_table_path(output_file_path))
@@ -5,9 +5,103 @@ import datetime
 import sys, json, re, os, os.path, shutil
 import logging, configparser
 import functools, itertools, traceback, hashlib
+import queue, threading
+
+import pandas as pd
 
 def concat_dataframes(dataframes):
-    return functools.reduce(lambda a, b: a.append(b), dataframes)
+    """Concatenate frames in one pass, keeping their indexes.
+
+    Columns whose dtypes differ between frames are upcast to a common
+    dtype, as DataFrame.append did.
+    """
+    return pd.concat(list(dataframes), sort=False)
+
+def common_dtypes(dataframes):
+    """The column dtypes concat_dataframes would give these frames."""
+    return concat_dataframes([ df.iloc[:0] for df in dataframes ]).dtypes
+
+def write_dataframes(dataframes, output_file, header=True):
+    """Write frames to a CSV sink one after another.
+
+    The output is the same as writing concat_dataframes(dataframes), but no
+    combined frame is built. Only the first frame writes the header.
+    """
+    dataframes = list(dataframes)
+    if isinstance(output_file, BackgroundWriter):
+        output_file.submit(dataframes, header)
+        return
+    dtypes = common_dtypes(dataframes)
+    for i, df in enumerate(dataframes):
+        if list(df.columns) != list(dtypes.index):
+            raise ValueError("Frames written together must have the same columns")
+        df.astype(dtypes, copy=False).to_csv(output_file, header=(header and i == 0))
+
+# Batches of frames a BackgroundWriter holds before write_dataframes waits.
+WRITER_PENDING_BATCHES = 32
+
+class BackgroundWriter:
+    """A CSV sink for write_dataframes that writes on a thread of its own.
+
+    Frames are formatted and written to output_file, in the order given,
+    by a writer thread, so the caller goes on to its next group while the
+    last one is written. At most max_pending batches wait to be written;
+    beyond that write_dataframes waits (backpressure), which bounds the
+    memory held when the disk or share is slower than the fits.
+
+    Use it as a context manager: on leaving, normally or by an exception,
+    the batches already given are written before the thread stops. An
+    error in the writer is raised by the next write_dataframes or on
+    leaving. Frames must not be changed once given to it.
+    """
+
+    _CLOSE = object()
+
+    def __init__(self, output_file, max_pending=WRITER_PENDING_BATCHES):
+        self.output_file = output_file
+        self.pending = queue.Queue(max_pending)
+        self.error = None
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close(raise_error=exc_type is None)
+        if exc_type is not None and self.error is not None and self.error is not exc_value:
+            logging.getLogger(__name__).error("Output writer failed: %r", self.error)
+
+    def submit(self, dataframes, header):
+        self._raise_error()
+        self.pending.put((dataframes, header))
+
+    def close(self, raise_error=True):
+        """Write what is pending and stop the writer thread."""
+        if self.thread.is_alive():
+            self.pending.put(self._CLOSE)
+            self.thread.join()
+        if raise_error:
+            self._raise_error()
+
+    def _raise_error(self):
+        if self.error is not None:
+            raise self.error
+
+    def _run(self):
+        while True:
+            item = self.pending.get()
+            if item is self._CLOSE:
+                return
+            # After an error, keep taking batches so the caller never waits
+            # on a full queue, but write none: the error stops the caller at
+            # its next write.
+            if self.error is None:
+                dataframes, header = item
+                try:
+                    write_dataframes(dataframes, self.output_file, header)
+                except Exception as e:
+                    self.error = e
 
 def md5(obj, truncate_to_length: int = 0):
     s = str(obj)
@@ -0,0 +1,161 @@
+#!/usr/bin/python3
+# vim: et ts=8 sts=4 sw=4
+
+from aamc import *
+
+from penn_chime.parameters import Disposition
+
+import numpy as np
+import pandas as pd
+from scipy.optimize import minimize
+
+# Default number of model groups the optimizer may evaluate per search.
+OPTIMIZER_MAX_EVALUATIONS = 200
+# Rates are rounded to this many digits, matching the future stage rates.
+OPTIMIZER_RATE_DIGITS = 4
+# Neighborhood sampling for uncertainty bands: the spread of the random
+# perturbation of each variable, and how much worse than the best MSE a
+# sample may be and still count as a plausible fit.
+BAND_SAMPLE_SIGMA = 0.005
+BAND_MSE_TOLERANCE = 0.25
+BAND_PERCENTILES = [ 5, 50, 95 ]
+
+class Candidate:
+    """A point in the continuous fitting space.
+
+    rates holds one relative contact rate per past mitigation stage;
+    hospitalized is the hospitalized Disposition to use.
+    """
+
+    def __init__(self, rates, hospitalized):
+        self.rates = tuple(rates)
+        self.hospitalized = hospitalized
+
+    def key(self):
+        return self.rates + tuple(self.hospitalized)
+
+    def __repr__(self):
+        return "Candidate(%s, %s)" % (self.rates, self.hospitalized)
+
+class OptimizerVariables:
+    """Maps optimizer vectors to Candidates and back.
+
+    The vector holds the past stage rates, then, when fit_hospitalized is
+    set, the hospitalized rate and length of stay. Rates are bounded to
+    [0, 1]; the length of stay is rounded to whole days, as the census
+    calculation requires.
+    """
+
+    def __init__(self, start, fit_hospitalized=False):
+        self.start = start
+        self.fit_hospitalized = fit_hospitalized
+
+    def initial(self):
+        x = list(self.start.rates)
+        if self.fit_hospitalized:
+            x += [ self.start.hospitalized.rate, self.start.hospitalized.days ]
+        return np.array(x, dtype=float)
+
+    def initial_simplex(self):
+        # The default simplex (5% of each value) is too small to move the
+        # length of stay off its rounded value, so use explicit steps.
+        x0 = self.initial()
+        steps = [ 0.05 ] * len(self.start.rates)
+        if self.fit_hospitalized:
+            steps += [ 0.25 * self.start.hospitalized.rate, 2.0 ]
+        simplex = [ x0 ]
+        for i, step in enumerate(steps):
+            x = x0.copy()
+            x[i] = x[i] + step if x[i] + step <= self.bounds()[i][1] else x[i] - step
+            simplex.append(x)
+        return np.array(simplex)
+
+    def bounds(self):
+        bounds = [ (0.0, 1.0) ] * len(self.start.rates)
+        if self.fit_hospitalized:
+            bounds += [ (1e-4, 1.0), (1.0, 30.0) ]
+        return bounds
+
+    def candidate(self, x):
+        x = np.clip(x, *np.array(self.bounds()).T)
+        stage_count = len(self.start.rates)
+        rates = [ round(float(r), OPTIMIZER_RATE_DIGITS) for r in x[:stage_count] ]
+        if self.fit_hospitalized:
+            hospitalized = Disposition(
+                round(float(x[stage_count]), OPTIMIZER_RATE_DIGITS),
+                int(round(x[stage_count + 1])))
+        else:
+            hospitalized = self.start.hospitalized
+        return Candidate(rates, hospitalized)
+
+def optimize_candidate(
+    start, evaluate,
+    max_evaluations=OPTIMIZER_MAX_EVALUATIONS, fit_hospitalized=False,
+):
+    """Minimize evaluate(Candidate) with Nelder-Mead from a start Candidate.
+
+    Candidates that round to the same point are evaluated once. Returns
+    (best candidate, best MSE, scores by candidate key).
+    """
+    variables = OptimizerVariables(start, fit_hospitalized)
+    scores = {}
+    best = [ None, float("inf") ]
+
+    def objective(x):
+        candidate = variables.candidate(x)
+        key = candidate.key()
+        if key not in scores:
+            scores[key] = evaluate(candidate)
+            if scores[key] < best[1]:
+                best[:] = [ candidate, scores[key] ]
+        return scores[key]
+
+    minimize(
+        objective, variables.initial(), method="Nelder-Mead",
+        bounds=variables.bounds(),
+        options={
+            "maxfev": max_evaluations,
+            "xatol": 10 ** -OPTIMIZER_RATE_DIGITS,
+            "initial_simplex": variables.initial_simplex(),
+        },
+    )
+    return best[0], best[1], scores
+
+def sample_neighborhood(
+    best, best_mse, evaluate, samples,
+    fit_hospitalized=False, sigma=BAND_SAMPLE_SIGMA,
+    tolerance=BAND_MSE_TOLERANCE, seed=0,
+):
+    """Perturb the best candidate and keep the samples that still fit.
+
+    evaluate(Candidate) returns (mse, result). Returns the results of the
+    samples whose MSE is within tolerance of best_mse.
+    """
+    variables = OptimizerVariables(best, fit_hospitalized)
+    x0 = variables.initial()
+    scale = np.full(len(x0), sigma)
+    if fit_hospitalized:
+        scale[-2] = sigma * best.hospitalized.rate
+        scale[-1] = 1.0
+    rng = np.random.default_rng(seed)
+    accepted = []
+    for _ in range(samples):
+        candidate = variables.candidate(x0 + rng.normal(0.0, scale))
+        mse, result = evaluate(candidate)
+        if mse <= best_mse * (1.0 + tolerance):
+            accepted.append(result)
+    return accepted
+
+def percentile_bands(samples_df, keys, columns, percentiles=BAND_PERCENTILES):
+    """Per-key percentiles of columns across samples.
+
+    samples_df holds one row per sample and key (e.g. region and date).
+    Returns one row per key with a "<column>_p<percentile>" column for each
+    column and percentile.
+    """
+    grouped = samples_df.groupby(keys)
+    bands = {
+        "%s_p%d" % (c, q): grouped[c].quantile(q / 100.0)
+        for c in columns for q in percentiles
+    }
+    return pd.DataFrame(bands).reset_index()
@@ -4,11 +4,23 @@
 from aamc import interpolate_dates
 from aamc import *
 
-from penn_chime.parameters import Parameters, Disposition, Regions
+from penn_chime.parameters import Parameters, Disposition, Regions, validate_parameter
 
 import datetime
 import sys, json, re, os, os.path
 import functools, itertools, traceback, hashlib
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_LATIN_HYPERCUBE = "lhs"
+SAMPLE_SOBOL = "sobol"
+SAMPLE_METHODS = [ SAMPLE_LATIN_HYPERCUBE, SAMPLE_SOBOL ]
+SAMPLE_SEED = 0
+# Sampled rates are rounded to this many digits, like the future stage rates.
+SAMPLE_RATE_DIGITS = 4
 
 _future_divergence_group_size = None
 _region_count = None
@@ -24,6 +36,159 @@ def get_future_divergence_set_size():
 def _percent_range(lo_bound, hi_bound, step):
     return [ r/100.0 for r in range(lo_bound, hi_bound + 1, step) ]
 
+class MitigationPolicySpace:
+    """Lazily decoded list of mitigation policies.
+
+    Policy ``i`` is a combination of one rate per past stage (the last past
+    stage being last week's rate) followed, when future divergence is used,
+    by one of the future stage tuples that ``future_stages(last_week_rate)``
+    returns. Each policy is a list of ``(date, rate)`` pairs, in the same
+    order that the former ``itertools.product`` listing produced them.
+    """
+
+    def __init__(self, dates, past_rates, future_stages=None):
+        self.dates = list(dates)
+        self.past_rates = [ list(r) for r in past_rates ]
+        self.future_stages = future_stages
+        self.past_sizes = [ len(r) for r in self.past_rates ]
+        self.past_count = 1
+        for size in self.past_sizes:
+            self.past_count *= size
+        if future_stages is None:
+            self.future_count = 1
+        else:
+            counts = set(len(future_stages(r)) for r in self.past_rates[-1])
+            assert len(counts) == 1, "Future stage counts must not vary."
+            self.future_count = counts.pop()
+
+    def __len__(self):
+        return self.past_count * self.future_count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [ self[i] for i in range(*index.indices(len(self))) ]
+        return list(zip(self.dates, self.combination(index)))
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def past_coordinates(self, index):
+        """Per-stage rate indices of the past part of policy ``index``."""
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("Policy index out of range: %d" % index)
+        past_index = index // self.future_count
+        coords = []
+        for size in reversed(self.past_sizes):
+            coords.insert(0, past_index % size)
+            past_index //= size
+        return coords
+
+    def index_at(self, past_coordinates, future_index=0):
+        """Inverse of past_coordinates: the policy index for given rate indices."""
+        past_index = 0
+        for size, i in zip(self.past_sizes, past_coordinates):
+            past_index = past_index * size + i
+        return past_index * self.future_count + future_index
+
+    def combination(self, index):
+        """The rates (without dates) of policy ``index``."""
+        if index < 0:
+            index += len(self)
+        past = tuple(
+            rates[i] for rates, i
+            in zip(self.past_rates, self.past_coordinates(index)))
+        if self.future_stages is None:
+            return past
+        future = self.future_stages(past[-1])[index % self.future_count]
+        return past + future
+
+    def first_index(self, index):
+        """The index of the first policy equal to policy ``index``.
+
+        Future stage tuples may repeat (e.g. two transforms giving the same
+        rates); their policies are the same policy.
+        """
+        if index < 0:
+            index += len(self)
+        if self.future_stages is None:
+            return index
+        future_index = index % self.future_count
+        last_week_rate = self.combination(index)[len(self.past_rates) - 1]
+        future = self.future_stages(last_week_rate)
+        return index - future_index + future.index(future[future_index])
+
+    def policy(self, past_rates, future_index=0):
+        """The policy for arbitrary past stage rates, which need not be on the grid."""
+        past = tuple(past_rates)
+        assert len(past) == len(self.past_rates)
+        if self.future_stages is not None:
+            past = past + self.future_stages(past[-1])[future_index]
+        return list(zip(self.dates, past))
+
+class SampledPolicies:
+    """The policy axis of a SampledParamSpace.
+
+    samples holds one tuple of past stage rates per sample. Policy ``i``
+    is sample ``i // future_count`` followed, when future divergence is
+    used, by future variant ``i % future_count``, as in a
+    MitigationPolicySpace.
+    """
+
+    def __init__(self, dates, samples, future_stages=None):
+        self.dates = list(dates)
+        self.samples = [ tuple(rates) for rates in samples ]
+        self.future_stages = future_stages
+        self.future_count = 1
+        if future_stages is not None:
+            self.future_count = len(future_stages(self.samples[0][-1]))
+
+    def __len__(self):
+        return len(self.samples) * self.future_count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [ self[i] for i in range(*index.indices(len(self))) ]
+        return list(zip(self.dates, self.combination(index)))
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def combination(self, index):
+        past = self.samples[index // self.future_count]
+        if self.future_stages is None:
+            return past
+        return past + self.future_stages(past[-1])[index % self.future_count]
+
+    def first_index(self, index):
+        """As MitigationPolicySpace.first_index."""
+        if self.future_stages is None:
+            return index
+        future_index = index % self.future_count
+        future = self.future_stages(self.samples[index // self.future_count][-1])
+        return index - future_index + future.index(future[future_index])
+
+def canonical_policy(mitigation_stages, ramp_days=0):
+    """The mitigation stages with each stage that repeats the rate before
+    it dropped, where that changes nothing.
+
+    Without a ramp (ramp_days of 0 or 1) a repeated rate never changes the
+    betas, so policies that differ only by such stages, like the "hold
+    last week's rate" future variants, project identically. With a ramp,
+    a stage starts its ramp from the beta of the day before it, which is
+    mid-ramp until ramp_days after the stage before it began; so a stage
+    is only dropped once that ramp has finished.
+    """
+    canonical = []
+    for (d, r) in mitigation_stages:
+        if not canonical or canonical[-1][1] != r or (
+                ramp_days > 1 and (d - canonical[-1][0]).days < ramp_days):
+            canonical.append((d, r))
+    return canonical
+
 def get_varying_params(report_date, interpolated_days_count: int, use_future_divergence: bool):
 
     fixed_dates = [
@@ -69,33 +234,18 @@ def get_varying_params(report_date, interpolated_days_count: int, use_future_div
     global _future_divergence_group_size
     _future_divergence_group_size = len(future_divergence_transforms)
 
-    future_stages = {}
-    for last_week_rate in last_week_rates:
+    def future_stages(last_week_rate):
         fs = []
         fs.append((last_week_rate, ))
         for fdt in future_divergence_transforms:
             fs.append(fdt(last_week_rate))
-        fs = [ tuple( round(r, 4) for r in rs ) for rs in fs ]
-        future_stages[last_week_rate] = fs
-
-    past_combinations = list(itertools.product(*[ r for (d, r) in past_stages ]))
+        return [ tuple( round(r, 4) for r in rs ) for rs in fs ]
 
     # It's useful to print these when debugging, but for real runs they get too
     # large for us to want to print them.
     #print(list( r for (d, r) in past_stages ))
-    #print(past_combinations)
     #print(future_stages)
 
-    if not use_future_divergence:
-        combinations = list(past_combinations)
-    else:
-        combinations = []
-        for pc in past_combinations:
-            last_week_rate = pc[-1]
-            for fs in future_stages[last_week_rate]:
-                combined = pc + fs
-                combinations.append(combined)
-
     dates = [ d for (d, r) in past_stages ]
     if use_future_divergence:
         dates = dates + [
@@ -106,10 +256,10 @@ def get_varying_params(report_date, interpolated_days_count: int, use_future_div
         if not (d1 < d2):
             raise AssertionError("Dates not in order:", d1, d2)
 
-    mitigation_stages = [
-        list(zip(dates, combo))
-        for combo in combinations
-    ]
+    mitigation_stages = MitigationPolicySpace(
+        dates,
+        [ r for (d, r) in past_stages ],
+        future_stages if use_future_divergence else None)
 
     return {
 
@@ -225,6 +375,275 @@ BASE_PARAMS = {
     "icu_days": 10,
 }
 
+PARAM_SPACE_AXES = [
+    "relative_contact_rate", "doubling_time", "mitigation_date",
+    "hospitalized", "relative_icu_rate", "relative_vent_rate",
+    "end_date_days_back", "mitigation_stages", "region",
+]
+
+_POLICY_AXIS = PARAM_SPACE_AXES.index("mitigation_stages")
+_DISPOSITION_AXES = [
+    PARAM_SPACE_AXES.index(name)
+    for name in ("hospitalized", "relative_icu_rate", "relative_vent_rate") ]
+
+class ParamSpace:
+    """Indexed grid of parameter permutations, decoded lazily.
+
+    Permutation number ``param_set_id`` (1-based, as written to the output)
+    is decoded on access from the per-axis value lists, so the grid is
+    never materialized. Values shared by every permutation, such as
+    ``hosp_census_lookback`` in ``base_params``, are stored once.
+
+    Regions are the innermost axis, so each run of ``group_size``
+    consecutive ids is one group whose regions are fitted together.
+    Slicing returns a view over a sub-range of ids, which is how a sweep
+    is split into shards.
+    """
+
+    def __init__(
+        self,
+        use_doubling_time,
+        base_params, regions, doubling_times,
+        relative_contact_rates, mitigation_dates,
+        hospitalized, icu_rate, vent_rate,
+        end_date_days_back,
+        mitigation_stages,
+    ):
+        self.use_doubling_time = use_doubling_time
+        self.base_params = base_params
+        self.regions = list(regions)
+        # Axis order matches the argument order of _combine_params.
+        if use_doubling_time:
+            self.axes = [
+                list(relative_contact_rates), list(doubling_times),
+                [0], list(hospitalized), list(icu_rate), list(vent_rate),
+                list(end_date_days_back),
+                mitigation_stages,
+                self.regions,
+            ]
+        else:
+            self.axes = [
+                list(relative_contact_rates), [0],
+                [datetime.date(2000, 1, 1)], list(hospitalized),
+                list(icu_rate), list(vent_rate),
+                list(end_date_days_back),
+                mitigation_stages,
+                self.regions,
+            ]
+        self._set_axis_sizes([ len(a) for a in self.axes ])
+
+    def _set_axis_sizes(self, axis_sizes):
+        self.axis_sizes = list(axis_sizes)
+        self.strides = []
+        stride = 1
+        for size in reversed(self.axis_sizes):
+            self.strides.insert(0, stride)
+            stride *= size
+        self.total = stride
+        self.ids = range(1, stride + 1)
+
+    @property
+    def group_size(self):
+        return len(self.regions)
+
+    @property
+    def group_count(self):
+        return len(self.ids) // self.group_size
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            view = object.__new__(type(self))
+            view.__dict__.update(self.__dict__)
+            view.ids = self.ids[key]
+            return view
+        return self.get(self.ids[key])
+
+    def __iter__(self):
+        for param_set_id in self.ids:
+            yield self.get(param_set_id)
+
+    def coordinates(self, param_set_id):
+        """Per-axis value indices of a permutation."""
+        if not 1 <= param_set_id <= self.total:
+            raise IndexError("param_set_id out of range: %d" % param_set_id)
+        index = param_set_id - 1
+        return [ (index // stride) % size
+                 for stride, size in zip(self.strides, self.axis_sizes) ]
+
+    def param_set_id_at(self, coordinates):
+        """Inverse of coordinates: the param_set_id for given axis indices."""
+        return 1 + sum(i * stride for i, stride in zip(coordinates, self.strides))
+
+    def get(self, param_set_id):
+        """Decode the parameter dict for one permutation."""
+        coordinates = self.coordinates(param_set_id)
+        combo = [ axis[i] for axis, i in zip(self.axes, coordinates) ]
+        p = _combine_params(
+            self.use_doubling_time, param_set_id, self.base_params, *combo)
+        p["policy_id"] = self.policy_id(coordinates[_POLICY_AXIS])
+        return p
+
+    def policy_id(self, policy_index):
+        """The id written for the policy at ``policy_index`` of the policy axis.
+
+        Ids are 1-based, and equal policies share the id of the first.
+        """
+        policies = self.axes[_POLICY_AXIS]
+        if isinstance(policies, MitigationPolicySpace):
+            return policies.first_index(policy_index) + 1
+        return policies.index(policies[policy_index]) + 1
+
+    def group_ids(self):
+        """The ``group_param_set_id`` of every group in this view."""
+        first = self.ids[0] if len(self.ids) else 1
+        assert (first - 1) % self.group_size == 0, "View is not group-aligned."
+        assert len(self.ids) % self.group_size == 0, "View is not group-aligned."
+        return self.ids[::self.group_size]
+
+    def group(self, group_param_set_id):
+        """Parameter dicts for every region of one group."""
+        return [ self.get(group_param_set_id + i) for i in range(self.group_size) ]
+
+    def iter_groups(self):
+        for group_param_set_id in self.group_ids():
+            yield self.group(group_param_set_id)
+
+    def disposition_inputs(self):
+        """The (hospitalized, relative_icu_rate, relative_vent_rate) the space uses."""
+        return itertools.product(*[ self.axes[i] for i in _DISPOSITION_AXES ])
+
+    def shard(self, index, count):
+        """Shard index (1-based) of count: a contiguous, group-aligned view.
+
+        Every group is in exactly one shard, and the shards, in order,
+        cover the groups in id order.
+        """
+        if not 1 <= index <= count:
+            raise IndexError("Shard %d of %d" % (index, count))
+        first = (index - 1) * self.group_count // count
+        stop = index * self.group_count // count
+        return self[first * self.group_size:stop * self.group_size]
+
+    def describe(self):
+        return ", ".join(
+            "%s=%d" % (n, s) for n, s in zip(PARAM_SPACE_AXES, self.axis_sizes))
+
+class SampledParamSpace(ParamSpace):
+    """A space-filling sample of parameter sets, in place of a grid.
+
+    Each sample is one point drawn, by Latin hypercube or scrambled Sobol
+    sequence, from the ranges of the per-stage contact rates, the
+    hospitalized rate and length of stay, and the relative ICU and
+    ventilated rates. The samples take the place of the policy axis
+    (see SampledPolicies), and get() fills in each sample's own
+    hospitalized, relative_icu_rate and relative_vent_rate. The other
+    axes, regions innermost, are crossed with the samples as in the grid,
+    so the sweep consumes the same parameter dicts and groups.
+
+    hospitalized, icu_rate and vent_rate hold one value per sample.
+    """
+
+    def __init__(
+        self,
+        use_doubling_time,
+        base_params, regions, doubling_times,
+        relative_contact_rates, mitigation_dates,
+        hospitalized, icu_rate, vent_rate,
+        end_date_days_back,
+        mitigation_stages,
+    ):
+        super().__init__(
+            use_doubling_time,
+            base_params, regions, doubling_times,
+            relative_contact_rates, mitigation_dates,
+            hospitalized, icu_rate, vent_rate,
+            end_date_days_back,
+            mitigation_stages,
+        )
+        self._set_axis_sizes([
+            1 if i in _DISPOSITION_AXES else size
+            for i, size in enumerate(self.axis_sizes) ])
+
+    @classmethod
+    def from_grid(cls, space, size, method=SAMPLE_LATIN_HYPERCUBE, seed=SAMPLE_SEED):
+        """size samples over the ranges the axes of a grid ParamSpace span."""
+        policies = space.axes[_POLICY_AXIS]
+        hospitalized, icu_rates, vent_rates = \
+            [ space.axes[i] for i in _DISPOSITION_AXES ]
+        ranges = [ (min(rates), max(rates)) for rates in policies.past_rates ] + [
+            (min(h.rate for h in hospitalized), max(h.rate for h in hospitalized)),
+            (min(h.days for h in hospitalized), max(h.days for h in hospitalized) + 1),
+            (min(icu_rates), max(icu_rates)),
+            (min(vent_rates), max(vent_rates)),
+        ]
+        lo, hi = np.array(ranges, dtype=float).T
+        x = lo + sample_unit_cube(method, len(ranges), size, seed) * (hi - lo)
+        stage_count = len(policies.past_rates)
+        x = np.round(x, SAMPLE_RATE_DIGITS)
+        days = np.minimum(np.floor(x[:, stage_count + 1]), hi[stage_count + 1] - 1)
+        samples = SampledPolicies(
+            policies.dates,
+            [ [ float(r) for r in row ] for row in x[:, :stage_count] ],
+            policies.future_stages)
+        return cls(
+            space.use_doubling_time,
+            space.base_params, space.regions,
+            space.axes[1], space.axes[0], space.axes[2],
+            [ Disposition(float(rate), int(d))
+              for rate, d in zip(x[:, stage_count], days) ],
+            [ float(r) for r in x[:, stage_count + 2] ],
+            [ float(r) for r in x[:, stage_count + 3] ],
+            space.axes[6], samples)
+
+    @property
+    def sample_count(self):
+        return len(self.axes[_POLICY_AXIS].samples)
+
+    def get(self, param_set_id):
+        p = super().get(param_set_id)
+        policies = self.axes[_POLICY_AXIS]
+        sample = self.coordinates(param_set_id)[_POLICY_AXIS] // policies.future_count
+        for i in _DISPOSITION_AXES:
+            p[PARAM_SPACE_AXES[i]] = self.axes[i][sample]
+        return p
+
+    def policy_id(self, policy_index):
+        return self.axes[_POLICY_AXIS].first_index(policy_index) + 1
+
+    def disposition_inputs(self):
+        return zip(*[ self.axes[i] for i in _DISPOSITION_AXES ])
+
+    def describe(self):
+        return super().describe() + ", samples=%d" % self.sample_count
+
+def sample_unit_cube(method, dimensions, size, seed=SAMPLE_SEED):
+    """size points in the unit hypercube, by Latin hypercube or Sobol sequence.
+
+    A Sobol sample is best balanced when size is a power of two.
+    """
+    from scipy.stats import qmc
+
+    if method == SAMPLE_LATIN_HYPERCUBE:
+        sampler = qmc.LatinHypercube(dimensions, seed=seed)
+    elif method == SAMPLE_SOBOL:
+        sampler = qmc.Sobol(dimensions, seed=seed)
+    else:
+        raise ValueError("Unknown sampling method: %s" % method)
+    return sampler.random(size)
+
+def space_fingerprint(space):
+    """What must match for separate processes to share one sweep."""
+    return {
+        "report_date": space.base_params["current_date"].isoformat(),
+        "axes": space.describe(),
+        "parameter_sets": len(space),
+        "hosp_census_lookback": [
+            float(x) for x in space.base_params["hosp_census_lookback"] ],
+    }
+
 def generate_param_permutations(
     use_doubling_time,
     base_params, regions, doubling_times,
@@ -233,37 +652,18 @@ def generate_param_permutations(
     end_date_days_back,
     mitigation_stages,
 ):
-    param_set_id = 0
-    #params = []
     # Important: regions must be the innermost loop because we compile
     # results from all regions on each iteration.
-    #for dt in doubling_times:
-    if use_doubling_time:
-        combinations = itertools.product(
-            relative_contact_rates,
-            doubling_times,
-            [0], hospitalized, icu_rate, vent_rate,
-            end_date_days_back,
-            mitigation_stages,
-            regions, )
-    else:
-        combinations = itertools.product(
-            relative_contact_rates,
-            [0],
-            [datetime.date(2000, 1, 1)], hospitalized, icu_rate, vent_rate,
-            end_date_days_back,
-            mitigation_stages,
-            regions, )
-    combo_count = 0
-    for combo in combinations:
-        combo_count = combo_count + 1
-        param_set_id = param_set_id + 1
-        # None takes the place of dt (doubling time)
-        p = _combine_params(use_doubling_time, param_set_id, base_params, *combo)
-        #params.append(p)
-        yield p
-    print("Number of parameter combinations:", combo_count)
-    #return params
+    space = ParamSpace(
+        use_doubling_time,
+        base_params, regions, doubling_times,
+        relative_contact_rates, mitigation_dates,
+        hospitalized, icu_rate, vent_rate,
+        end_date_days_back,
+        mitigation_stages,
+    )
+    yield from space
+    logger.info("Number of parameter combinations: %d", len(space))
 
 def _combine_params(
     use_doubling_time,
@@ -296,7 +696,6 @@ def _lists_equal(a, b):
     b = list(b)
     for ai in range(len(a)):
         for bi in range(len(b)):
-            print(ai, bi)
             ax = a[ai]
             bx = b[bi]
             if a[ai] == b[bi]:
@@ -306,48 +705,151 @@ def _lists_equal(a, b):
             raise ValueError("Unmatched index: %d" % ai)
     return True
 
-def get_model_params(parameters, region_results):
-    print("PARAMETERS PRINT", parameters)
-    p = { **parameters }
-    del p["param_set_id"]
-    days_back = p["end_date_days_back"]
-    del p["end_date_days_back"]
-    p["current_date"] = \
-        p["current_date"] - datetime.timedelta(days=days_back)
-    p["region"] = Regions(**{ p["region_name"]: p["population"] })
-    #print(p["hosp_census_lookback"])
-    derived_from = p.get("region_derived_from")
-    if derived_from:
-        _derived_region_setup(p, derived_from, region_results)
+# Keys of a permutation that are resolved by get_model_params or only used
+# for bookkeeping; they are not passed on to Parameters. Keys starting with
+# "region_" (region_name, etc.) are dropped too.
+_NON_MODEL_KEYS = frozenset([
+    "param_set_id", "policy_id", "end_date_days_back", "hosp_census_lookback",
+    "hosp_pop_share", "exclude_pop_from_total",
+    "relative_icu_rate", "relative_vent_rate", "icu_days",
+])
+
+class RegionTable:
+    """Per-run region constants, resolved once for the whole sweep.
+
+    A struct of arrays: names, populations, the Regions objects passed to
+    the model and, per end_date_days_back value, the current date and each
+    region's current_hospitalized. Derived regions are scaled from their
+    base region's current_hospitalized here, so a region no longer needs
+    the results of the regions fitted before it.
+
+    scaled_from gives, for each derived region that might be projected by
+    scaling, its (base region name, scale); None for every other region.
+    A derived region with a population of its own has to be simulated.
+    One with its base's population is passed to MultiRegionModel as
+    derived, which scales the base's projection only where the two would
+    be simulated identically (same seed and fit) and simulates it
+    otherwise; the model seeds a region by its market share, so a derived
+    region's patient counts are not simply its base's scaled.
+
+    The ICU and ventilated Dispositions depend on the hospitalized rate,
+    which the optimizer varies off the grid, so they are memoized as they
+    are first requested rather than precomputed.
+    """
+
+    def __init__(self, regions, current_date, hosp_census_lookback, end_date_days_back):
+        self.names = [ r["region_name"] for r in regions ]
+        self.region_index = { name: i for i, name in enumerate(self.names) }
+        self.populations = [ r["population"] for r in regions ]
+        self.regions = [
+            Regions(**{ name: population })
+            for name, population in zip(self.names, self.populations) ]
+        self.scaled_from = []
+        for r, population in zip(regions, self.populations):
+            derived_from = r.get("region_derived_from")
+            if (derived_from and
+                    self.populations[self.region_index[derived_from]] == population):
+                self.scaled_from.append((derived_from, r["region_derived_scale"]))
+            else:
+                self.scaled_from.append(None)
+        self.days_back = list(end_date_days_back)
+        self.days_back_index = { db: i for i, db in enumerate(self.days_back) }
+        self.current_dates = [
+            current_date - datetime.timedelta(days=db) for db in self.days_back ]
+        self.current_hospitalized = []
+        for db in self.days_back:
+            row = []
+            for r in regions:
+                derived_from = r.get("region_derived_from")
+                if derived_from:
+                    base_curr_hosp = row[self.region_index[derived_from]]
+                    row.append(round(r["region_derived_scale"] * base_curr_hosp))
+                else:
+                    curr_hosp = hosp_census_lookback[db]
+                    row.append(round(curr_hosp * r["region_patient_share"]))
+            self.current_hospitalized.append(row)
+        self._dispositions = {}
+
+    @classmethod
+    def from_space(cls, space, backtest_horizons=()):
+        """The table for a space, also covering any backtest horizons."""
+        days_back = list(space.axes[PARAM_SPACE_AXES.index("end_date_days_back")])
+        days_back += [ h for h in backtest_horizons if h not in days_back ]
+        return cls(
+            space.regions,
+            space.base_params["current_date"],
+            space.base_params["hosp_census_lookback"],
+            days_back)
+
+    def dispositions(self, hospitalized, relative_icu_rate, relative_vent_rate, icu_days):
+        """The (icu, ventilated) Dispositions for a hospitalized Disposition."""
+        key = (hospitalized.rate, relative_icu_rate, relative_vent_rate, icu_days)
+        if key not in self._dispositions:
+            icu_rate = round(relative_icu_rate * hospitalized.rate, 4)
+            vent_rate = round(relative_vent_rate * icu_rate, 4)
+            self._dispositions[key] = (
+                Disposition(icu_rate, icu_days), Disposition(vent_rate, icu_days))
+        return self._dispositions[key]
+
+def validate_param_space(space, region_table):
+    """Run the Parameters validators over every value a sweep can use.
+
+    Each distinct value of each axis is checked once, so the model
+    parameters of every permutation can then be built with
+    Parameters.from_validated. Raises ValueError like Parameters does.
+    """
+    base = { k: v for k, v in space.base_params.items()
+             if k not in _NON_MODEL_KEYS and k != "current_date" }
+    for key, value in base.items():
+        validate_parameter(key, value)
+    for r in space.regions:
+        validate_parameter("population", r["population"])
+        validate_parameter("market_share", r["market_share"])
+    for name, axis in zip(PARAM_SPACE_AXES, space.axes):
+        if name in ("relative_contact_rate", "hospitalized", "mitigation_date"):
+            for value in axis:
+                validate_parameter(name, value)
+        elif name == "doubling_time" and space.use_doubling_time:
+            for value in axis:
+                validate_parameter(name, value)
+    policies = space.axes[PARAM_SPACE_AXES.index("mitigation_stages")]
+    if isinstance(policies, MitigationPolicySpace):
+        # Validate the stages a policy is built from, not every combination.
+        validate_parameter("mitigation_stages", [ (d, 0.0) for d in policies.dates ])
+        date = policies.dates[0]
+        for rates in policies.past_rates:
+            validate_parameter("mitigation_stages", [ (date, r) for r in rates ])
+        if policies.future_stages is not None:
+            for rate in policies.past_rates[-1]:
+                for stage in policies.future_stages(rate):
+                    validate_parameter("mitigation_stages", [ (date, r) for r in stage ])
     else:
-        _base_region_setup(p, days_back)
-    del p["hosp_census_lookback"]
-    for k in list(p): # convert keys to list so we don't modify p while iterating
-        if k.startswith("region_"):
-            del p[k] # delete region_name, etc.
-    del p["hosp_pop_share"]
-    if "exclude_pop_from_total" in p:
-        del p["exclude_pop_from_total"]
-    icu_rate = round(p["relative_icu_rate"] * p["hospitalized"].rate, 4)
-    vent_rate = round(p["relative_vent_rate"] * icu_rate, 4)
-    p["icu"] = Disposition(icu_rate, p["icu_days"])
-    p["ventilated"] = Disposition(vent_rate, p["icu_days"])
-    del p["relative_icu_rate"]
-    del p["relative_vent_rate"]
-    del p["icu_days"]
+        for policy in policies:
+            validate_parameter("mitigation_stages", policy)
+    for current_date in region_table.current_dates:
+        validate_parameter("current_date", current_date)
+    for row in region_table.current_hospitalized:
+        for current_hospitalized in row:
+            validate_parameter("current_hospitalized", current_hospitalized)
+    icu_days = space.base_params["icu_days"]
+    for hospitalized, relative_icu_rate, relative_vent_rate in space.disposition_inputs():
+        icu, ventilated = region_table.dispositions(
+            hospitalized, relative_icu_rate, relative_vent_rate, icu_days)
+        validate_parameter("icu", icu)
+        validate_parameter("ventilated", ventilated)
+
+def get_model_params(parameters, region_table):
+    logger.debug("PARAMETERS PRINT %s", parameters)
+    r = region_table.region_index[parameters["region_name"]]
+    d = region_table.days_back_index[parameters["end_date_days_back"]]
+    p = { k: v for k, v in parameters.items()
+          if k not in _NON_MODEL_KEYS and not k.startswith("region_") }
+    p["mitigation_stages"] = canonical_policy(
+        p["mitigation_stages"], p.get("mitigation_ramp_days", 0))
+    p["current_date"] = region_table.current_dates[d]
+    p["region"] = region_table.regions[r]
+    p["current_hospitalized"] = region_table.current_hospitalized[d][r]
+    p["icu"], p["ventilated"] = region_table.dispositions(
+        p["hospitalized"], parameters["relative_icu_rate"],
+        parameters["relative_vent_rate"], parameters["icu_days"])
     return p
-
-def _derived_region_setup(p, derived_from, region_results):
-    derived_scale = p["region_derived_scale"]
-    print("region_results regions:", list(region_results))
-    base_region_results = region_results[derived_from]
-    base_region_params = base_region_results["final_params"]
-    print("base_region_params:", base_region_params)
-    base_region_curr_hosp = base_region_params["current_hospitalized"]
-    p["current_hospitalized"] = round(derived_scale * base_region_curr_hosp)
-
-def _base_region_setup(p, days_back):
-    curr_hosp = p["hosp_census_lookback"][days_back]
-    p["current_hospitalized"] = round(curr_hosp * p["region_patient_share"])
-    print("SET BASE REGION CUR HOSP:", p["current_hospitalized"])
-
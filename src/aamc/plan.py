@@ -0,0 +1,105 @@
+#!/usr/bin/python3
+# vim: et ts=8 sts=4 sw=4
+
+from aamc import *
+
+import datetime
+
+# A date_first_hospitalized fit runs a coarse pass and up to four refining
+# passes of 15 candidate doubling times (see SimSirModel), then the final
+# projection. A doubling_time fit runs one projection to find i_day and then
+# the final projection.
+_FIT_PROJECTIONS_DATE_FIRST_HOSP = 15 * 5 + 1
+_FIT_PROJECTIONS_DOUBLING_TIME = 2
+
+# Columns are written as text; this is only used to size in-memory frames.
+_BYTES_PER_FRAME_VALUE = 8
+_FRAME_COLUMNS = 42
+
+PLAN_OK = "ok"
+PLAN_WARN = "warn"
+PLAN_REFUSE = "refuse"
+
+class SweepPlan:
+    """Analytic size and time estimate for a sweep, computed before launch.
+
+    With hosts > 1 the groups are shared by that many processes (a work
+    queue), and the wall time and verdict are those of each.
+    """
+
+    def __init__(
+        self, space, rows_per_group, seconds_per_group, bytes_per_row,
+        budget_hours, warn_fraction=0.8, hosts=1,
+    ):
+        self.param_count = len(space)
+        self.group_count = space.group_count
+        self.region_count = space.group_size
+        self.rows_per_group = rows_per_group
+        if space.use_doubling_time:
+            projections = _FIT_PROJECTIONS_DOUBLING_TIME
+        else:
+            projections = _FIT_PROJECTIONS_DATE_FIRST_HOSP
+        self.max_projections = self.param_count * projections
+        self.simulated_days = self.group_count * rows_per_group
+        self.max_simulated_days = self.simulated_days * projections
+        self.output_rows = self.group_count * rows_per_group
+        self.output_bytes = int(self.output_rows * bytes_per_row)
+        self.group_frame_bytes = \
+            rows_per_group * _FRAME_COLUMNS * _BYTES_PER_FRAME_VALUE
+        self.seconds_per_group = seconds_per_group
+        self.hosts = hosts
+        self.wall_seconds = self.group_count * seconds_per_group / hosts
+        self.budget_hours = budget_hours
+        budget_seconds = budget_hours * 3600
+        if self.wall_seconds > budget_seconds:
+            self.verdict = PLAN_REFUSE
+        elif self.wall_seconds > warn_fraction * budget_seconds:
+            self.verdict = PLAN_WARN
+        else:
+            self.verdict = PLAN_OK
+
+    def __str__(self):
+        lines = [
+            "Parameter sets:      %d" % self.param_count,
+            "Groups:              %d (%d regions each)"
+                % (self.group_count, self.region_count),
+            "Simulated days:      %d (up to %d including fit projections)"
+                % (self.simulated_days, self.max_simulated_days),
+            "Output rows:         %d" % self.output_rows,
+            "Output size:         %s" % format_bytes(self.output_bytes),
+            "Peak group frame:    %s" % format_bytes(self.group_frame_bytes),
+            "Time per group:      %.3f secs" % self.seconds_per_group,
+            "Projected wall time: %s%s (budget %s hours)"
+                % (datetime.timedelta(seconds=int(self.wall_seconds)),
+                   " over %d hosts" % self.hosts if self.hosts > 1 else "",
+                   self.budget_hours),
+            "Verdict:             %s" % self.verdict.upper(),
+        ]
+        return "\n".join(lines)
+
+def rows_per_group(space):
+    """Output rows per group, averaged over the end_date_days_back axis.
+
+    Only known analytically when fitting by date_first_hospitalized, where
+    every model starts on that date; returns None otherwise.
+    """
+    if space.use_doubling_time:
+        return None
+    base = space.base_params
+    end_date_days_back = space.axes[6]
+    rows = 0
+    for region in space.regions:
+        for days_back in end_date_days_back:
+            current_date = \
+                base["current_date"] - datetime.timedelta(days=days_back)
+            i_day = (current_date - base["date_first_hospitalized"]).days
+            # Day -i_day has no admits and is dropped from the output.
+            rows += i_day + base["n_days"]
+    return rows / len(end_date_days_back)
+
+def format_bytes(n):
+    for unit in ["B", "KB", "MB", "GB"]:
+        if n < 1024:
+            return "%.1f %s" % (n, unit)
+        n /= 1024.0
+    return "%.1f TB" % n
@@ -0,0 +1,95 @@
+#!/usr/bin/python3
+# vim: et ts=8 sts=4 sw=4
+
+from aamc import *
+
+import datetime
+import pandas as pd
+
+POLICY_HASH_BYTES = 8
+
+def policy_table_path(output_file_path):
+    """The policy table written beside a run's combined output file."""
+    return output_file_path.replace("_Combined_", "_Policies_")
+
+class PolicyTable:
+    """The distinct mitigation policies of a run, summarized once each.
+
+    Output rows carry only a policy_id; the policy strings and hashes are
+    computed the first time an id is seen and written once, to the file
+    at policy_table_path(). Grid policies keep the id the parameter space
+    gives them (see ParamSpace.policy_id), so ids agree between runs over
+    the same space; policies off the grid are numbered after the grid's,
+    in the order they are first seen.
+    """
+
+    def __init__(self, report_date, grid_policy_count=0):
+        self.report_date = report_date
+        self.next_id = grid_policy_count + 1
+        self.off_grid_ids = {}
+        self.summaries = {}
+
+    @classmethod
+    def from_space(cls, space):
+        return cls(
+            space.base_params["current_date"],
+            len(space.axes[PARAM_SPACE_AXES.index("mitigation_stages")]))
+
+    def __len__(self):
+        return len(self.summaries)
+
+    def intern(self, mitigation_stages, policy_id=None):
+        """The id of a policy, summarizing it if it is new.
+
+        policy_id is the grid id, or None for a policy off the grid.
+        """
+        if policy_id is None:
+            key = tuple(mitigation_stages)
+            policy_id = self.off_grid_ids.get(key)
+            if policy_id is None:
+                policy_id = self.off_grid_ids[key] = self.next_id
+                self.next_id += 1
+        if policy_id not in self.summaries:
+            self.summaries[policy_id] = \
+                summarize_mitigation_policy(self.report_date, mitigation_stages)
+        return policy_id
+
+    def to_dataframe(self):
+        rows = [
+            [ policy_id ] + [ value for (name, value) in summary ]
+            for policy_id, summary in sorted(self.summaries.items()) ]
+        columns = [ "policy_id" ] + [
+            name for (name, value) in summarize_mitigation_policy(self.report_date, []) ]
+        return pd.DataFrame(rows, columns=columns)
+
+    def write(self, path):
+        self.to_dataframe().to_csv(path, index=False)
+
+def summarize_mitigation_policy(report_date, mitigation_stages):
+    past_policy = [ ms for ms in mitigation_stages if ms[0] < report_date ]
+    future_policy = [ ms for ms in mitigation_stages if ms[0] >= report_date ]
+    complete_str, past_str, future_str = [
+        mitigation_policy_tostring(mp)
+        for mp in [ mitigation_stages, past_policy, future_policy ]
+    ]
+    hash_function = lambda x: md5(x, POLICY_HASH_BYTES)
+    summaries = [
+        [ "policy_str", complete_str ],
+        [ "policy_hash", hash_function(complete_str) ],
+        [ "past_str", past_str ],
+        [ "past_policy_hash", hash_function(past_str) ],
+        [ "future_str", future_str ],
+        [ "future_policy_hash", hash_function(future_str) ],
+    ]
+    return summaries
+
+def mitigation_policy_tostring(mitigation_policy):
+    s = [ "%s:%f" % (d.isoformat(), r) for (d, r) in mitigation_policy ]
+    return ";".join(s)
+
+def mitigation_policy_fromstring(policy_str):
+    """Inverse of mitigation_policy_tostring."""
+    if not isinstance(policy_str, str) or not policy_str:
+        return []
+    stages = [ s.split(":") for s in policy_str.split(";") ]
+    return [ (datetime.date.fromisoformat(d), float(r)) for (d, r) in stages ]
@@ -0,0 +1,142 @@
+#!/usr/bin/python3
+# vim: et ts=8 sts=4 sw=4
+
+import datetime, logging
+import os, sys, time
+
+PROGRESS_FILE = "PROGRESS.txt"
+BEST_FILE = "BEST.txt"
+# Progress is reported at most this often (and always on completion).
+PROGRESS_INTERVAL_SECS = 1.0
+
+logger = logging.getLogger(__name__)
+
+def configure_logging(verbose=False):
+    """Send aamc log records to the console, one message per line.
+
+    Run summaries are logged at INFO. Per-parameter and per-group detail
+    is logged at DEBUG and only shown when verbose. Warnings and errors go
+    to stderr.
+    """
+    formatter = logging.Formatter("%(message)s")
+    stdout_handler = logging.StreamHandler(sys.stdout)
+    stdout_handler.addFilter(lambda record: record.levelno < logging.WARNING)
+    stderr_handler = logging.StreamHandler(sys.stderr)
+    stderr_handler.setLevel(logging.WARNING)
+    aamc_logger = logging.getLogger("aamc")
+    aamc_logger.handlers[:] = []
+    for handler in (stdout_handler, stderr_handler):
+        handler.setFormatter(formatter)
+        aamc_logger.addHandler(handler)
+    aamc_logger.setLevel(logging.DEBUG if verbose else logging.INFO)
+    aamc_logger.propagate = False
+
+def write_file_atomic(path, text, tmp_path=None):
+    """Replace the file at path with text, so readers never see a partial file.
+
+    Writers that may race to replace the same file each need a tmp_path
+    of their own.
+    """
+    tmp_path = tmp_path or path + ".tmp"
+    with open(tmp_path, "w") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+class ProgressReporter:
+    """Logs sweep progress and writes it to PROGRESS.txt, rate limited.
+
+    update() may be called for every parameter set; the message is only
+    built and written when interval seconds have passed since the last one,
+    or when the sweep is done.
+    """
+
+    def __init__(
+        self, total, path=PROGRESS_FILE,
+        interval=PROGRESS_INTERVAL_SECS, clock=time.monotonic,
+    ):
+        self.total = total
+        self.path = path
+        self.interval = interval
+        self.clock = clock
+        self.start = clock()
+        self.last_report = None
+
+    def update(self, done):
+        """Record that done of total are complete; returns whether it reported."""
+        now = self.clock()
+        if (done < self.total and self.last_report is not None
+                and now - self.last_report < self.interval):
+            return False
+        self.last_report = now
+        message = self.message(done, now - self.start)
+        logger.info(message)
+        if self.path:
+            write_file_atomic(self.path, message + "\n")
+        return True
+
+    def message(self, done, elapsed_secs):
+        percent_done = done / self.total
+        total_time_est = int(elapsed_secs / percent_done) if done else 0
+        remaining_time_est = total_time_est - int(elapsed_secs)
+        return (
+            ("PROGRESS: %d/%d (%s%%)"
+            % (done, self.total, str(round(100 * percent_done, 2))))
+            +
+            (" (time: %d secs elapsed, est %d/%d remaining)"
+            % (int(elapsed_secs), remaining_time_est, total_time_est))
+        )
+
+class DeadlineReached(Exception):
+    """Raised to stop a sweep at its deadline."""
+
+class Deadline:
+    """When a sweep has to stop to finish by a wall-clock time.
+
+    expired() is called before each group. It is true once the time left
+    is less than the longest time between two calls so far, the slowest
+    group yet, so that the last group started still finishes in time.
+    """
+
+    def __init__(self, seconds_left, clock=time.monotonic):
+        self.clock = clock
+        self.end = clock() + seconds_left
+        self.last_call = None
+        self.longest_secs = 0.0
+
+    @classmethod
+    def at(cls, when, clock=time.monotonic):
+        return cls((when - datetime.datetime.now()).total_seconds(), clock)
+
+    def expired(self):
+        now = self.clock()
+        if self.last_call is not None:
+            self.longest_secs = max(self.longest_secs, now - self.last_call)
+        self.last_call = now
+        return self.end - now < self.longest_secs
+
+class BestSoFar:
+    """The best group of a sweep so far, written to BEST.txt as it improves.
+
+    The file is replaced atomically, so it always describes a group that
+    has been written to the output.
+    """
+
+    def __init__(self, path=BEST_FILE):
+        self.path = path
+        self.group_param_set_id = None
+        self.mse = float("inf")
+        self.evaluated = 0
+
+    def update(self, group_param_set_id, mse):
+        """Record a group's MSE; returns whether it is the new best."""
+        self.evaluated += 1
+        if not mse < self.mse:
+            return False
+        self.group_param_set_id, self.mse = group_param_set_id, mse
+        if self.path:
+            write_file_atomic(self.path, self.message() + "\n")
+        return True
+
+    def message(self):
+        return "BEST SO FAR: group %s, MSE = %s (%d groups evaluated)" % (
+            self.group_param_set_id, self.mse, self.evaluated)
@@ -0,0 +1,79 @@
+#!/usr/bin/python3
+# vim: et ts=8 sts=4 sw=4
+
+from aamc import *
+
+import numpy as np
+
+# (actual census column, model column) pairs scored by compute_error, in
+# the order of the returned MSEs: census, ICU, cumulative.
+SCORED_COLUMNS = [
+    (HOSP_DATA_COLNAME_TESTRESULTCOUNT, PENNMODEL_COLNAME_CENSUS_HOSP),
+    (HOSP_DATA_COLNAME_ICU_COUNT, PENNMODEL_COLNAME_CENSUS_ICU),
+    (HOSP_DATA_COLNAME_CUMULATIVE_COUNT, PENNMODEL_COLNAME_EVER_HOSP),
+]
+
+class CensusTarget:
+    """Actual daily census, prepared once per run for scoring projections.
+
+    Days are held as integer day numbers so that each projection is
+    matched to the actual data by offset arithmetic rather than by index
+    intersection. actual has one row per scored column.
+    """
+
+    def __init__(self, hosp_census_df):
+        daily = (
+            hosp_census_df.dropna()
+            [[ a for (a, p) in SCORED_COLUMNS ]]
+            .resample("D")
+            .max()
+            .dropna()
+        )
+        self.dates = daily.index
+        self.day_numbers = \
+            daily.index.values.astype("datetime64[D]").astype(np.int64)
+        self.actual = daily.to_numpy(dtype=float).T
+
+    def __len__(self):
+        return len(self.day_numbers)
+
+    def match(self, raw):
+        """Align one projection (a SimSirModel raw dict) to the actual days.
+
+        Returns (mask, values): which actual days the projection covers and
+        the projected value of each scored column on those days (zero
+        elsewhere).
+        """
+        start = raw["date"][0].astype("datetime64[D]").astype(np.int64)
+        offsets = self.day_numbers - start
+        # The first projected day has no admits and is never written or scored.
+        mask = (offsets >= 1) & (offsets < len(raw["date"]))
+        values = np.zeros(self.actual.shape)
+        for i, (_, model_column) in enumerate(SCORED_COLUMNS):
+            values[i, mask] = raw[model_column][offsets[mask]]
+        return mask, values
+
+    def score(self, matches, window=None):
+        """MSE of the summed projections against the actual census.
+
+        matches are (mask, values) pairs from match(), one per region. Only
+        days covered by at least one region are scored and, with a window
+        of (first date, last date), only the days in it. Returns
+        (actual, predicted, mse per scored column); the MSEs are NaN when
+        no day is scored.
+        """
+        covered = np.zeros(len(self), dtype=bool)
+        predicted = np.zeros(self.actual.shape)
+        for mask, values in matches:
+            covered |= mask
+            predicted += values
+        if window is not None:
+            first, last = (
+                np.datetime64(d, "D").astype(np.int64) for d in window)
+            covered &= (self.day_numbers >= first) & (self.day_numbers <= last)
+        actual = self.actual[:, covered]
+        predicted = predicted[:, covered]
+        if not covered.any():
+            return actual, predicted, [ float("nan") ] * len(SCORED_COLUMNS)
+        mse = [ round(float(e), 2) for e in ((actual - predicted) ** 2).mean(axis=1) ]
+        return actual, predicted, mse
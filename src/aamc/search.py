@@ -0,0 +1,331 @@
+#!/usr/bin/python3
+# vim: et ts=8 sts=4 sw=4
+
+from aamc import *
+
+import glob, itertools, logging, os, re
+
+import pandas as pd
+
+SEARCH_GRID = "grid"
+SEARCH_ADAPTIVE = "adaptive"
+SEARCH_OPTIMIZE = "optimize"
+SEARCH_WARM = "warm"
+SEARCH_SURROGATE = "surrogate"
+SEARCH_MODES = [
+    SEARCH_GRID, SEARCH_ADAPTIVE, SEARCH_OPTIMIZE, SEARCH_WARM, SEARCH_SURROGATE ]
+
+# Number of points per axis on the first (coarsest) pass of the adaptive search.
+ADAPTIVE_COARSE_POINTS = 3
+
+# A warm start searches around this many of the previous run's best groups.
+WARM_START_TOP_K = 5
+# A warm start falls back to the full grid when its best MSE is more than
+# this fraction worse than the previous run's best.
+WARM_START_TOLERANCE = 0.25
+# Rows of a previous output file read at a time.
+WARM_START_CHUNK_ROWS = 200000
+
+logger = logging.getLogger(__name__)
+
+class SearchDimension:
+    """One searchable index axis of a ParamSpace.
+
+    The mitigation_stages axis is split into one dimension per past stage
+    plus one for the future divergence transform, so that each stage's
+    contact rate can be searched on its own.
+
+    An ordinal dimension is searched by stepping along it. A categorical
+    one (the future transforms) has no order, so every value is tried. A
+    partition dimension (end_date_days_back) changes what the MSE is
+    measured against, so it is never searched across: each value gets its
+    own search.
+    """
+
+    def __init__(self, name, size, categorical=False, partition=False):
+        self.name = name
+        self.size = size
+        self.categorical = categorical
+        self.partition = partition
+
+    def __repr__(self):
+        return "SearchDimension(%s, %d)" % (self.name, self.size)
+
+def search_dimensions(space):
+    dims = []
+    for name, axis, size in zip(PARAM_SPACE_AXES, space.axes, space.axis_sizes):
+        if name == "region":
+            continue
+        if name == "mitigation_stages" and isinstance(axis, MitigationPolicySpace):
+            for date, rates in zip(axis.dates, axis.past_rates):
+                dims.append(SearchDimension("stage_%s" % date.isoformat(), len(rates)))
+            dims.append(SearchDimension(
+                "future_divergence", axis.future_count, categorical=True))
+        else:
+            dims.append(SearchDimension(
+                name, size, partition=(name == "end_date_days_back")))
+    return dims
+
+def group_id_at(space, point):
+    """The group_param_set_id for one index per search dimension."""
+    coords = []
+    policy_axis = space.axes[PARAM_SPACE_AXES.index("mitigation_stages")]
+    point = list(point)
+    for name, axis in zip(PARAM_SPACE_AXES, space.axes):
+        if name == "region":
+            coords.append(0)
+        elif name == "mitigation_stages" and isinstance(axis, MitigationPolicySpace):
+            stage_count = len(axis.past_sizes)
+            past, future = point[:stage_count], point[stage_count]
+            point = point[stage_count + 1:]
+            coords.append(policy_axis.index_at(past, future))
+        else:
+            coords.append(point.pop(0))
+    return space.param_set_id_at(coords)
+
+def point_of_group(space, group_param_set_id):
+    """Inverse of group_id_at."""
+    point = []
+    coords = space.coordinates(group_param_set_id)
+    for name, axis, i in zip(PARAM_SPACE_AXES, space.axes, coords):
+        if name == "region":
+            continue
+        if name == "mitigation_stages" and isinstance(axis, MitigationPolicySpace):
+            point += axis.past_coordinates(i)
+            point.append(i % axis.future_count)
+        else:
+            point.append(i)
+    return point
+
+def coarse_to_fine_order(space):
+    """All group ids, the coarsest grid first and then each refinement.
+
+    Along each ordinal axis, its two ends come first, then the indices
+    at a power-of-two stride, halving the stride at each level. A group
+    comes at the finest level of any of its coordinates, and in id order
+    within a level, so a sweep stopped early has covered the whole space
+    evenly rather than one corner of it.
+    """
+    dims = search_dimensions(space)
+    levels = [
+        None if d.categorical or d.partition else _refinement_levels(d.size)
+        for d in dims
+    ]
+
+    def level(group_param_set_id):
+        point = point_of_group(space, group_param_set_id)
+        return max([ 0 ] + [
+            axis_levels[i] for axis_levels, i in zip(levels, point)
+            if axis_levels is not None ])
+
+    return sorted(space.group_ids(), key=lambda g: (level(g), g))
+
+def _refinement_levels(size):
+    """The level at which coarse_to_fine_order reaches each index of an axis."""
+    levels = []
+    for i in range(size):
+        level, step = 0, 1
+        while step < size - 1:
+            step *= 2
+        while i not in (0, size - 1) and i % step:
+            level, step = level + 1, step // 2
+        levels.append(level)
+    return levels
+
+def adaptive_search(space, evaluate, coarse_points=ADAPTIVE_COARSE_POINTS, starts=None):
+    """Coarse-to-fine coordinate descent over the index axes of a ParamSpace.
+
+    evaluate(group_param_set_id) returns the group's MSE. Each ordinal axis
+    starts with a step that puts about coarse_points values on it; the
+    whole coarse row through the current point is tried, and the point
+    moves to the best one. Once a full pass over the axes gives no
+    improvement, the steps are halved and only the neighbours at the new
+    step are tried, until no axis improves at step 1.
+
+    Searches start from the middle of the grid, or from each point in
+    starts. Every group is evaluated at most once. Returns the scores of
+    all evaluated groups, keyed by group_param_set_id.
+    """
+    dims = search_dimensions(space)
+    scores = {}
+    score = _scorer(space, evaluate, scores)
+    for point in partition_starts(space, starts):
+        _descend(dims, point, score, coarse_points)
+    return scores
+
+def warm_search(space, evaluate, starts, baseline_mse=None, tolerance=WARM_START_TOLERANCE):
+    """Local search around the best groups of a previous run.
+
+    From each start (see warm_start_point), in every partition, the point
+    moves to its best neighbour, one step along one axis at a time, until
+    no neighbour improves (see local_search). If the best MSE found is
+    more than tolerance worse than baseline_mse (the previous run's
+    best), or there are no starts, the rest of the grid is evaluated as
+    well. With tolerance None the search never leaves the neighbourhood.
+
+    Returns the scores of all evaluated groups, as adaptive_search does.
+    """
+    scores = {}
+    if starts:
+        scores = local_search(space, evaluate, partition_starts(space, starts))
+        best_mse = min(scores.values())
+        if tolerance is None or baseline_mse is None \
+                or best_mse <= baseline_mse * (1 + tolerance):
+            return scores
+        logger.warning(
+            "WARM START: best MSE %s is more than %s%% worse than the previous run's %s; "
+            "searching the full grid.", best_mse, 100 * tolerance, baseline_mse)
+    for group_param_set_id in space.group_ids():
+        if group_param_set_id not in scores:
+            scores[group_param_set_id] = evaluate(group_param_set_id)
+    return scores
+
+def local_search(space, evaluate, points):
+    """Descend from each point to a local minimum, one grid step at a time.
+
+    Returns the scores of all evaluated groups, as adaptive_search does.
+    """
+    dims = search_dimensions(space)
+    scores = {}
+    score = _scorer(space, evaluate, scores)
+    for point in points:
+        _descend(dims, list(point), score, coarse=False)
+    return scores
+
+def _scorer(space, evaluate, scores):
+    """score(point), evaluating each group once and recording it in scores."""
+    def score(point):
+        group_param_set_id = group_id_at(space, point)
+        if group_param_set_id not in scores:
+            scores[group_param_set_id] = evaluate(group_param_set_id)
+        return scores[group_param_set_id]
+    return score
+
+def partition_starts(space, starts=None):
+    """Start points for each value of the partition dimensions.
+
+    Defaults to the middle of every axis of the grid.
+    """
+    dims = search_dimensions(space)
+    if starts is None:
+        starts = [ [ d.size // 2 for d in dims ] ]
+    partition_dims = [ k for k, d in enumerate(dims) if d.partition ]
+    points = []
+    for partition in itertools.product(*[ range(dims[k].size) for k in partition_dims ]):
+        for start in starts:
+            point = list(start)
+            for k, i in zip(partition_dims, partition):
+                point[k] = i
+            points.append(point)
+    return points
+
+def _descend(dims, point, score, coarse_points=ADAPTIVE_COARSE_POINTS, coarse=True):
+    steps = [
+        max(1, (d.size - 1) // max(1, coarse_points - 1))
+        if coarse and not d.categorical else 1
+        for d in dims
+    ]
+    best = score(point)
+    while True:
+        improved = False
+        for k, d in enumerate(dims):
+            if d.partition or d.size == 1:
+                continue
+            if d.categorical:
+                candidates = range(d.size)
+            elif coarse:
+                candidates = range(point[k] % steps[k], d.size, steps[k])
+            else:
+                candidates = [ point[k] - steps[k], point[k] + steps[k] ]
+            for c in candidates:
+                if c == point[k] or not 0 <= c < d.size:
+                    continue
+                trial = list(point)
+                trial[k] = c
+                trial_score = score(trial)
+                if trial_score < best:
+                    best, point[k], improved = trial_score, c, True
+        if improved:
+            continue
+        if not coarse and all(s == 1 for s in steps):
+            return point, best
+        coarse = False
+        steps = [ max(1, s // 2) for s in steps ]
+
+# A whole run's output file: not a shard's, which has a _<i>of<n> suffix.
+_RUN_OUTPUT_NAME = re.compile(r"PennModelFit_Combined_\d{4}-\d{2}-\d{2}_\d+\.csv$")
+
+def latest_output_path(output_dir, report_date):
+    """The newest completed run's combined output file, or None.
+
+    Only runs for report_date or earlier count, and only those that wrote
+    their policy table, which happens when a run completes.
+    """
+    paths = [
+        path for path in glob.glob(os.path.join(output_dir, "PennModelFit_Combined_*.csv"))
+        if _RUN_OUTPUT_NAME.match(os.path.basename(path))
+        and os.path.basename(path).split("_")[2] <= report_date.isoformat()
+        and os.path.exists(policy_table_path(path))
+    ]
+    # Names hold the report date and then the run timestamp.
+    return max(paths, key=os.path.basename, default=None)
+
+def load_previous_fits(output_path, top_k=WARM_START_TOP_K):
+    """The top_k best groups of a previous run, best first.
+
+    One row per group, with its fit columns and the past_str of its
+    policy, from the run's policy table.
+    """
+    columns = [
+        "group_param_set_id", "policy_id", "mse", "hospitalized_rate",
+        "hospitalized_days", "icu_rate", "ventilated_rate",
+    ]
+    # Every row of a group carries the same fit columns; keep one of each.
+    groups = pd.concat([
+        chunk.drop_duplicates("group_param_set_id")
+        for chunk in pd.read_csv(
+            output_path, usecols=columns, chunksize=WARM_START_CHUNK_ROWS)
+    ]).drop_duplicates("group_param_set_id")
+    best = groups.dropna(subset=["mse"]).nsmallest(top_k, "mse")
+    policies = pd.read_csv(
+        policy_table_path(output_path), usecols=["policy_id", "past_str"])
+    return best.merge(policies, on="policy_id", how="left")
+
+def warm_start_point(space, fit):
+    """The grid point nearest a previous run's fit (a load_previous_fits row).
+
+    Each stage of this grid gets the rate that was in effect on its date
+    under the previous policy; axes the output does not record start in
+    the middle, as adaptive_search does, and the future divergence at its
+    first transform.
+    """
+    stages = mitigation_policy_fromstring(fit["past_str"])
+    hospitalized_rate = fit["hospitalized_rate"]
+    icu_rate = fit["icu_rate"]
+    values = {
+        "hospitalized": lambda d: (
+            abs(d.rate - hospitalized_rate) / hospitalized_rate
+            + abs(d.days - fit["hospitalized_days"]) / fit["hospitalized_days"]),
+        "relative_icu_rate": lambda r: abs(r * hospitalized_rate - icu_rate),
+        "relative_vent_rate": lambda r: abs(r * icu_rate - fit["ventilated_rate"]),
+    }
+    point = []
+    for name, axis in zip(PARAM_SPACE_AXES, space.axes):
+        if name == "region":
+            continue
+        if name == "mitigation_stages" and isinstance(axis, MitigationPolicySpace):
+            for date, rates in zip(axis.dates, axis.past_rates):
+                in_effect = [ r for (d, r) in stages if d <= date ]
+                if in_effect:
+                    point.append(_nearest_index(rates, lambda r: abs(r - in_effect[-1])))
+                else:
+                    point.append(len(rates) // 2)
+            point.append(0)
+        elif name in values:
+            point.append(_nearest_index(axis, values[name]))
+        else:
+            point.append(len(axis) // 2)
+    return point
+
+def _nearest_index(axis, distance):
+    return min(range(len(axis)), key=lambda i: distance(axis[i]))
@@ -0,0 +1,91 @@
+#!/usr/bin/python3
+# vim: et ts=8 sts=4 sw=4
+
+from aamc import *
+
+import itertools
+
+import numpy as np
+
+# Groups simulated to train the emulator.
+SURROGATE_SAMPLE_GROUPS = 200
+# Groups with the lowest predicted MSE simulated next, per partition.
+SURROGATE_CANDIDATES = 100
+# Grid points per partition ranked by the emulator; a larger partition is
+# represented by a random sample of this many.
+SURROGATE_POOL_POINTS = 100000
+SURROGATE_SEED = 0
+
+def surrogate_search(
+    space, evaluate, sample_groups=SURROGATE_SAMPLE_GROUPS,
+    candidates=SURROGATE_CANDIDATES, seed=SURROGATE_SEED,
+    pool_points=SURROGATE_POOL_POINTS,
+):
+    """Simulate only the groups an emulator predicts to fit well.
+
+    A random sample of sample_groups groups is evaluated, and a gradient
+    boosted tree regression from their search coordinates to log MSE is
+    fitted to it. In each partition (end_date_days_back value), the
+    emulator ranks the partition's grid points (at most pool_points of
+    them, sampled at random from a larger partition), the candidates
+    with the lowest predicted MSE are evaluated, and the search ends
+    with a local descent (local_search) from each partition's best
+    group. Needs scikit-learn.
+
+    Returns the scores of all evaluated groups, as adaptive_search does.
+    """
+    from sklearn.ensemble import HistGradientBoostingRegressor
+
+    dims = search_dimensions(space)
+    partition_dims = [ k for k, d in enumerate(dims) if d.partition ]
+    scores = {}
+    points = {}
+
+    def score_group(group_param_set_id):
+        if group_param_set_id not in scores:
+            scores[group_param_set_id] = evaluate(group_param_set_id)
+        return scores[group_param_set_id]
+
+    def score(point):
+        group_param_set_id = group_id_at(space, point)
+        points[group_param_set_id] = tuple(int(i) for i in point)
+        return score_group(group_param_set_id)
+
+    rng = np.random.default_rng(seed)
+    group_ids = space.group_ids()
+    sample = rng.choice(len(group_ids), min(sample_groups, len(group_ids)), replace=False)
+    sample_points = np.array([ point_of_group(space, group_ids[k]) for k in sample ])
+    mse = np.array([ score(point) for point in sample_points ], dtype=float)
+    fitted = np.isfinite(mse)
+    emulator = HistGradientBoostingRegressor(
+        categorical_features=[ d.categorical for d in dims ],
+        random_state=seed)
+    emulator.fit(sample_points[fitted], np.log1p(mse[fitted]))
+
+    starts = []
+    for partition in itertools.product(*[ range(dims[k].size) for k in partition_dims ]):
+        pool = partition_points(dims, dict(zip(partition_dims, partition)), pool_points, rng)
+        predicted = emulator.predict(pool)
+        for point in pool[np.argsort(predicted, kind="stable")[:candidates]]:
+            score(point)
+        in_partition = [
+            g for g, point in points.items()
+            if all(point[k] == i for k, i in zip(partition_dims, partition)) ]
+        best = min(in_partition, key=scores.get)
+        starts.append(list(points[best]))
+    local_search(space, score_group, starts)
+    return scores
+
+def partition_points(dims, fixed, size, rng):
+    """The grid points with the fixed {dimension: index} coordinates.
+
+    All of them, in order, if there are at most size; otherwise size
+    drawn at random, without duplicates.
+    """
+    if np.prod([ d.size for k, d in enumerate(dims) if k not in fixed ], dtype=float) <= size:
+        return np.array(list(itertools.product(*[
+            [ fixed[k] ] if k in fixed else range(d.size) for k, d in enumerate(dims) ])))
+    pool = np.column_stack([
+        np.full(size, fixed[k]) if k in fixed else rng.integers(d.size, size=size)
+        for k, d in enumerate(dims) ])
+    return np.unique(pool, axis=0)
@@ -0,0 +1,270 @@
+#!/usr/bin/python3
+# vim: et ts=8 sts=4 sw=4
+
+from aamc import *
+
+import json, logging, os, os.path, socket, threading, time
+
+QUEUE_FILE = "queue.json"
+# Groups per range of work claimed at a time.
+QUEUE_RANGE_GROUPS = 50
+# A worker rewrites its lease this often while it runs a range; a lease
+# that has not changed for the timeout is taken over by another worker.
+QUEUE_HEARTBEAT_SECS = 30
+QUEUE_LEASE_TIMEOUT_SECS = 300
+# Idle workers look for claimable ranges this often.
+QUEUE_POLL_SECS = 10
+
+logger = logging.getLogger(__name__)
+
+def worker_name():
+    return "%s-%d" % (socket.gethostname(), os.getpid())
+
+class WorkQueue:
+    """A sweep split into ranges of groups, shared through a directory.
+
+    The coordinator publishes the ranges to queue.json. A worker, on any
+    host that sees the directory, claims a range by creating its lease
+    file (which only one worker can create), runs it into a part file,
+    and renames the part into place when it is done; a range is done when
+    its part exists. Nothing but the filesystem is shared: no locks or
+    clocks. While it runs a range a worker rewrites the lease with a new
+    heartbeat count; a worker that sees a lease unchanged for
+    lease_timeout_secs, by its own clock, takes the range over, so a
+    crashed worker's range is redone. The sweep is deterministic, so a
+    range run twice (by a worker thought dead) gives the same part.
+
+    Parts are named so that policy_table_path() gives each its own
+    policy table, as for a single run's output.
+    """
+
+    def __init__(
+        self, directory, worker=None,
+        heartbeat_secs=QUEUE_HEARTBEAT_SECS,
+        lease_timeout_secs=QUEUE_LEASE_TIMEOUT_SECS,
+        poll_secs=QUEUE_POLL_SECS, clock=time.monotonic,
+    ):
+        self.directory = directory
+        self.worker = worker or worker_name()
+        self.heartbeat_secs = heartbeat_secs
+        self.lease_timeout_secs = lease_timeout_secs
+        self.poll_secs = poll_secs
+        self.clock = clock
+        self.ranges = None
+        # Lease contents seen, by range, and when each was first seen.
+        self.seen_leases = {}
+
+    @classmethod
+    def publish(cls, directory, space, range_groups=QUEUE_RANGE_GROUPS, **kwargs):
+        """Publish the ranges of a space's grid, or resume the same sweep.
+
+        Parts already in the directory are kept only if it holds the same
+        sweep; a different one is refused.
+        """
+        queue = cls(directory, **kwargs)
+        for subdirectory in ("leases", "parts"):
+            os.makedirs(os.path.join(directory, subdirectory), exist_ok=True)
+        step = range_groups * space.group_size
+        description = {
+            "space": space_fingerprint(space),
+            "ranges": [ [ start, min(start + step, len(space)) ]
+                        for start in range(0, len(space), step) ],
+        }
+        path = os.path.join(directory, QUEUE_FILE)
+        if os.path.exists(path):
+            with open(path) as f:
+                if json.load(f) != description:
+                    raise ValueError(
+                        "%s holds a different sweep; use an empty directory" % directory)
+            logger.info("QUEUE: resuming %s", directory)
+        else:
+            write_file_atomic(path, json.dumps(description))
+        queue.ranges = [ tuple(r) for r in description["ranges"] ]
+        return queue
+
+    def attach(self, space, wait_secs=None):
+        """Load the published ranges, waiting for them to be published.
+
+        Raises ValueError if they were published for a different space.
+        """
+        path = os.path.join(self.directory, QUEUE_FILE)
+        start = self.clock()
+        while not os.path.exists(path):
+            if wait_secs is not None and self.clock() - start > wait_secs:
+                raise TimeoutError("No work queue published in %s" % self.directory)
+            time.sleep(self.poll_secs)
+        with open(path) as f:
+            description = json.load(f)
+        if description["space"] != space_fingerprint(space):
+            raise ValueError("The work queue in %s is for a different sweep" % self.directory)
+        self.ranges = [ tuple(r) for r in description["ranges"] ]
+
+    def part_path(self, k):
+        return os.path.join(self.directory, "parts", "PennModelFit_Combined_%05d.csv" % k)
+
+    def lease_path(self, k):
+        return os.path.join(self.directory, "leases", "%05d.lease" % k)
+
+    def is_done(self, k):
+        return os.path.exists(self.part_path(k))
+
+    def all_done(self):
+        return all(self.is_done(k) for k in range(len(self.ranges)))
+
+    def claim(self):
+        """Claim a range that is neither done nor leased; returns it or None.
+
+        A range whose lease has gone stale is taken over.
+        """
+        for k in range(len(self.ranges)):
+            if self.is_done(k):
+                continue
+            if self._create_lease(k):
+                return k
+            if self._is_stale(k) and self._break_lease(k) and self._create_lease(k):
+                logger.warning("QUEUE: took over range %d from a stale lease", k)
+                return k
+        return None
+
+    def _create_lease(self, k):
+        try:
+            fd = os.open(self.lease_path(k), os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, "w") as f:
+            f.write(self._lease_text(0))
+        # The range may have been completed since is_done was checked.
+        if self.is_done(k):
+            self.release(k)
+            return False
+        return True
+
+    def _lease_text(self, beat):
+        return "%s\n%d\n" % (self.worker, beat)
+
+    def _read_lease(self, k):
+        try:
+            with open(self.lease_path(k)) as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def _is_stale(self, k):
+        text = self._read_lease(k)
+        if text is None:
+            return False
+        now = self.clock()
+        seen_text, since = self.seen_leases.get(k, (None, None))
+        if text != seen_text:
+            self.seen_leases[k] = (text, now)
+            return False
+        return now - since >= self.lease_timeout_secs
+
+    def _break_lease(self, k):
+        # Renaming is atomic: of several workers breaking the lease, one wins.
+        broken = "%s.broken-%s" % (self.lease_path(k), self.worker)
+        try:
+            os.rename(self.lease_path(k), broken)
+        except FileNotFoundError:
+            return False
+        os.remove(broken)
+        self.seen_leases.pop(k, None)
+        return True
+
+    def holds(self, k):
+        text = self._read_lease(k)
+        return text is not None and text.split("\n")[0] == self.worker
+
+    def beat(self, k, count):
+        """Refresh the lease of a range; returns whether it is still held.
+
+        Another worker may break the lease and claim the range between
+        the check and the write, which then replaces the new lease. The
+        lease is read back after the write, so of two workers that both
+        thought they held the range, the last to write keeps it and the
+        other gives up at its next beat.
+        """
+        if not self.holds(k):
+            return False
+        text = self._lease_text(count)
+        write_file_atomic(
+            self.lease_path(k), text,
+            tmp_path="%s.%s.tmp" % (self.lease_path(k), self.worker))
+        return self._read_lease(k) == text
+
+    def complete(self, k, tmp_part_path):
+        """Move a finished part (and its policy table) into place."""
+        os.replace(policy_table_path(tmp_part_path), policy_table_path(self.part_path(k)))
+        os.replace(tmp_part_path, self.part_path(k))
+        self.release(k)
+
+    def release(self, k):
+        if self.holds(k):
+            os.remove(self.lease_path(k))
+
+    def run_worker(self, space, run_range):
+        """Claim and run ranges until every range is done.
+
+        run_range(view, part_path) runs a view of the space into a part
+        file and its policy table. Returns the number of ranges run here.
+        """
+        ranges_run = 0
+        while True:
+            k = self.claim()
+            if k is None:
+                if self.all_done():
+                    return ranges_run
+                time.sleep(self.poll_secs)
+                continue
+            start, stop = self.ranges[k]
+            logger.info("QUEUE: %s running range %d of %d (parameter sets %d to %d)",
+                        self.worker, k + 1, len(self.ranges), start + 1, stop)
+            tmp_part_path = "%s.%s.tmp" % (self.part_path(k), self.worker)
+            heartbeat = _Heartbeat(self, k)
+            heartbeat.start()
+            try:
+                run_range(space[start:stop], tmp_part_path)
+            except BaseException:
+                heartbeat.stop()
+                self.release(k)
+                raise
+            heartbeat.stop()
+            if heartbeat.lost:
+                logger.warning("QUEUE: lost the lease of range %d; dropping it", k)
+                for path in (tmp_part_path, policy_table_path(tmp_part_path)):
+                    if os.path.exists(path):
+                        os.remove(path)
+                continue
+            self.complete(k, tmp_part_path)
+            ranges_run += 1
+
+    def merge(self, output_file_path):
+        """Merge the parts, in range order, into one output and policy table."""
+        parts = [ self.part_path(k) for k in range(len(self.ranges)) ]
+        merge_csv(parts, output_file_path)
+        merge_policy_tables(
+            [ policy_table_path(p) for p in parts ], policy_table_path(output_file_path))
+
+class _Heartbeat(threading.Thread):
+    """Refreshes a range's lease while it runs."""
+
+    def __init__(self, queue, k):
+        super().__init__(daemon=True)
+        self.queue = queue
+        self.k = k
+        self.lost = False
+        self.stopped = threading.Event()
+
+    def run(self):
+        count = 0
+        while not self.stopped.wait(self.queue.heartbeat_secs):
+            count += 1
+            if not self.queue.beat(self.k, count):
+                self.lost = True
+                return
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+        # A lease broken after the last beat is lost too.
+        self.lost = self.lost or not self.queue.holds(self.k)
@@ -3,17 +3,190 @@
 
 from aamc import *
 
-def get_date_override():
-    if len(sys.argv) > 1:
-        args = sys.argv[1:]
-        today_override = datetime.date.fromisoformat(args[0])
-    else:
-        today_override = datetime.date.today()
-    return today_override
+import argparse
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="AAMC model fit batch")
+    parser.add_argument(
+        "date", nargs="?", type=datetime.date.fromisoformat,
+        default=datetime.date.today(),
+        help="Report date (YYYY-MM-DD); defaults to today")
+    parser.add_argument(
+        "--plan", action="store_true",
+        help="Print the sweep size and time estimate and exit")
+    parser.add_argument(
+        "--force", action="store_true",
+        help="Run even if the sweep is projected to exceed the time budget, "
+             "without calibrating a plan")
+    parser.add_argument(
+        "--search", choices=SEARCH_MODES, default=SEARCH_GRID,
+        help="Evaluate the full grid, search it adaptively (coarse to fine), "
+             "fit the stage rates with an optimizer, search around the "
+             "previous run's best fits (warm), or simulate only the groups an "
+             "emulator trained on a sample predicts to fit best (surrogate; needs "
+             "scikit-learn)")
+    parser.add_argument(
+        "--max-evaluations", type=int, default=OPTIMIZER_MAX_EVALUATIONS,
+        help="Optimizer evaluation budget per search (--search optimize)")
+    parser.add_argument(
+        "--fit-hospitalized", action="store_true",
+        help="Also fit hospitalized rate and length of stay (--search optimize)")
+    parser.add_argument(
+        "--band-samples", type=int, default=0,
+        help="Neighborhood samples for uncertainty bands (--search optimize)")
+    parser.add_argument(
+        "--previous-output", metavar="PATH",
+        help="Output file of the run to warm start from (--search warm); "
+             "defaults to the newest completed run in the output directory")
+    parser.add_argument(
+        "--top-k", type=int, default=WARM_START_TOP_K,
+        help="Previous best groups to search around (--search warm)")
+    parser.add_argument(
+        "--warm-tolerance", type=float, default=WARM_START_TOLERANCE,
+        help="Search the full grid if the best MSE is more than this fraction "
+             "worse than the previous run's (--search warm)")
+    parser.add_argument(
+        "--warm-only", action="store_true",
+        help="Never fall back to the full grid (--search warm)")
+    parser.add_argument(
+        "--surrogate-samples", type=int, default=SURROGATE_SAMPLE_GROUPS,
+        help="Groups simulated to train the emulator (--search surrogate)")
+    parser.add_argument(
+        "--surrogate-candidates", type=int, default=SURROGATE_CANDIDATES,
+        help="Groups predicted best simulated per end_date_days_back "
+             "(--search surrogate)")
+    parser.add_argument(
+        "--sample", type=int, metavar="N",
+        help="Sweep N parameter sets sampled from the ranges the grid spans "
+             "(stage contact rates, hospitalized rate and days, ICU and "
+             "ventilated rates) instead of the grid itself")
+    parser.add_argument(
+        "--sample-method", choices=SAMPLE_METHODS, default=SAMPLE_LATIN_HYPERCUBE,
+        help="Latin hypercube or scrambled Sobol sample (--sample)")
+    parser.add_argument(
+        "--sample-seed", type=int, default=SAMPLE_SEED,
+        help="Random seed of the sample (--sample)")
+    parser.add_argument(
+        "--queue", metavar="DIR",
+        help="Share the grid sweep with workers on other hosts through this "
+             "directory: publish its ranges, work on them, and merge the "
+             "results once all are done")
+    parser.add_argument(
+        "--worker", action="store_true",
+        help="Only work on the ranges published to --queue; write no output "
+             "of its own and load nothing")
+    parser.add_argument(
+        "--hosts", type=int, default=1,
+        help="Processes expected to share the sweep (--queue), this one "
+             "included; the projected time and budget check are per host")
+    parser.add_argument(
+        "--range-groups", type=int, default=QUEUE_RANGE_GROUPS,
+        help="Groups per range of work (--queue)")
+    parser.add_argument(
+        "--shard", type=shard, metavar="I/N",
+        help="Sweep only shard I of N of the grid (each a contiguous run of "
+             "groups), for a host of its own; merge the shards with package.py")
+    parser.add_argument(
+        "--backtest", type=horizons, default=(), metavar="DAYS[,DAYS...]",
+        help="Fit as of the report date only, and also refit each group as of "
+             "these many days earlier, writing its census MSE on the held-out "
+             "days as mse_backtest_<days> (results are not loaded)")
+    parser.add_argument(
+        "--deadline", type=deadline_time, metavar="[YYYY-MM-DDT]HH:MM",
+        help="Sweep the grid coarse to fine and stop by this time (the next "
+             "such time of day if no date is given), keeping the groups done; "
+             "not with --search optimize")
+    parser.add_argument(
+        "--verbose", action="store_true",
+        help="Log every parameter set, region and group MSE (slows the sweep)")
+    args = parser.parse_args()
+    if args.sample is not None and args.search != SEARCH_GRID:
+        parser.error("--sample sweeps the sample itself; it cannot be searched")
+    if args.queue is not None and (args.search != SEARCH_GRID or args.deadline):
+        parser.error("--queue runs the full grid; it cannot be searched or stopped early")
+    if args.deadline and args.search == SEARCH_OPTIMIZE:
+        parser.error("--search optimize writes its fits once done; it cannot stop at "
+                     "--deadline")
+    if args.worker and args.queue is None:
+        parser.error("--worker needs --queue")
+    if args.hosts < 1 or (args.hosts > 1 and args.queue is None):
+        parser.error("--hosts needs --queue and a count of at least 1")
+    if args.shard is not None and (
+            args.search != SEARCH_GRID or args.deadline or args.queue is not None):
+        parser.error("--shard runs its part of the full grid; it cannot be searched, "
+                     "stopped early or queued")
+    return args
+
+def horizons(text):
+    days = tuple(int(h) for h in text.split(","))
+    if any(h <= 0 for h in days):
+        raise argparse.ArgumentTypeError("Backtest horizons must be positive days")
+    return days
+
+def shard(text):
+    try:
+        index, count = [ int(n) for n in text.split("/") ]
+    except ValueError:
+        raise argparse.ArgumentTypeError("Shard must be I/N, e.g. 2/4")
+    if not 1 <= index <= count:
+        raise argparse.ArgumentTypeError("Shard I/N needs 1 <= I <= N")
+    return (index, count)
+
+def deadline_time(text):
+    if "T" in text:
+        return datetime.datetime.fromisoformat(text)
+    now = datetime.datetime.now()
+    when = datetime.datetime.combine(now.date(), datetime.time.fromisoformat(text))
+    if when <= now:
+        when += datetime.timedelta(days=1)
+    return when
+
+def sample_options(args):
+    if args.sample is None:
+        return None
+    return {
+        "size": args.sample, "method": args.sample_method, "seed": args.sample_seed,
+    }
+
+def queue_options(args):
+    if args.queue is None:
+        return None
+    return {
+        "directory": args.queue, "coordinator": not args.worker,
+        "range_groups": args.range_groups, "hosts": args.hosts,
+    }
+
+def search_options(args):
+    if args.search == SEARCH_OPTIMIZE:
+        return {
+            "max_evaluations": args.max_evaluations,
+            "fit_hospitalized": args.fit_hospitalized,
+            "band_samples": args.band_samples,
+        }
+    if args.search == SEARCH_WARM:
+        return {
+            "previous_output_path": args.previous_output,
+            "top_k": args.top_k,
+            "tolerance": None if args.warm_only else args.warm_tolerance,
+        }
+    if args.search == SEARCH_SURROGATE:
+        return {
+            "sample_groups": args.surrogate_samples,
+            "candidates": args.surrogate_candidates,
+        }
+    return {}
 
 if __name__ == "__main__":
+    args = parse_args()
+    configure_logging(args.verbose)
     delete_old_errors()
-    today_override = get_date_override()
-    data_based_variations(today_override, False)
+    completed = data_based_variations(
+        args.date, False, plan_only=args.plan, force=args.force,
+        search=args.search, search_options=search_options(args),
+        backtest_horizons=args.backtest, deadline=args.deadline,
+        sample_options=sample_options(args), queue_options=queue_options(args),
+        shard=args.shard)
     print_errors()
-    load_model()
+    # Backtest output has extra columns the results table does not hold.
+    if completed and not args.backtest:
+        load_model()
@@ -44,7 +44,7 @@ class Intro(Component):
                 market_share=pars.market_share,
                 recovery_days=pars.infectious_days,
                 r_naught=model.r_naught,
-                doubling_time=pars.doubling_time,
+                doubling_time=model.doubling_time,
                 relative_contact_rate=pars.relative_contact_rate,
                 r_t=model.r_t,
                 doubling_time_t=model.doubling_time_t,
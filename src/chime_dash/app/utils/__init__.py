@@ -22,7 +22,7 @@ from pandas import DataFrame
 from chime_dash.app.services.plotting import plot_dataframe
 from chime_dash.app.utils.templates import df_to_html_table
 
-from penn_chime.parameters import Parameters, Disposition
+from penn_chime.parameters import ACCEPTED_PARAMETERS, Parameters, Disposition
 from penn_chime.constants import DATE_FORMAT
 from penn_chime.charts import build_table
 
@@ -47,6 +47,9 @@ class ReadOnlyDict(Mapping):
 def _parameters_serializer_helper(obj):
     if isinstance(obj, (datetime, date)):
         result = obj.isoformat()
+    elif isinstance(obj, Parameters):
+        result = {
+            **obj.values(), "labels": obj.labels, "dispositions": obj.dispositions }
     else:
         result = obj.__dict__
     return result
@@ -82,18 +85,20 @@ def parameters_deserializer(p_json: str):
         region=values["region"],
     )
 
+    changes = {}
     for key, value in values.items():
 
-        if result.__dict__[key] != value and key not in (
-            "dispositions",
+        if key in ACCEPTED_PARAMETERS and getattr(result, key) != value and key not in (
             "hospitalized",
             "icu",
             "ventilated",
             "current_date",
             "date_first_hospitalized",
         ):
-            result.__dict__[key] = value
+            changes[key] = value
 
+    if changes:
+        result = Parameters.from_validated(**{ **result.values(), **changes })
     return result
 
 
@@ -1,51 +1,44 @@
 #!/usr/bin/python3
+# vim: et ts=8 sts=4 sw=4
 
-import sys, os, re, os.path, datetime, glob
+from aamc import *
 
-USAGE = "package.py <input_file_prefix> <date_iso_format>"
+import argparse, logging, sys
 
-class Args:
+logger = logging.getLogger("aamc.package")
 
-    def __init__(self):
-        self.exe = sys.argv[0]
-        self.args = list(sys.argv)[1:]
-
-    def next(self):
-        if len(self.args) == 0:
-            return None
-        n = self.args[0]
-        self.args = self.args[1:]
-        return n
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Merge the shards of a batch run (batch.py --shard) into one output")
+    parser.add_argument(
+        "date", nargs="?", type=datetime.date.fromisoformat,
+        default=datetime.date.today(),
+        help="Report date (YYYY-MM-DD) of the shards; defaults to today")
+    parser.add_argument(
+        "--output-dir", default=None,
+        help="Directory holding the shards; defaults to the batch output directory")
+    parser.add_argument(
+        "--load", action="store_true",
+        help="Load the merged output, as a single batch run does")
+    return parser.parse_args()
 
 def main():
-    args = Args()
-    prefix = args.next()
-    date = args.next()
-    if not prefix:
-        print(USAGE)
-        sys.exit(1)
-    if not date:
-        date = datetime.date.today()
-    else:
-        date = datetime.date.fromisoformat(date)
-    if args.next():
-        print(USAGE)
+    args = parse_args()
+    configure_logging()
+    output_dir = args.output_dir or get_output_dir()
+    manifests = find_shard_manifests(output_dir, args.date)
+    output_file_path = os.path.join(output_dir, "PennModelFit_Combined_%s_%s.csv" % (
+        args.date.isoformat(), now_timestamp()))
+    try:
+        merge_shards(manifests, output_file_path)
+    except ValueError as e:
+        logger.error("Cannot merge the shards for %s: %s", args.date.isoformat(), e)
         sys.exit(1)
-    input_filenames = glob.glob("output/%s_%s_*.csv" % (prefix, date))
-    output_filename = "output/Package_%s_%s.csv" % (prefix, date)
-    with open(output_filename, "w") as f_out:
-        with open(input_filenames[0], "r") as f_in:
-            for line in f_in.readlines():
-                print(line.rstrip(), file=f_out)
-        for input_filename in input_filenames:
-            with open(input_filenames[0], "r") as f_in:
-                is_first = True
-                for line in f_in.readlines():
-                    if is_first:
-                        is_first = False
-                    else:
-                        print(line.rstrip(), file=f_out)
+    logger.info("Merged %d shards: %s", len(manifests), record_output_path(output_file_path))
+    if os.path.exists(COPY_PATH):
+        copy_file(output_file_path, COPY_PATH)
+    if args.load:
+        load_model()
 
 if __name__ == "__main__":
     main()
-
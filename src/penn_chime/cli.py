@@ -10,6 +10,7 @@ from pandas import DataFrame
 from .constants import CHANGE_DATE
 from .parameters import Parameters, Disposition, ACCEPTED_PARAMETERS
 from .models import SimSirModel as Model
+from .ensemble import Distribution, run_ensemble
 
 
 class FromFile(Action):
@@ -88,6 +89,16 @@ def parse_args():
             type=validator(arg, cast, min_value, max_value, required),
             help=help,
         )
+
+    parser.add_argument(
+        "--ensemble-draws", type=int, default=0,
+        help="Also write percentile bands over this many sampled projections",
+    )
+    parser.add_argument("--ensemble-seed", type=int, default=0, help="Ensemble random seed")
+    parser.add_argument(
+        "--sample", action="append", default=[], metavar="NAME=DISTRIBUTION",
+        help="Sample an ensemble input, e.g. doubling_time=normal:4,0.5",
+    )
     return parser.parse_args()
 
 
@@ -96,6 +107,10 @@ def main():
     a = parse_args()
 
     del a.file
+    ensemble_draws, ensemble_seed, samples = a.ensemble_draws, a.ensemble_seed, a.sample
+    del a.ensemble_draws
+    del a.ensemble_seed
+    del a.sample
 
     hospitalized = Disposition(a.hospitalized_rate, a.hospitalized_days)
     icu = Disposition(a.icu_rate, a.icu_days)
@@ -124,6 +139,14 @@ def main():
     ):
         df.to_csv(f"{p.current_date}_{name}.csv")
 
+    if ensemble_draws:
+        distributions = {}
+        for sample in samples:
+            name, _, spec = sample.partition("=")
+            distributions[name] = Distribution.parse(spec)
+        bands_df = run_ensemble(p, distributions, ensemble_draws, seed=ensemble_seed)
+        bands_df.to_csv(f"{p.current_date}_projected_bands.csv", index=False)
+
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,267 @@
+"""Ensemble (Monte Carlo) projections.
+
+Uncertain inputs are sampled from distributions, every draw is simulated in
+one vectorized pass per batch, and the census and admits of the draws are
+reduced to percentile bands. Draws are folded into a fixed-size reservoir
+as they are simulated, so memory does not grow with the number of draws.
+"""
+
+from __future__ import annotations
+
+from datetime import timedelta
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from .models import (
+    SimSirModel, get_beta, get_growth_rate_array, sim_sir_rows, stage_betas,
+)
+from .parameters import Parameters
+
+ENSEMBLE_PERCENTILES = (5, 50, 95)
+# Draws are simulated this many at a time.
+ENSEMBLE_BATCH_SIZE = 500
+# Trajectories kept for the percentiles; exact up to this many draws.
+ENSEMBLE_SKETCH_SIZE = 2000
+
+# Inputs that can be given a distribution. relative_contact_rate is drawn
+# independently for each mitigation stage.
+SAMPLED_PARAMETERS = (
+    "hospitalized_rate", "hospitalized_days", "doubling_time", "relative_contact_rate",
+)
+
+BAND_SERIES = (
+    "census_hospitalized", "census_icu", "census_ventilated",
+    "admits_hospitalized", "admits_icu", "admits_ventilated",
+)
+
+
+class Distribution:
+    """A distribution to sample one input from.
+
+    Written as "kind:arg,arg,...", e.g. "uniform:0.02,0.04",
+    "normal:5,0.5", "lognormal:1.6,0.1", "triangular:4,5,7", or a plain
+    number for a constant.
+    """
+
+    ARGUMENT_COUNTS = {
+        "constant": 1, "uniform": 2, "normal": 2, "lognormal": 2, "triangular": 3,
+    }
+
+    def __init__(self, kind: str, *args: float):
+        if kind not in self.ARGUMENT_COUNTS:
+            raise ValueError(f"Unknown distribution '{kind}'")
+        if len(args) != self.ARGUMENT_COUNTS[kind]:
+            raise ValueError(
+                f"Distribution '{kind}' takes {self.ARGUMENT_COUNTS[kind]} arguments")
+        self.kind = kind
+        self.args = args
+
+    @classmethod
+    def parse(cls, text: str) -> Distribution:
+        kind, _, args = text.partition(":")
+        if not args:
+            return cls("constant", float(kind))
+        return cls(kind, *(float(a) for a in args.split(",")))
+
+    def sample(self, rng: np.random.Generator, size: int) -> np.ndarray:
+        if self.kind == "constant":
+            return np.full(size, self.args[0])
+        return getattr(rng, self.kind)(*self.args, size=size)
+
+    def __repr__(self):
+        return "Distribution(%s)" % ", ".join(
+            [repr(self.kind)] + [repr(a) for a in self.args])
+
+
+class QuantileSketch:
+    """Bounded-memory percentiles over rows, by reservoir sampling.
+
+    Keeps a uniform random sample of at most size rows (whole
+    trajectories), so the percentiles are exact until more than size rows
+    have been added and an unbiased estimate after that.
+    """
+
+    def __init__(self, size: int = ENSEMBLE_SKETCH_SIZE, seed: int = 0):
+        self.size = size
+        self.count = 0
+        self.rows: Optional[np.ndarray] = None
+        self.rng = np.random.default_rng(seed)
+
+    def update(self, rows: np.ndarray):
+        if self.rows is None:
+            self.rows = np.empty((self.size, rows.shape[1]))
+        fill = max(0, min(len(rows), self.size - self.count))
+        self.rows[self.count:self.count + fill] = rows[:fill]
+        rest = rows[fill:]
+        if len(rest):
+            seen = self.count + fill + np.arange(len(rest))
+            slots = self.rng.integers(0, seen + 1)
+            keep = slots < self.size
+            self.rows[slots[keep]] = rest[keep]
+        self.count += len(rows)
+
+    def quantiles(self, percentiles: Sequence[float]) -> np.ndarray:
+        kept = self.rows[:min(self.count, self.size)]
+        return np.percentile(kept, percentiles, axis=0)
+
+
+def default_doubling_time(
+    p: Parameters, distributions: Dict[str, Distribution],
+) -> Optional[float]:
+    """The doubling time of draws that do not sample one.
+
+    p.doubling_time, or in date_first_hospitalized mode the deterministic
+    fit; None when the doubling time is sampled.
+    """
+    if p.doubling_time is None and "doubling_time" not in distributions:
+        return SimSirModel(p).doubling_time
+    return p.doubling_time
+
+
+def sample_inputs(
+    p: Parameters,
+    distributions: Dict[str, Distribution],
+    draws: int,
+    rng: np.random.Generator,
+    doubling_time: Optional[float] = None,
+) -> Dict[str, np.ndarray]:
+    """Per-draw inputs: sampled where a distribution is given, else from p.
+
+    doubling_time is default_doubling_time(p, distributions), which is
+    computed if not given; pass it when sampling several batches.
+    """
+    unknown = set(distributions) - set(SAMPLED_PARAMETERS)
+    if unknown:
+        raise ValueError(f"Cannot sample {', '.join(sorted(unknown))}")
+
+    def draw(name, default):
+        if name in distributions:
+            return distributions[name].sample(rng, draws)
+        return np.full(draws, default, dtype=float)
+
+    if doubling_time is None:
+        doubling_time = default_doubling_time(p, distributions)
+    stages = p.mitigation_stages or []
+    return {
+        "hospitalized_rate": np.clip(
+            draw("hospitalized_rate", p.hospitalized.rate), 1e-5, 1.0),
+        "hospitalized_days": np.maximum(
+            1, np.rint(draw("hospitalized_days", p.hospitalized.days))).astype(int),
+        "doubling_time": np.maximum(draw("doubling_time", doubling_time), 1e-3),
+        "relative_contact_rate": np.clip(np.array([
+            draw("relative_contact_rate", rate) for (_, rate) in stages
+        ]).reshape(len(stages), draws), 0.0, 1.0),
+    }
+
+
+def simulate_draws(p: Parameters, inputs: Dict[str, np.ndarray]):
+    """Simulate every draw at once.
+
+    Returns (days, series): the calendar days relative to current_date,
+    from the earliest first-hospitalized day over the draws to n_days, and
+    a (draws x days) array for each of BAND_SERIES. A draw holds at its
+    initial state until its own first hospitalized day.
+    """
+    hospitalized_rate = inputs["hospitalized_rate"]
+    draws = len(hospitalized_rate)
+    gamma = 1.0 / p.infectious_days
+    infected = 1.0 / p.market_share / hospitalized_rate
+    susceptible = p.population - infected
+    recovered = np.full(draws, float(p.recovered))
+    growth_rate = get_growth_rate_array(inputs["doubling_time"])
+    beta = get_beta(growth_rate, gamma, susceptible, 0.0)
+    rates = {
+        "hospitalized": hospitalized_rate,
+        "icu": np.full(draws, p.icu.rate),
+        "ventilated": np.full(draws, p.ventilated.rate),
+    }
+    lengths_of_stay = {
+        "hospitalized": inputs["hospitalized_days"],
+        "icu": np.full(draws, p.icu.days),
+        "ventilated": np.full(draws, p.ventilated.days),
+    }
+
+    if p.date_first_hospitalized is not None and p.doubling_time is None:
+        i_day = np.full(draws, (p.current_date - p.date_first_hospitalized).days)
+    else:
+        # Back-project to the day the census matches current_hospitalized,
+        # as SimSirModel does for a single doubling time.
+        betas = np.repeat(beta[:, None], p.n_days, axis=1)
+        s, i, r = sim_sir_rows(susceptible, infected, recovered, gamma, betas)
+        census = _census(s, i, r, p.market_share, rates, lengths_of_stay)["census_hospitalized"]
+        peak_day = census.argmax(axis=1)
+        losses = (census - p.current_hospitalized) ** 2.0
+        losses[np.arange(census.shape[1])[None, :] >= peak_day[:, None]] = np.inf
+        i_day = losses.argmin(axis=1)
+
+    start_day = -int(i_day.max())
+    days = np.arange(start_day, p.n_days + 1)
+    stages = [
+        (-(p.current_date - mitigation_date).days,
+         get_beta(growth_rate, gamma, susceptible, contact_rate))
+        for (mitigation_date, _), contact_rate
+        in zip(p.mitigation_stages or [], inputs["relative_contact_rate"])
+    ]
+    betas = stage_betas(start_day, len(days) - 1, beta, stages, p.mitigation_ramp_days)
+    s, i, r = sim_sir_rows(
+        susceptible, infected, recovered, gamma, betas, -i_day - start_day)
+    return days, _census(s, i, r, p.market_share, rates, lengths_of_stay)
+
+
+def _census(s, i, r, market_share, rates, lengths_of_stay):
+    """Admits and census per disposition, as calculate_admits/calculate_census."""
+    ever_infected = i + r
+    series = {}
+    for key, rate in rates.items():
+        ever = ever_infected * rate[:, None] * market_share
+        admits = np.empty_like(ever)
+        admits[:, 0] = np.nan
+        admits[:, 1:] = ever[:, 1:] - ever[:, :-1]
+        cumulative = np.zeros_like(ever)
+        cumulative[:, 1:] = admits[:, 1:].cumsum(axis=1)
+        lagged = np.arange(ever.shape[1])[None, :] - lengths_of_stay[key][:, None]
+        census = cumulative - np.take_along_axis(
+            cumulative, np.maximum(lagged, 0), axis=1)
+        series["admits_" + key] = admits
+        series["census_" + key] = census
+    return series
+
+
+def run_ensemble(
+    p: Parameters,
+    distributions: Dict[str, Distribution],
+    draws: int,
+    seed: int = 0,
+    batch_size: int = ENSEMBLE_BATCH_SIZE,
+    sketch_size: int = ENSEMBLE_SKETCH_SIZE,
+    percentiles: Sequence[float] = ENSEMBLE_PERCENTILES,
+) -> pd.DataFrame:
+    """Percentile bands of census and admits over draws sampled projections.
+
+    Returns one row per day from current_date to the end of the
+    projection, with a "<series>_p<percentile>" column for each of
+    BAND_SERIES and each percentile.
+    """
+    rng = np.random.default_rng(seed)
+    sketch = QuantileSketch(sketch_size, seed)
+    width = p.n_days + 1
+    # Fitted once, not per batch, in date_first_hospitalized mode.
+    doubling_time = default_doubling_time(p, distributions)
+    for batch_start in range(0, draws, batch_size):
+        inputs = sample_inputs(
+            p, distributions, min(batch_size, draws - batch_start), rng, doubling_time)
+        days, series = simulate_draws(p, inputs)
+        # Keep current_date onwards, which every draw covers.
+        sketch.update(np.hstack([series[key][:, -width:] for key in BAND_SERIES]))
+    bands = sketch.quantiles(percentiles)
+    days = np.arange(0, width)
+    df = pd.DataFrame({
+        "day": days,
+        "date": [p.current_date + timedelta(days=int(d)) for d in days],
+    })
+    for k, key in enumerate(BAND_SERIES):
+        for q, band in zip(percentiles, bands):
+            df["%s_p%d" % (key, q)] = band[k * width:(k + 1) * width]
+    return df
@@ -9,7 +9,7 @@ from __future__ import annotations
 from datetime import date, datetime, timedelta
 from logging import INFO, basicConfig, getLogger
 from sys import stdout
-from typing import Dict, Generator, Tuple, Sequence, Optional
+from typing import Dict, Generator, Tuple, Sequence, Optional, Union
 
 import numpy as np
 import pandas as pd
@@ -70,18 +70,19 @@ class SimSirModel:
             self.update_beta(intrinsic_growth_rate)
 
             self.i_day = 0 # seed to the full length
-            raw = self.run_projection(p, [(self.beta, p.n_days)])
+            raw = self.run_projection(p, BetaSchedule.constant(self.beta, p.n_days))
             self.i_day = i_day = int(get_argmin_ds(raw["census_hospitalized"], p.current_hospitalized))
 
             if (p.current_date - timedelta(days=self.i_day)) > date(2020, 3, 20):
                 raise BadIdayError()
-            self.raw = self.run_projection(p, self.gen_policy(p))
+            self.raw = self.run_projection(p, self.gen_schedule(p))
 
             logger.info('Set i_day = %s', i_day)
-            p.date_first_hospitalized = p.current_date - timedelta(days=i_day)
+            self.doubling_time = p.doubling_time
+            self.date_first_hospitalized = p.current_date - timedelta(days=i_day)
             logger.info(
                 'Estimated date_first_hospitalized: %s; current_date: %s; i_day: %s',
-                p.date_first_hospitalized,
+                self.date_first_hospitalized,
                 p.current_date,
                 self.i_day)
 
@@ -112,13 +113,14 @@ class SimSirModel:
                 dts = np.linspace(dts[min_loss-1], dts[min_loss+1], 15)
                 min_loss = self.get_argmin_doubling_time(p, dts)
 
-            p.doubling_time = dts[min_loss]
+            self.doubling_time = dts[min_loss]
+            self.date_first_hospitalized = p.date_first_hospitalized
 
-            logger.info('Estimated doubling_time: %s', p.doubling_time)
+            logger.info('Estimated doubling_time: %s', self.doubling_time)
 
-            intrinsic_growth_rate = get_growth_rate(p.doubling_time)
+            intrinsic_growth_rate = get_growth_rate(self.doubling_time)
             self.update_beta(intrinsic_growth_rate)
-            self.raw = self.run_projection(p, self.gen_policy(p))
+            self.raw = self.run_projection(p, self.gen_schedule(p))
 
             self.population = p.population
         else:
@@ -177,7 +179,7 @@ class SimSirModel:
         self.admits_floor_df = build_floor_df(self.admits_df, p.dispositions.keys(), "admits_")
         self.census_floor_df = build_floor_df(self.census_df, p.dispositions.keys(), "census_")
 
-        self.daily_growth_rate = get_growth_rate(p.doubling_time)
+        self.daily_growth_rate = get_growth_rate(self.doubling_time)
         self.daily_growth_rate_t = [
             get_growth_rate(dt)
             for dt in self.doubling_time_t
@@ -204,7 +206,7 @@ class SimSirModel:
             intrinsic_growth_rate = get_growth_rate(i_dt)
             self.update_beta(intrinsic_growth_rate)
 
-            raw = self.run_projection(p, self.gen_policy(p))
+            raw = self.run_projection(p, self.gen_schedule(p))
 
             # Skip values the would put the fit past peak
             peak_admits_day = raw["admits_hospitalized"].argmax()
@@ -222,51 +224,31 @@ class SimSirModel:
 
     """
 
-    def gen_policy(self, p: Parameters) -> Sequence[Tuple[float, int]]:
-        #print(self.mitigation_stages)
+    def gen_schedule(self, p: Parameters) -> BetaSchedule:
+        """The per-day beta from the first hospitalized day to the end of the projection."""
         mitigation_days = [
             -(p.current_date - mitigation_date).days
             for (mitigation_date, _) in self.mitigation_stages
         ]
-        #print("MDs:", mitigation_days)
-        total_days = self.i_day + p.n_days
-        for i in range(len(mitigation_days)):
-            if mitigation_days[i] < -self.i_day:
-                raise ValueError("Mitigation days (%d) < -i_day (%d)."
-                                 % (mitigation_days[i], -self.i_day))
+        for day in mitigation_days:
             # Just don't allow mitigation dates earlier than the intitial date.
-            #if mitigation_days[i] < -self.i_day:
-            #    mitigation_days[i] = -self.i_day
-        previous_day = self.i_day
-        mitigation_days.insert(0, -previous_day)
-        #print("MDs:", mitigation_days)
-        assert len(self.beta_t) == len(mitigation_days)
-        mitigation_periods_lengths = pairwise_difference(mitigation_days)
-        days_remaining = total_days - sum(mitigation_periods_lengths)
-        assert days_remaining > 0
-        mitigation_periods_lengths.append(days_remaining)
-        #print("MPLs:", mitigation_periods_lengths)
-        days_sum = sum(mitigation_periods_lengths)
-        assert days_sum == total_days
-        mitigation_periods = [
-            previous_day + days for days in mitigation_periods_lengths
-        ]
-        #print("BETA:", self.beta_t)
-        #print("MPs:", mitigation_periods)
-        assert len(self.beta_t) == len(mitigation_periods)
-        assert len(self.beta_t) == len(mitigation_periods_lengths)
-        policy = list(zip(self.beta_t, mitigation_periods_lengths))
-        #print("POLICY:", policy)
-        return policy
-
-    def run_projection(self, p: Parameters, policy: Sequence[Tuple[float, int]]):
+            if day < -self.i_day:
+                raise ValueError("Mitigation days (%d) < -i_day (%d)."
+                                 % (day, -self.i_day))
+        assert len(self.beta_t) == len(mitigation_days) + 1
+        return BetaSchedule.stages(
+            -self.i_day, self.i_day + p.n_days, self.beta_t[0],
+            list(zip(mitigation_days, self.beta_t[1:])),
+            ramp_days=p.mitigation_ramp_days)
+
+    def run_projection(self, p: Parameters, schedule: BetaSchedule):
         raw = sim_sir(
             self.susceptible,
             self.infected,
             p.recovered,
             self.gamma,
             -self.i_day,
-            policy
+            schedule
         )
 
         calculate_dispositions(raw, self.rates, p.market_share)
@@ -276,10 +258,6 @@ class SimSirModel:
         return raw
 
 
-def pairwise_difference(items):
-    return [ b-a for (a,b) in zip(items[:-1], items[1:]) ]
-
-
 def get_loss(current_hospitalized, predicted) -> float:
     """Squared error: predicted vs. actual current hospitalized."""
     return (current_hospitalized - predicted) ** 2.0
@@ -313,6 +291,11 @@ def get_growth_rate(doubling_time: Optional[float]) -> float:
     return (2.0 ** (1.0 / doubling_time) - 1.0)
 
 
+def get_growth_rate_array(doubling_time: np.ndarray) -> np.ndarray:
+    """get_growth_rate over an array of (non-zero) doubling times."""
+    return 2.0 ** (1.0 / doubling_time) - 1.0
+
+
 def sir(
     s: float, i: float, r: float, beta: float, gamma: float, n: float
 ) -> Tuple[float, float, float]:
@@ -336,39 +319,103 @@ def sir(
     return s_n * scale, i_n * scale, r_n * scale
 
 
+class BetaSchedule:
+    """The transmission rate (beta) for each day of a projection.
+
+    betas[k] is the beta used to step from day k to day k + 1 (counting
+    from the first projected day). Build one with constant(), from_policy()
+    (the older (beta, n_days) tuples), stages() for mitigation stages that
+    take effect at once or ramp in, or directly from a per-day array.
+    """
+
+    def __init__(self, betas):
+        self.betas = np.asarray(betas, dtype=float)
+
+    def __len__(self):
+        return len(self.betas)
+
+    @classmethod
+    def constant(cls, beta: float, n_days: int) -> BetaSchedule:
+        return cls(np.full(n_days, beta))
+
+    @classmethod
+    def from_policy(cls, policy: Sequence[Tuple[float, int]]) -> BetaSchedule:
+        betas, days = zip(*policy) if policy else ((), ())
+        return cls(np.repeat(np.array(betas, dtype=float), days))
+
+    @classmethod
+    def stages(
+        cls,
+        start_day: int,
+        n_days: int,
+        initial_beta: float,
+        stages: Sequence[Tuple[int, float]],
+        ramp_days: int = 0,
+    ) -> BetaSchedule:
+        """A schedule for days start_day to start_day + n_days - 1.
+
+        stages are (day, beta) pairs in day order; each beta applies from
+        its day on. With ramp_days > 1, each stage moves linearly from the
+        previous beta to its own over that many days instead of at once.
+        Stages after the end of the projection have no effect.
+        """
+        return cls(stage_betas(start_day, n_days, initial_beta, stages, ramp_days))
+
+
+def stage_betas(start_day, n_days, initial_beta, stages, ramp_days=0):
+    """Per-day betas for mitigation stages (see BetaSchedule.stages).
+
+    initial_beta and the stage betas may be arrays of one value per
+    scenario, giving a (scenarios x n_days) array.
+    """
+    initial_beta = np.asarray(initial_beta, dtype=float)
+    betas = np.repeat(initial_beta[..., None], n_days, axis=-1)
+    for day, beta in stages:
+        beta = np.asarray(beta, dtype=float)[..., None]
+        k = day - start_day
+        if k >= n_days:
+            continue
+        previous = betas[..., k - 1:k] if k > 0 else initial_beta[..., None]
+        betas[..., max(k, 0):] = beta
+        if ramp_days > 1:
+            ramp = previous + (beta - previous) * np.arange(1, ramp_days + 1) / ramp_days
+            ramp = ramp[..., max(0, -k):max(0, n_days - k)]
+            betas[..., max(k, 0):max(k, 0) + ramp.shape[-1]] = ramp
+    return betas
+
+
 def sim_sir(
-    s: float, i: float, r: float, gamma: float, i_day: int, policies: Sequence[Tuple[float, int]]
+    s: float, i: float, r: float, gamma: float, i_day: int,
+    schedule: Union[BetaSchedule, Sequence[Tuple[float, int]]],
 ):
     """Simulate SIR model forward in time, returning a dictionary of daily arrays
-    Parameter order has changed to allow multiple (beta, n_days)
-    to reflect multiple changing social distancing policies.
+
+    schedule gives the beta for each day; a sequence of (beta, n_days)
+    policy tuples is still accepted.
     """
+    if not isinstance(schedule, BetaSchedule):
+        schedule = BetaSchedule.from_policy(schedule)
     s, i, r = (float(v) for v in (s, i, r))
     n = s + i + r
     d = i_day
 
-    total_days = 1
-    for beta, days in policies:
-        total_days += days
+    total_days = len(schedule) + 1
 
     d_a = np.empty(total_days, "int")
     s_a = np.empty(total_days, "float")
     i_a = np.empty(total_days, "float")
     r_a = np.empty(total_days, "float")
 
-    #print(total_days, sum(n for (b,n) in policies), policies)
     index = 0
-    for beta, n_days in policies:
-        for _ in range(n_days):
-            assert index < total_days
-            d_a[index] = d
-            s_a[index] = s
-            i_a[index] = i
-            r_a[index] = r
-            index += 1
-
-            s, i, r = sir(s, i, r, beta, gamma, n)
-            d += 1
+    for beta in schedule.betas.tolist():
+        d_a[index] = d
+        s_a[index] = s
+        i_a[index] = i
+        r_a[index] = r
+        index += 1
+
+        s, i, r = sir(s, i, r, beta, gamma, n)
+        d += 1
 
     d_a[index] = d
     s_a[index] = s
@@ -383,6 +430,33 @@ def sim_sir(
     }
 
 
+def sim_sir_rows(s, i, r, gamma: float, betas: np.ndarray, first_step=None):
+    """Simulate many scenarios at once, one row each.
+
+    s, i and r hold one initial value per row and betas one row of per-day
+    betas per scenario. A row holds its initial state until step
+    first_step (default 0). Returns the (rows x days) susceptible, infected
+    and recovered arrays, stepped exactly as sim_sir steps one scenario.
+    """
+    s, i, r = np.broadcast_arrays(*(np.asarray(v, dtype=float) for v in (s, i, r)))
+    n = s + i + r
+    steps = betas.shape[1]
+    betas = np.ascontiguousarray(betas.T)
+    s_a, i_a, r_a = (np.empty((steps + 1, len(s))) for _ in range(3))
+    for t in range(steps):
+        s_a[t], i_a[t], r_a[t] = s, i, r
+        s_n, i_n, r_n = sir(s, i, r, betas[t], gamma, n)
+        if first_step is None:
+            s, i, r = s_n, i_n, r_n
+        else:
+            active = t >= first_step
+            s = np.where(active, s_n, s)
+            i = np.where(active, i_n, i)
+            r = np.where(active, r_n, r)
+    s_a[steps], i_a[steps], r_a[steps] = s, i, r
+    return s_a.T, i_a.T, r_a.T
+
+
 def build_sim_sir_w_date_df(
     raw_df: pd.DataFrame,
     current_date: datetime,
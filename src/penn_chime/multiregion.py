@@ -0,0 +1,341 @@
+"""Multi-region projections.
+
+Regions that share every input except their population, market share and
+current hospitalized census are projected together: each region is one
+row of a single simulation, so a group of regions costs one pass over the
+days rather than one model per region. The date_first_hospitalized fit
+likewise simulates every candidate doubling time of every region at once.
+
+A derived region whose simulation would be that of the region it is
+derived from (the same population, seed and fit) is not simulated at all:
+its patient counts are that region's, scaled.
+"""
+
+from __future__ import annotations
+
+from datetime import date, timedelta
+from typing import Dict, List, NamedTuple, Optional, Sequence
+
+import numpy as np
+
+from .models import (
+    BadIdayError,
+    calculate_admits,
+    calculate_census,
+    calculate_dispositions,
+    get_argmin_ds,
+    get_beta,
+    get_growth_rate_array,
+    sim_sir_rows,
+    stage_betas,
+)
+from .parameters import Parameters
+
+# The date_first_hospitalized fit, as SimSirModel does it: a coarse pass
+# over this many doubling times from 1 to 15, then up to this many passes
+# refining around the best one.
+FIT_CANDIDATES = 15
+FIT_REFINEMENTS = 4
+# Fits kept by a FitCache.
+FIT_CACHE_ENTRIES = 100000
+
+
+class FitCache:
+    """Region fits shared by the models of a sweep.
+
+    Most permutations of a sweep repeat the inputs that determine a
+    region's fit (see MultiRegionModel.fit_key) and differ only in later
+    mitigation stages or other dispositions, so the fitted doubling time
+    (or i_day) is looked up here before fitting. The oldest entries are
+    dropped beyond max_entries.
+    """
+
+    def __init__(self, max_entries: int = FIT_CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self.fits: Dict[tuple, float] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.fits)
+
+    def get(self, key) -> float:
+        """The cached fit for key, or NaN."""
+        value = self.fits.get(key)
+        if value is None:
+            self.misses += 1
+            return np.nan
+        self.hits += 1
+        return value
+
+    def put(self, key, value: float):
+        if len(self.fits) >= self.max_entries:
+            del self.fits[next(iter(self.fits))]
+        self.fits[key] = value
+
+
+class ModelRegion(NamedTuple):
+    """One region of a MultiRegionModel.
+
+    A region with derived_from set takes the trajectory of the named
+    region, with its patient counts multiplied by derived_scale, when that
+    is exact: when the two have the same population, seed infected (so the
+    same market share) and fitted doubling time and i_day. Otherwise it is
+    simulated like any other region.
+    """
+
+    name: str
+    population: int
+    market_share: float
+    current_hospitalized: int
+    derived_from: Optional[str] = None
+    derived_scale: float = 1.0
+
+
+class MultiRegionModel:
+    """SimSirModel for several regions in one simulation.
+
+    p supplies every input the regions share; its own population, market
+    share and current_hospitalized are not used. raw holds one dict per
+    region, in region order, with the same arrays as SimSirModel.raw.
+    Fits found in fit_cache are reused rather than repeated.
+    """
+
+    def __init__(
+        self,
+        p: Parameters,
+        regions: Sequence[ModelRegion],
+        fit_cache: Optional[FitCache] = None,
+    ):
+        self.regions = list(regions)
+        self.names = [region.name for region in self.regions]
+        index = {name: k for k, name in enumerate(self.names)}
+
+        self.rates = {key: d.rate for key, d in p.dispositions.items()}
+        self.days = {key: d.days for key, d in p.dispositions.items()}
+        self.gamma = 1.0 / p.infectious_days
+        self.market_share = np.array(
+            [region.market_share for region in self.regions], dtype=float)
+        self.infected = 1.0 / self.market_share / p.hospitalized.rate
+        self.susceptible = np.array(
+            [region.population for region in self.regions], dtype=float) - self.infected
+        self.recovered = float(p.recovered)
+        current_hospitalized = np.array(
+            [region.current_hospitalized for region in self.regions], dtype=float)
+        self.mitigation_stages = p.mitigation_stages
+        self.stage_days = [
+            -(p.current_date - mitigation_date).days
+            for (mitigation_date, _) in p.mitigation_stages
+        ]
+
+        if p.date_first_hospitalized is None and p.doubling_time is not None:
+            doubling_time = np.full(len(self.regions), float(p.doubling_time))
+            i_day = self.cached_fit(
+                fit_cache,
+                [self.fit_key(p, region, p.doubling_time) for region in self.regions],
+                lambda rows: self.fit_i_day(p, doubling_time[rows], current_hospitalized, rows),
+            ).astype(int)
+            for d in i_day:
+                if (p.current_date - timedelta(days=int(d))) > date(2020, 3, 20):
+                    raise BadIdayError()
+        elif p.date_first_hospitalized is not None and p.doubling_time is None:
+            i_day = np.full(
+                len(self.regions), (p.current_date - p.date_first_hospitalized).days)
+            self.check_stage_days(i_day[0])
+            doubling_time = self.cached_fit(
+                fit_cache,
+                [self.fit_key(p, region, int(i_day[0])) for region in self.regions],
+                lambda rows: self.fit_doubling_time(p, i_day[0], current_hospitalized, rows),
+            )
+        else:
+            raise AssertionError('doubling_time or date_first_hospitalized must be provided.')
+
+        # A derived region is its base region scaled only when it would be
+        # simulated identically: the same population and seed (which depends
+        # on the market share) and the same fit. Otherwise it is simulated.
+        scaled = [
+            k for k, region in enumerate(self.regions)
+            if region.derived_from is not None
+            and self.is_scaled_copy(k, index[region.derived_from], doubling_time, i_day)]
+        simulated = [k for k in range(len(self.regions)) if k not in scaled]
+        self.market_share = self.market_share[simulated]
+        self.infected = self.infected[simulated]
+        self.susceptible = self.susceptible[simulated]
+
+        self.raw: List[Dict] = [None] * len(self.regions)
+        self.i_day = [int(d) for d in i_day]
+        self.doubling_time = [float(dt) for dt in doubling_time]
+        projections = self.project(p, doubling_time[simulated], i_day[simulated])
+        for k, raw in zip(simulated, projections):
+            self.raw[k] = raw
+        for k in scaled:
+            region = self.regions[k]
+            self.raw[k] = self.scale(self.raw[index[region.derived_from]], region.derived_scale)
+        self.date_first_hospitalized = [
+            p.current_date - timedelta(days=d) for d in self.i_day]
+
+    def is_scaled_copy(self, k, base, doubling_time, i_day):
+        """Whether region k's simulation would be region base's."""
+        return (
+            self.regions[base].derived_from is None
+            and self.susceptible[k] == self.susceptible[base]
+            and self.infected[k] == self.infected[base]
+            and doubling_time[k] == doubling_time[base]
+            and i_day[k] == i_day[base])
+
+    def stage_betas(self, growth_rate, rows, start_day, n_days, ramp_days):
+        """Per-day betas for scenario rows, each the region of that row."""
+        susceptible = self.susceptible[rows]
+        return stage_betas(
+            start_day, n_days,
+            get_beta(growth_rate, self.gamma, susceptible, 0.0),
+            [
+                (day, get_beta(growth_rate, self.gamma, susceptible, rate))
+                for day, (_, rate) in zip(self.stage_days, self.mitigation_stages)
+            ],
+            ramp_days)
+
+    def census_rows(self, s_a, i_a, r_a, rows, key="hospitalized"):
+        """calculate_census for each scenario row, one disposition."""
+        ever = (i_a + r_a) * self.rates[key] * self.market_share[rows][:, None]
+        admits = np.empty_like(ever)
+        admits[:, 0] = np.nan
+        admits[:, 1:] = ever[:, 1:] - ever[:, :-1]
+        los = self.days[key]
+        cumsum = np.empty((len(ever), ever.shape[1] + los))
+        cumsum[:, :los + 1] = 0.0
+        cumsum[:, los + 1:] = admits[:, 1:].cumsum(axis=1)
+        return cumsum[:, los:] - cumsum[:, :-los]
+
+    def fit_key(self, p, region, fit_input):
+        """Everything that determines a region's fit, as a FitCache key.
+
+        fit_input is the doubling time when fitting i_day and i_day when
+        fitting the doubling time; the latter fit only projects up to
+        current_date, so only the mitigation stages before it count.
+        """
+        key = (
+            region.population, region.market_share, region.current_hospitalized,
+            p.hospitalized, p.infectious_days, p.recovered, fit_input,
+        )
+        if p.doubling_time is not None:
+            return key + (p.n_days,)
+        return key + (p.mitigation_ramp_days, tuple(
+            (day, rate)
+            for day, (_, rate) in zip(self.stage_days, self.mitigation_stages)
+            if day < 0))
+
+    def cached_fit(self, fit_cache, keys, fit_rows):
+        """The fit of every region; fit_rows(rows) fits the given rows."""
+        if fit_cache is None:
+            return fit_rows(np.arange(len(keys)))
+        values = np.array([fit_cache.get(key) for key in keys], dtype=float)
+        missing = np.flatnonzero(np.isnan(values))
+        if len(missing):
+            values[missing] = fit_rows(missing)
+            for k in missing:
+                fit_cache.put(keys[k], values[k])
+        return values
+
+    def fit_i_day(self, p, doubling_time, current_hospitalized, rows):
+        """The day each region's census matches current_hospitalized."""
+        growth_rate = get_growth_rate_array(doubling_time)
+        betas = np.repeat(
+            get_beta(growth_rate, self.gamma, self.susceptible[rows], 0.0)[:, None],
+            p.n_days, axis=1)
+        s_a, i_a, r_a = sim_sir_rows(
+            self.susceptible[rows], self.infected[rows], self.recovered, self.gamma, betas)
+        census = self.census_rows(s_a, i_a, r_a, rows)
+        return np.array([
+            int(get_argmin_ds(census[j], current_hospitalized[k]))
+            for j, k in enumerate(rows)])
+
+    def fit_doubling_time(self, p, i_day, current_hospitalized, rows):
+        """The doubling time that best matches each region's census today."""
+        dts = np.tile(np.linspace(1, 15, FIT_CANDIDATES), (len(rows), 1))
+
+        def argmin_loss(fitting):
+            # Only the days up to current_date affect today's census.
+            scenario_rows = np.repeat(rows[fitting], FIT_CANDIDATES)
+            growth_rate = get_growth_rate_array(dts[fitting].ravel())
+            betas = self.stage_betas(
+                growth_rate, scenario_rows, -i_day, i_day, p.mitigation_ramp_days)
+            s_a, i_a, r_a = sim_sir_rows(
+                self.susceptible[scenario_rows], self.infected[scenario_rows],
+                self.recovered, self.gamma, betas)
+            predicted = self.census_rows(s_a, i_a, r_a, scenario_rows)[:, i_day]
+            losses = (current_hospitalized[scenario_rows] - predicted) ** 2.0
+            return np.nanargmin(losses.reshape(len(fitting), FIT_CANDIDATES), axis=1)
+
+        all_rows = np.arange(len(rows))
+        min_loss = argmin_loss(all_rows)
+        refining = np.ones(len(rows), dtype=bool)
+        for iteration in range(FIT_REFINEMENTS):
+            refining &= (min_loss - 1 >= 0) & (min_loss + 1 < FIT_CANDIDATES)
+            if not refining.any():
+                break
+            fitting = all_rows[refining]
+            dts[fitting] = np.linspace(
+                dts[fitting, min_loss[fitting] - 1], dts[fitting, min_loss[fitting] + 1],
+                FIT_CANDIDATES, axis=1)
+            min_loss[fitting] = argmin_loss(fitting)
+        return dts[all_rows, min_loss]
+
+    def check_stage_days(self, i_day):
+        for day in self.stage_days:
+            # Just don't allow mitigation dates earlier than the intitial date.
+            if day < -i_day:
+                raise ValueError("Mitigation days (%d) < -i_day (%d)." % (day, -i_day))
+
+    def project(self, p, doubling_time, i_day):
+        """The raw projection of every simulated region."""
+        first_day = -int(i_day.max())
+        for d in i_day:
+            self.check_stage_days(int(d))
+        rows = np.arange(len(i_day))
+        betas = self.stage_betas(
+            get_growth_rate_array(doubling_time), rows,
+            first_day, p.n_days - first_day, p.mitigation_ramp_days)
+        s_a, i_a, r_a = sim_sir_rows(
+            self.susceptible, self.infected, self.recovered, self.gamma, betas,
+            -i_day - first_day)
+        current_date = np.datetime64(p.current_date)
+        for k in rows:
+            start = -int(i_day[k]) - first_day
+            raw = {
+                "day": np.arange(-int(i_day[k]), p.n_days + 1),
+                "susceptible": s_a[k, start:],
+                "infected": i_a[k, start:],
+                "recovered": r_a[k, start:],
+            }
+            raw["ever_infected"] = raw["infected"] + raw["recovered"]
+            calculate_dispositions(raw, self.rates, self.market_share[k])
+            calculate_admits(raw, self.rates)
+            calculate_census(raw, self.days)
+            raw["date"] = raw["day"].astype("timedelta64[D]") + current_date
+            yield raw
+
+    def scale(self, raw, derived_scale):
+        """A derived region's raw: the base region's, patient counts scaled."""
+        scaled = dict(raw)
+        for key in self.rates:
+            for name in ("ever_" + key, key, "admits_" + key, "census_" + key):
+                scaled[name] = raw[name] * derived_scale
+        return scaled
+
+    def aggregate(self) -> Dict[str, np.ndarray]:
+        """Patient counts summed over every region, by day.
+
+        Covers the days from the earliest first hospitalized day of any
+        region; a region counts as zero before its own first day.
+        """
+        first_day = -max(self.i_day)
+        days = np.arange(first_day, self.raw[0]["day"][-1] + 1)
+        totals = {"day": days}
+        for key in self.rates:
+            for name in ("ever_" + key, "admits_" + key, "census_" + key):
+                total = np.zeros(len(days))
+                for raw in self.raw:
+                    total[raw["day"][0] - first_day:] += np.nan_to_num(raw[name])
+                totals[name] = total
+        return totals
@@ -88,6 +88,10 @@ ACCEPTED_PARAMETERS = {
     "relative_contact_rate": (
         Rate, None, float, "Social distancing reduction rate: 0.0 - 1.0"
     ),
+    "mitigation_ramp_days": (
+        Positive, 0, int,
+        "Days over which each mitigation stage's contact rate phases in (0 or 1: at once)"
+    ),
     "mitigation_date": (
         OptionalDate, None, cast_date, "Date on which social distancing measures too effect"
     ),
@@ -107,8 +111,53 @@ ACCEPTED_PARAMETERS = {
 }
 
 
+DEFAULT_PARAMETERS = {
+    key: default_value
+    for key, (validator, default_value, cast, help) in ACCEPTED_PARAMETERS.items()
+}
+
+LABELS = {
+    "hospitalized": "Hospitalized",
+    "icu": "ICU",
+    "ventilated": "Ventilated",
+    "day": "Day",
+    "date": "Date",
+    "susceptible": "Susceptible",
+    "infected": "Infected",
+    "recovered": "Recovered",
+}
+
+
+def validate_parameter(key, value):
+    """Run the validator of one accepted parameter."""
+    if key not in ACCEPTED_PARAMETERS:
+        raise ValueError(f"Unexpected parameter {key}")
+    validator = ACCEPTED_PARAMETERS[key][0]
+    try:
+        validator(value=value)
+    except (TypeError, ValueError) as ve:
+        raise ValueError(f"For parameter '{key}', with value '{value}', validation returned error \"{ve}\"")
+
+
+def _hashable(value):
+    """A hashable stand-in for a parameter value (lists become tuples)."""
+    if isinstance(value, list):
+        return tuple(_hashable(v) for v in value)
+    if isinstance(value, (Regions, dict)):
+        items = value.items() if isinstance(value, dict) else vars(value).items()
+        return tuple(sorted((k, _hashable(v)) for k, v in items))
+    return value
+
+
 class Parameters:
-    """Parameters."""
+    """Parameters.
+
+    Immutable: use replace() for a copy with some values changed. Instances
+    compare and hash by their parameter values, so they can be used as
+    cache keys, and pickle as a plain tuple of values.
+    """
+
+    __slots__ = tuple(ACCEPTED_PARAMETERS) + ("labels", "dispositions")
 
     def __init__(self, **kwargs):
         passed_and_default_parameters = {}
@@ -117,45 +166,88 @@ class Parameters:
                 raise ValueError(f"Unexpected parameter {key}")
             passed_and_default_parameters[key] = value
 
-        for key, (validator, default_value, cast, help) in ACCEPTED_PARAMETERS.items():
+        for key, default_value in DEFAULT_PARAMETERS.items():
             if key not in passed_and_default_parameters:
                 passed_and_default_parameters[key] = default_value
 
         for key, value in passed_and_default_parameters.items():
-            validator = ACCEPTED_PARAMETERS[key][0]
-            try:
-                validator(value=value)
-            except (TypeError, ValueError) as ve:
-                raise ValueError(f"For parameter '{key}', with value '{value}', validation returned error \"{ve}\"")
-            setattr(self, key, value)
+            validate_parameter(key, value)
+
+        self._init_validated(passed_and_default_parameters)
+        Date(value=self.current_date)
+        object.__setattr__(self, "labels", dict(LABELS))
+
+    @classmethod
+    def from_validated(cls, **kwargs):
+        """Parameters from values that are already known to be valid.
+
+        Skips the per-field validators, for callers that build many
+        instances from a parameter space validated once up front (see
+        aamc.params.validate_param_space). Missing parameters get their
+        defaults; the labels are shared, not copied.
+        """
+        self = cls.__new__(cls)
+        self._init_validated({ **DEFAULT_PARAMETERS, **kwargs })
+        object.__setattr__(self, "labels", LABELS)
+        return self
+
+    def _init_validated(self, parameters):
+        for key, value in parameters.items():
+            object.__setattr__(self, key, value)
 
         if self.region is  None and self.population is None:
             raise AssertionError('population or regions must be provided.')
 
         if self.current_date is None:
-            self.current_date = date.today()
-        Date(value=self.current_date)
-
-        self.labels = {
-            "hospitalized": "Hospitalized",
-            "icu": "ICU",
-            "ventilated": "Ventilated",
-            "day": "Day",
-            "date": "Date",
-            "susceptible": "Susceptible",
-            "infected": "Infected",
-            "recovered": "Recovered",
-        }
+            object.__setattr__(self, "current_date", date.today())
 
-        self.dispositions = {
+        object.__setattr__(self, "dispositions", {
             "hospitalized": self.hospitalized,
             "icu": self.icu,
             "ventilated": self.ventilated,
-        }
+        })
 
         if PRINT_PARAMS:
             self.print_params()
 
+    def replace(self, **changes):
+        """A copy with some parameters changed; only those are validated."""
+        for key, value in changes.items():
+            validate_parameter(key, value)
+        return self.from_validated(**{ **self.values(), **changes })
+
+    def values(self):
+        """All parameter values, keyed by name."""
+        return { key: getattr(self, key) for key in ACCEPTED_PARAMETERS }
+
+    def __setattr__(self, key, value):
+        raise AttributeError(f"Parameters are immutable; use replace({key}=...)")
+
+    def __delattr__(self, key):
+        raise AttributeError("Parameters are immutable")
+
+    def _key(self):
+        return tuple(_hashable(getattr(self, key)) for key in ACCEPTED_PARAMETERS)
+
+    def __eq__(self, other):
+        if not isinstance(other, Parameters):
+            return NotImplemented
+        return self._key() == other._key()
+
+    def __hash__(self):
+        return hash(self._key())
+
+    def __getstate__(self):
+        return tuple(getattr(self, key) for key in ACCEPTED_PARAMETERS)
+
+    def __setstate__(self, state):
+        self._init_validated(dict(zip(ACCEPTED_PARAMETERS, state)))
+        object.__setattr__(self, "labels", LABELS)
+
+    def __repr__(self):
+        return "Parameters(%s)" % ", ".join(
+            "%s=%r" % item for item in self.values().items())
+
     def to_dict(self):
         d = {
             "hospitalized": self.hospitalized,
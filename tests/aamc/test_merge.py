@@ -0,0 +1,87 @@
+import datetime
+import os
+
+import pandas as pd
+import pytest
+
+from aamc.merge import (
+    find_shard_manifests, merge_csv, merge_shards, write_shard_manifest,
+)
+from aamc.params import ParamSpace
+from aamc.policies import policy_table_path
+from penn_chime.parameters import Disposition
+
+
+REPORT_DATE = datetime.date(2020, 6, 1)
+
+
+def make_space():
+    regions = [{"region_name": "A"}, {"region_name": "B"}]
+    base = {"current_date": REPORT_DATE, "hosp_census_lookback": [3, 2, 1]}
+    stages = [[(datetime.date(2020, 4, 1), r / 100.0)] for r in range(0, 100, 10)]
+    return ParamSpace(
+        False, base, regions, [None], [.3], [None],
+        [Disposition(.01, 8)], [.1], [.8], [0, 7], stages)
+
+
+def write_shard(directory, space, index, count, view=None):
+    view = view or space.shard(index, count)
+    path = os.path.join(
+        directory, "PennModelFit_Combined_%s_1_%dof%d.csv" % (REPORT_DATE, index, count))
+    rows = [(g + k, g, p["region_name"])
+            for g in view.group_ids() for k, p in enumerate(view.group(g))]
+    pd.DataFrame(rows, columns=["param_set_id", "group_param_set_id", "region_name"]) \
+        .to_csv(path, index=False)
+    policy_ids = sorted(set(p["policy_id"] for p in view))
+    pd.DataFrame({"policy_id": policy_ids, "policy_str": [str(i) for i in policy_ids]}) \
+        .to_csv(policy_table_path(path), index=False)
+    write_shard_manifest(path, space, index, count)
+    return path
+
+
+def test_merge_csv(tmp_path):
+    paths = [str(tmp_path / name) for name in ["a.csv", "b.csv", "empty.csv", "c.csv"]]
+    for path, text in zip(paths, ["x,y\n1,2\n", "x,y\n3,4\n5,6\n", "", "x,y\n7,8\n"]):
+        with open(path, "w") as f:
+            f.write(text)
+    merge_csv(paths, str(tmp_path / "out.csv"))
+    with open(tmp_path / "out.csv") as f:
+        assert f.read() == "x,y\n1,2\n3,4\n5,6\n7,8\n"
+
+    with open(paths[1], "w") as f:
+        f.write("x,z\n3,4\n")
+    with pytest.raises(ValueError):
+        merge_csv(paths, str(tmp_path / "out.csv"))
+
+
+def test_merge_shards(tmp_path):
+    directory = str(tmp_path)
+    space = make_space()
+    for i in [3, 1, 2]:
+        write_shard(directory, space, i, 3)
+    manifests = find_shard_manifests(directory, REPORT_DATE)
+    assert [m["shard"] for m in manifests] == [1, 2, 3]
+
+    output_path = str(tmp_path / "PennModelFit_Combined_2020-06-01_2.csv")
+    merge_shards(manifests, output_path)
+    merged = pd.read_csv(output_path)
+    assert list(merged["param_set_id"]) == list(range(1, len(space) + 1))
+    policies = pd.read_csv(policy_table_path(output_path))
+    assert list(policies["policy_id"]) == list(range(1, 11))
+
+
+def test_merge_shards_checks_completeness(tmp_path):
+    directory = str(tmp_path)
+    space = make_space()
+    write_shard(directory, space, 1, 3)
+    write_shard(directory, space, 3, 3)
+    output_path = str(tmp_path / "out.csv")
+    with pytest.raises(ValueError, match="Missing shards 2 of 3"):
+        merge_shards(find_shard_manifests(directory, REPORT_DATE), output_path)
+
+    # A shard whose output lacks groups of its range is refused.
+    shard = space.shard(2, 3)
+    write_shard(directory, space, 2, 3, view=shard[:len(shard) - space.group_size])
+    with pytest.raises(ValueError, match="holds"):
+        merge_shards(find_shard_manifests(directory, REPORT_DATE), output_path)
+    assert not os.path.exists(output_path)
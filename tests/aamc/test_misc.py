@@ -0,0 +1,81 @@
+import io
+import threading
+
+import pandas as pd
+import pytest
+
+from aamc.misc import BackgroundWriter, concat_dataframes, write_dataframes
+
+
+def frames():
+    return [
+        pd.DataFrame({"a": [1, 2], "b": ["x", "y"]}, index=[0, 1]),
+        pd.DataFrame({"a": [3.5], "b": ["z"]}, index=[0]),
+    ]
+
+
+def test_concat_dataframes():
+    df = concat_dataframes(frames())
+    assert df.index.tolist() == [0, 1, 0]
+    assert df.a.dtype == float
+
+
+def test_write_dataframes_matches_concat():
+    expected = io.StringIO()
+    concat_dataframes(frames()).to_csv(expected)
+    written = io.StringIO()
+    write_dataframes(frames(), written)
+    assert written.getvalue() == expected.getvalue()
+
+    no_header = io.StringIO()
+    write_dataframes(frames(), no_header, header=False)
+    assert no_header.getvalue() == expected.getvalue().split("\n", 1)[1]
+
+    with pytest.raises(ValueError):
+        write_dataframes(frames() + [pd.DataFrame({"b": ["w"]})], io.StringIO())
+
+
+class BlockingSink(io.StringIO):
+    """A sink whose writes wait until released, or fail once told to."""
+
+    def __init__(self):
+        super().__init__()
+        self.released = threading.Event()
+        self.fail = False
+
+    def write(self, text):
+        self.released.wait(10)
+        if self.fail:
+            raise OSError("share unavailable")
+        return super().write(text)
+
+
+def test_background_writer_matches_write_dataframes():
+    expected = io.StringIO()
+    for i in range(5):
+        write_dataframes(frames(), expected, header=(i == 0))
+    sink = BlockingSink()
+    sink.released.set()
+    with BackgroundWriter(sink) as writer:
+        for i in range(5):
+            write_dataframes(frames(), writer, header=(i == 0))
+    assert sink.getvalue() == expected.getvalue()
+
+
+def test_background_writer_backpressure_and_errors():
+    sink = BlockingSink()
+    writer = BackgroundWriter(sink, max_pending=1)
+    write_dataframes(frames(), writer)  # taken by the writer, which waits
+    write_dataframes(frames(), writer)  # fills the queue
+    third = threading.Thread(target=write_dataframes, args=(frames(), writer))
+    third.start()
+    third.join(.2)
+    assert third.is_alive()  # waits for room in the queue
+    sink.fail = True
+    sink.released.set()
+    third.join(10)
+    with pytest.raises(OSError):
+        write_dataframes(frames(), writer)
+    with pytest.raises(OSError):
+        writer.close()
+    assert sink.getvalue() == ""
@@ -0,0 +1,40 @@
+import pandas as pd
+
+from aamc.optimize import (
+    Candidate, optimize_candidate, percentile_bands, sample_neighborhood,
+)
+from penn_chime.parameters import Disposition
+
+
+def quadratic(candidate):
+    target = (.2, .6, .45)
+    return sum((r - t) ** 2 for r, t in zip(candidate.rates, target)) \
+        + (candidate.hospitalized.days - 6) ** 2 / 100.0
+
+
+def test_optimize_candidate():
+    start = Candidate((.5, .5, .5), Disposition(.01, 8))
+    best, best_mse, scores = optimize_candidate(start, quadratic, max_evaluations=300)
+    assert abs(best_mse - .04) < 1e-5  # length of stay is not fitted
+    assert best.hospitalized == start.hospitalized
+    assert len(scores) <= 300
+
+    best, best_mse, _ = optimize_candidate(
+        start, quadratic, max_evaluations=400, fit_hospitalized=True)
+    assert best.hospitalized.days == 6
+    assert all(abs(r - t) < 1e-2 for r, t in zip(best.rates, (.2, .6, .45)))
+
+
+def test_sample_neighborhood_and_bands():
+    best = Candidate((.2, .6, .45), Disposition(.01, 6))
+    accepted = sample_neighborhood(
+        best, 1e-4, lambda c: (quadratic(c), c.rates[0]), samples=50, sigma=.005)
+    assert 0 < len(accepted) < 50
+
+    samples = pd.DataFrame({
+        "region": ["A"] * 5 + ["B"] * 5,
+        "value": [1, 2, 3, 4, 5, 10, 20, 30, 40, 50],
+    })
+    bands = percentile_bands(samples, ["region"], ["value"], [0, 50, 100])
+    assert list(bands.columns) == ["region", "value_p0", "value_p50", "value_p100"]
+    assert bands.value_p50.tolist() == [3, 30]
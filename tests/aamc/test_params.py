@@ -0,0 +1,218 @@
+import datetime
+import itertools
+
+import numpy as np
+import pytest
+
+from aamc.params import (
+    SAMPLE_LATIN_HYPERCUBE, SAMPLE_SOBOL, MitigationPolicySpace, ParamSpace,
+    RegionTable, SampledParamSpace, canonical_policy, generate_param_permutations,
+    get_model_params, validate_param_space,
+)
+from penn_chime.models import stage_betas
+from penn_chime.parameters import Disposition, Parameters
+
+
+REGIONS = [
+    {"region_name": "A", "population": 1000, "market_share": .5},
+    {"region_name": "B", "population": 2000, "market_share": .25},
+]
+
+STAGES = [
+    [(datetime.date(2020, 4, 1), r1), (datetime.date(2020, 4, 10), r2)]
+    for r1, r2 in itertools.product([.1, .2, .3], [.4, .5])
+]
+
+
+@pytest.fixture
+def space_args():
+    base = {"current_date": datetime.date(2020, 5, 1),
+            "hosp_census_lookback": [3, 2, 1],
+            "date_first_hospitalized": datetime.date(2020, 3, 12)}
+    return (
+        base, REGIONS, [2.0, 3.0], [.3], [datetime.date(2020, 4, 10)],
+        [Disposition(.01, 8), Disposition(.02, 8)], [.1], [.8], [0, 7],
+        STAGES,
+    )
+
+
+def test_param_space_matches_generator(space_args):
+    space = ParamSpace(False, *space_args)
+    expected = list(generate_param_permutations(False, *space_args))
+    assert len(space) == len(expected) == 2 * 2 * 6 * 2
+    assert list(space) == expected
+    assert space.get(17) == expected[16]
+    assert space[-1]["param_set_id"] == len(expected)
+
+
+def test_param_space_shares_lookback(space_args):
+    space = ParamSpace(False, *space_args)
+    assert space[0]["hosp_census_lookback"] is space[5]["hosp_census_lookback"]
+
+
+def test_param_space_groups_and_slices(space_args):
+    space = ParamSpace(True, *space_args)
+    assert space.group_size == 2
+    assert space.group_count == len(space) // 2
+    shard = space[4:10]
+    assert len(shard) == 6
+    assert list(shard.group_ids()) == [5, 7, 9]
+    group = shard.group(7)
+    assert [p["region_name"] for p in group] == ["A", "B"]
+    assert [p["param_set_id"] for p in group] == [7, 8]
+    assert len(list(shard.iter_groups())) == 3
+    with pytest.raises(IndexError):
+        space.get(len(space) + 1)
+
+
+def test_param_space_shards(space_args):
+    space = ParamSpace(True, *space_args)
+    shards = [space.shard(i, 5) for i in range(1, 6)]
+    assert [len(s) // space.group_size for s in shards] == [9, 10, 9, 10, 10]
+    assert [g for s in shards for g in s.group_ids()] == list(space.group_ids())
+    assert list(space.shard(1, 1)) == list(space)
+    with pytest.raises(IndexError):
+        space.shard(6, 5)
+
+
+def test_mitigation_policy_space_order():
+    dates = [datetime.date(2020, 4, d) for d in (1, 10, 20, 21)]
+    future = {.4: [(.4,), (.2, .2)], .5: [(.5,), (.25, .25)]}
+    policies = MitigationPolicySpace(
+        dates, [[.1, .2], [.4, .5]], future.__getitem__)
+    assert len(policies) == 8
+    combos = [pc + fs
+              for pc in itertools.product([.1, .2], [.4, .5])
+              for fs in future[pc[-1]]]
+    assert [policies.combination(i) for i in range(8)] == combos
+    assert policies[3] == list(zip(dates, combos[3]))
+    assert policies[-1] == policies[7]
+    with pytest.raises(IndexError):
+        policies[8]
+    assert policies.policy((.15, .4), 1) == list(zip(dates, (.15, .4, .2, .2)))
+
+
+def region_space(hospitalized=(Disposition(.02, 8),)):
+    regions = [
+        {"region_name": "A", "population": 1000, "market_share": .5,
+         "region_patient_share": .6, "hosp_pop_share": .4},
+        {"region_name": "B", "population": 2000, "market_share": .25,
+         "region_patient_share": .4, "hosp_pop_share": .6},
+        {"region_name": "C", "population": 2000, "market_share": .125,
+         "region_derived_from": "B", "region_derived_scale": .5,
+         "hosp_pop_share": .3},
+    ]
+    base = {"current_date": datetime.date(2020, 5, 1),
+            "hosp_census_lookback": [30, 20, 10],
+            "date_first_hospitalized": datetime.date(2020, 3, 12),
+            "icu_days": 9}
+    return ParamSpace(
+        False, base, regions, [2.0], [.3], [datetime.date(2020, 4, 10)],
+        list(hospitalized), [.5], [.8], [0, 2], STAGES)
+
+
+def test_region_table():
+    space = region_space()
+    table = RegionTable.from_space(space)
+    assert table.current_hospitalized == [[18, 12, 6], [6, 4, 2]]
+    assert table.current_dates == [datetime.date(2020, 5, 1), datetime.date(2020, 4, 29)]
+    assert table.scaled_from == [None, None, ("B", .5)]
+
+    p = get_model_params(space.get(len(space)), table)
+    assert p["current_date"] == datetime.date(2020, 4, 29)
+    assert p["current_hospitalized"] == 2
+    assert p["region"].population == 2000
+    assert p["icu"] == Disposition(.01, 9)
+    assert p["ventilated"] == Disposition(.008, 9)
+    assert not any(k.startswith("region_") for k in p)
+    assert "end_date_days_back" not in p and "icu_days" not in p
+    assert table.dispositions(Disposition(.02, 8), .5, .8, 9) is \
+        table.dispositions(Disposition(.02, 5), .5, .8, 9)
+
+
+def test_validate_param_space():
+    space = region_space()
+    table = RegionTable.from_space(space)
+    validate_param_space(space, table)
+    p = get_model_params(space.get(1), table)
+    fast, checked = Parameters.from_validated(**p), Parameters(**p)
+    assert fast == checked and fast.dispositions == checked.dispositions
+
+    bad = region_space([Disposition(.02, 8), Disposition(1.5, 8)])
+    with pytest.raises(ValueError, match="hospitalized"):
+        validate_param_space(bad, RegionTable.from_space(bad))
+
+
+def test_canonical_policy():
+    d = [datetime.date(2020, 4, n) for n in (1, 5, 9, 13)]
+    assert canonical_policy([(d[0], .2), (d[1], .2), (d[2], .5), (d[3], .5)]) == \
+        [(d[0], .2), (d[2], .5)]
+    # The one-stage and held three-stage future variants are the same policy.
+    held = [(d[0], .55), (d[1], .55)]
+    assert canonical_policy(held) == canonical_policy(held + [(d[2], .55), (d[3], .55)])
+    assert canonical_policy([]) == []
+
+
+@pytest.mark.parametrize("ramp_days", [0, 4])
+def test_canonical_policy_keeps_betas(ramp_days):
+    start = datetime.date(2020, 4, 1)
+
+    def betas(stages):
+        return stage_betas(
+            0, 20, .4, [((d - start).days, r) for d, r in stages], ramp_days)
+
+    d = [start + datetime.timedelta(days=n) for n in (1, 3, 9, 13)]
+    stages = [(d[0], .1), (d[1], .1), (d[2], .3), (d[3], .3)]
+    canonical = canonical_policy(stages, ramp_days)
+    assert np.array_equal(betas(canonical), betas(stages))
+    # A repeat 2 days into a 4-day ramp restarts it from mid-ramp; one 4
+    # days after the ramp's start, once it has finished, changes nothing.
+    assert len(canonical) == (2 if ramp_days <= 1 else 3)
+
+
+@pytest.mark.parametrize("method", [SAMPLE_LATIN_HYPERCUBE, SAMPLE_SOBOL])
+def test_sampled_param_space(method):
+    policies = MitigationPolicySpace(
+        [datetime.date(2020, 4, 1), datetime.date(2020, 4, 10), datetime.date(2020, 5, 8)],
+        [[.1, .2, .3], [.4, .5]], lambda rate: [(rate,), (.2,), (.2,)])
+    hospitalized = [Disposition(.01, 6), Disposition(.02, 9)]
+    regions = region_space()
+    grid = ParamSpace(
+        False, regions.base_params, regions.regions, [2.0], [.3],
+        [datetime.date(2020, 4, 10)], hospitalized, [.1, .3], [.8], [0, 2], policies)
+    space = SampledParamSpace.from_grid(grid, 16, method, seed=3)
+    assert space.sample_count == 16
+    assert len(space) == 16 * 3 * 2 * 3
+    assert space.describe().endswith("samples=16")
+    assert list(SampledParamSpace.from_grid(grid, 16, method, seed=3)) == list(space)
+
+    samples = [space.group(g) for g in space.group_ids()]
+    for group in samples:
+        a, b, c = group
+        assert [p["region_name"] for p in group] == ["A", "B", "C"]
+        for key in ("hospitalized", "relative_icu_rate", "mitigation_stages", "policy_id"):
+            assert a[key] == b[key]
+        (d1, r1), (d2, r2), (d3, r3) = a["mitigation_stages"]
+        assert .1 <= r1 <= .3 and .4 <= r2 <= .5 and r3 in (r2, .2)
+        assert .01 <= a["hospitalized"].rate <= .02
+        assert a["hospitalized"].days in (6, 7, 8, 9)
+        assert .1 <= a["relative_icu_rate"] <= .3 and a["relative_vent_rate"] == .8
+    # Each sample keeps its values across future variants and end dates.
+    first = samples[0][0]
+    same = [g[0] for g in samples
+            if g[0]["mitigation_stages"][:2] == first["mitigation_stages"][:2]]
+    assert len(same) == 3 * 2
+    assert all(p["hospitalized"] == first["hospitalized"] for p in same)
+    # The last two future variants are the same policy.
+    assert len(set(g[0]["policy_id"] for g in samples)) == 16 * 2
+    if method == SAMPLE_LATIN_HYPERCUBE:
+        # One sample in each sixteenth of each range.
+        first_rates = sorted(r for (d, r) in
+                             (g[0]["mitigation_stages"][0] for g in samples[:48:3]))
+        strata = [int((r - .1) / .2 * 16 - 1e-9) for r in first_rates]
+        assert strata == list(range(16))
+
+    validate_param_space(space, RegionTable.from_space(space))
+    shard = space[12:24]
+    assert isinstance(shard, SampledParamSpace)
+    assert shard.group(16) == space.group(16)
@@ -0,0 +1,40 @@
+import datetime
+
+from aamc.params import ParamSpace
+from aamc.plan import SweepPlan, rows_per_group, PLAN_OK, PLAN_WARN, PLAN_REFUSE
+from penn_chime.parameters import Disposition
+
+
+def make_space(use_doubling_time=False):
+    base = {"current_date": datetime.date(2020, 5, 1), "n_days": 14,
+            "date_first_hospitalized": datetime.date(2020, 3, 12)}
+    regions = [{"region_name": "A"}, {"region_name": "B"}]
+    stages = [[(datetime.date(2020, 4, 1), r)] for r in (.1, .2, .3)]
+    return ParamSpace(
+        use_doubling_time, base, regions, [2.0], [.3], [None],
+        [Disposition(.01, 8)], [.1], [.8], [0, 10], stages)
+
+
+def test_rows_per_group():
+    # 50 days from 2020-03-12 to 2020-05-01, 40 with 10 days back.
+    assert rows_per_group(make_space()) == 2 * ((50 + 14) + (40 + 14)) / 2
+    assert rows_per_group(make_space(use_doubling_time=True)) is None
+
+
+def test_sweep_plan_verdicts():
+    space = make_space()
+    plan = SweepPlan(space, 100, 60.0, 200, budget_hours=1)
+    assert plan.group_count == 6
+    assert plan.output_rows == 600
+    assert plan.output_bytes == 120000
+    assert plan.wall_seconds == 360
+    assert plan.verdict == PLAN_OK
+    assert SweepPlan(space, 100, 500.0, 200, budget_hours=1).verdict == PLAN_WARN
+    assert SweepPlan(space, 100, 700.0, 200, budget_hours=1).verdict == PLAN_REFUSE
+    assert "Groups:" in str(plan)
+
+    # Shared by a work queue, the time and verdict are per host.
+    shared = SweepPlan(space, 100, 700.0, 200, budget_hours=1, hosts=3)
+    assert shared.wall_seconds == 1400
+    assert shared.verdict == PLAN_OK
+    assert "over 3 hosts" in str(shared)
@@ -0,0 +1,50 @@
+import datetime
+
+from aamc.params import MitigationPolicySpace, ParamSpace
+from aamc.policies import PolicyTable, policy_table_path, summarize_mitigation_policy
+from penn_chime.parameters import Disposition
+
+
+REPORT_DATE = datetime.date(2020, 4, 15)
+DATES = [datetime.date(2020, 4, d) for d in (1, 10, 20)]
+
+
+def policy_space():
+    # The second and third future variants are the same.
+    future = lambda rate: [(rate,), (.2,), (.2,)]
+    return MitigationPolicySpace(DATES, [[.1, .3], [.4, .5]], future)
+
+
+def test_grid_policy_ids():
+    policies = policy_space()
+    assert [policies.first_index(i) for i in range(6)] == [0, 1, 1, 3, 4, 4]
+
+    space = ParamSpace(
+        False, {"current_date": REPORT_DATE}, [{"region_name": "A"}],
+        [2.0], [.3], [DATES[0]], [Disposition(.01, 8)], [.1], [.8], [0],
+        policies)
+    ids = [space.get(i)["policy_id"] for i in range(1, len(space) + 1)]
+    assert ids == [1, 2, 2, 4, 5, 5, 7, 8, 8, 10, 11, 11]
+
+
+def test_policy_table():
+    table = PolicyTable(REPORT_DATE, grid_policy_count=12)
+    stages = [(DATES[0], .1), (DATES[1], .4), (DATES[2], .2)]
+    assert table.intern(stages, 2) == 2
+    assert table.intern(stages, 2) == 2
+    off_grid = [(DATES[0], .15), (DATES[1], .4)]
+    assert table.intern(off_grid) == 13
+    assert table.intern(list(off_grid)) == 13
+    assert table.intern(off_grid + [(DATES[2], .3)]) == 14
+    assert len(table) == 3
+
+    df = table.to_dataframe()
+    assert list(df.policy_id) == [2, 13, 14]
+    summary = dict(summarize_mitigation_policy(REPORT_DATE, stages))
+    row = df.iloc[0]
+    assert row.policy_str == "2020-04-01:0.100000;2020-04-10:0.400000;2020-04-20:0.200000"
+    assert row.future_str == "2020-04-20:0.200000"
+    assert row.past_policy_hash == summary["past_policy_hash"]
+
+    assert policy_table_path("out/PennModelFit_Combined_2020-05-24_1.csv") == \
+        "out/PennModelFit_Policies_2020-05-24_1.csv"
@@ -0,0 +1,41 @@
+from aamc.reporting import BestSoFar, Deadline, ProgressReporter
+
+
+def test_progress_is_rate_limited(tmp_path):
+    now = [0.0]
+    path = str(tmp_path / "PROGRESS.txt")
+    progress = ProgressReporter(100, path=path, interval=1.0, clock=lambda: now[0])
+
+    assert progress.update(1)
+    now[0] = 0.5
+    assert not progress.update(2)
+    now[0] = 1.5
+    assert progress.update(3)
+    assert open(path).read().startswith("PROGRESS: 3/100 (3.0%)")
+
+    now[0] = 1.6
+    assert progress.update(100)  # completion is always reported
+    assert open(path).read().startswith("PROGRESS: 100/100")
+    assert not (tmp_path / "PROGRESS.txt.tmp").exists()
+
+
+def test_deadline_leaves_time_for_the_slowest_group():
+    now = [0.0]
+    deadline = Deadline(10.0, clock=lambda: now[0])
+    assert not deadline.expired()
+    now[0] = 4.0   # a 4 second group
+    assert not deadline.expired()
+    now[0] = 5.0
+    assert not deadline.expired()
+    now[0] = 6.5   # 3.5 seconds left, less than the slowest group
+    assert deadline.expired()
+
+
+def test_best_so_far(tmp_path):
+    path = str(tmp_path / "BEST.txt")
+    best = BestSoFar(path)
+    assert best.update(5, 10.0)
+    assert not best.update(6, 12.0)
+    assert not best.update(7, float("nan"))
+    assert best.update(8, 3.0)
+    assert open(path).read() == "BEST SO FAR: group 8, MSE = 3.0 (4 groups evaluated)\n"
@@ -0,0 +1,58 @@
+import numpy as np
+import pandas as pd
+
+from aamc.scoring import CensusTarget, SCORED_COLUMNS
+
+
+def census_df():
+    dates = pd.date_range("2020-04-01", periods=10, freq="D")
+    df = pd.DataFrame({
+        a: np.arange(10, dtype=float) * (k + 1) for k, (a, p) in enumerate(SCORED_COLUMNS)
+    }, index=dates)
+    df.iloc[0, 0] = np.nan  # dropped
+    return df
+
+
+def projection(start, days, scale):
+    raw = {"date": np.datetime64(start) + np.arange(days).astype("timedelta64[D]")}
+    for k, (a, p) in enumerate(SCORED_COLUMNS):
+        raw[p] = np.arange(days, dtype=float) * scale * (k + 1)
+    return raw
+
+
+def test_score_matches_pandas():
+    hosp_census_df = census_df()
+    target = CensusTarget(hosp_census_df)
+    assert len(target) == 9
+
+    raws = [ projection("2020-03-30", 8, .5), projection("2020-03-30", 8, .25) ]
+    actual, predicted, mse = target.score([ target.match(r) for r in raws ])
+
+    # The same score computed from DataFrames, as compute_error used to.
+    hosp_dates = hosp_census_df.dropna().index
+    frames = []
+    for raw in raws:
+        df = pd.DataFrame(raw).iloc[1:].set_index("date")
+        frames.append(df.loc[df.index.intersection(hosp_dates)])
+    predict_df = pd.concat(frames).resample("D").sum()
+    actual_df = hosp_census_df.loc[predict_df.index]
+    expected = [
+        round(((actual_df[a] - predict_df[p]) ** 2).mean(), 2)
+        for a, p in SCORED_COLUMNS
+    ]
+    assert actual.shape == (3, len(predict_df))
+    assert mse == expected
+
+
+def test_score_window():
+    target = CensusTarget(census_df())
+    matches = [ target.match(projection("2020-03-30", 8, .5)) ]
+    _, predicted, mse = target.score(matches)
+    assert predicted.shape[1] == 5
+    _, predicted, window_mse = target.score(
+        matches, (pd.Timestamp("2020-04-04"), pd.Timestamp("2020-04-05")))
+    assert predicted.shape[1] == 2
+    assert window_mse != mse
+    _, predicted, empty_mse = target.score(
+        matches, (pd.Timestamp("2020-05-01"), pd.Timestamp("2020-05-02")))
+    assert predicted.shape[1] == 0 and np.isnan(empty_mse).all()
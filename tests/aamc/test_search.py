@@ -0,0 +1,127 @@
+import datetime
+
+import pandas as pd
+
+from aamc.params import MitigationPolicySpace, ParamSpace
+from aamc.policies import mitigation_policy_tostring, policy_table_path
+from aamc.search import (
+    adaptive_search, coarse_to_fine_order, group_id_at, latest_output_path,
+    load_previous_fits, point_of_group, search_dimensions, warm_search,
+    warm_start_point,
+)
+from penn_chime.parameters import Disposition
+
+
+def make_space(end_date_days_back=(0,)):
+    dates = [datetime.date(2020, 4, 1), datetime.date(2020, 5, 1),
+             datetime.date(2020, 6, 1)]
+    rates = [[r / 100.0 for r in range(0, 100, 5)],
+             [r / 100.0 for r in range(0, 100, 10)]]
+    future = {r: [(r,), (.2,), (r / 2,)] for r in rates[-1]}
+    policies = MitigationPolicySpace(dates, rates, future.__getitem__)
+    regions = [{"region_name": "A"}, {"region_name": "B"}]
+    return ParamSpace(
+        False, {}, regions, [None], [.3], [None],
+        [Disposition(.01, 8)], [.1], [.8], list(end_date_days_back), policies)
+
+
+def test_group_id_round_trip():
+    space = make_space()
+    assert [d.size for d in search_dimensions(space)] == [1, 1, 1, 1, 1, 1, 1, 20, 10, 3]
+    for group_param_set_id in space.group_ids()[::7]:
+        point = point_of_group(space, group_param_set_id)
+        assert group_id_at(space, point) == group_param_set_id
+
+
+def test_adaptive_search_finds_minimum():
+    space = make_space(end_date_days_back=(0, 7))
+    target = {0: (.65, .3, 2), 7: (.15, .8, 1)}
+
+    def evaluate(group_param_set_id):
+        p = space.get(group_param_set_id)
+        r1, r2, r3 = [r for (d, r) in p["mitigation_stages"]]
+        t1, t2, future = target[p["end_date_days_back"]]
+        future_index = space.coordinates(group_param_set_id)[7] % 3
+        return (r1 - t1) ** 2 + (r2 - t2) ** 2 + (future_index != future)
+
+    scores = adaptive_search(space, evaluate)
+    for days_back in (0, 7):
+        best = min((g for g in scores if space.get(g)["end_date_days_back"] == days_back),
+                   key=scores.get)
+        assert scores[best] < 1e-9
+    assert len(scores) < space.group_count / 4
+
+
+def quadratic(space, t1, t2):
+    def evaluate(group_param_set_id):
+        p = space.get(group_param_set_id)
+        r1, r2, r3 = [r for (d, r) in p["mitigation_stages"]]
+        return (r1 - t1) ** 2 + (r2 - t2) ** 2
+    return evaluate
+
+
+def test_warm_search_stays_local():
+    space = make_space()
+    evaluate = quadratic(space, .65, .3)
+    start = point_of_group(space, space.group_ids()[0])
+    start[7:9] = [12, 2]
+    scores = warm_search(space, evaluate, [start], baseline_mse=0.0)
+    assert min(scores.values()) < 1e-9
+    assert len(scores) < 30
+
+    # The best fit has moved to another basin: fall back to the grid.
+    near, far = quadratic(space, .65, .3), quadratic(space, .05, .9)
+    evaluate = lambda group_param_set_id: min(
+        near(group_param_set_id) + .5, far(group_param_set_id))
+    scores = warm_search(space, evaluate, [start], baseline_mse=.4, tolerance=.5)
+    assert len(scores) < 30
+    scores = warm_search(space, evaluate, [start], baseline_mse=.4, tolerance=.1)
+    assert len(scores) == space.group_count
+    assert min(scores.values()) < 1e-9
+    scores = warm_search(space, evaluate, [start], baseline_mse=.4, tolerance=None)
+    assert min(scores.values()) >= .5
+    assert len(warm_search(space, evaluate, [])) == space.group_count
+
+
+def test_warm_start_from_previous_output(tmp_path):
+    space = make_space()
+    previous = [(datetime.date(2020, 3, 25), .5), (datetime.date(2020, 4, 20), .62),
+                (datetime.date(2020, 5, 1), .33)]
+    rows = []
+    for group_param_set_id, mse, policy_id in [(1, 3.0, 1), (3, 1.0, 2), (5, 2.0, 1)]:
+        for region_name in ("A", "B"):
+            rows.append(dict(
+                date="2020-06-01", region_name=region_name,
+                group_param_set_id=group_param_set_id, policy_id=policy_id, mse=mse,
+                hospitalized_rate=.01, hospitalized_days=8, icu_rate=.001,
+                ventilated_rate=.0008))
+    output_path = str(tmp_path / "PennModelFit_Combined_2020-06-01_20200601060000.csv")
+    pd.DataFrame(rows).to_csv(output_path, index=False)
+    assert latest_output_path(str(tmp_path), datetime.date(2020, 6, 1)) is None
+    pd.DataFrame({
+        "policy_id": [1, 2],
+        "past_str": [mitigation_policy_tostring(previous[:1]),
+                     mitigation_policy_tostring(previous)],
+    }).to_csv(policy_table_path(output_path), index=False)
+    assert latest_output_path(str(tmp_path), datetime.date(2020, 6, 2)) == output_path
+    assert latest_output_path(str(tmp_path), datetime.date(2020, 5, 31)) is None
+
+    fits = load_previous_fits(output_path, top_k=2)
+    assert list(fits["group_param_set_id"]) == [3, 5]
+    point = warm_start_point(space, fits.iloc[0])
+    # Stages on 4/1 and 5/1 take the rates in effect on those dates.
+    assert point[7:] == [10, 3, 0]
+    assert point[:7] == [0] * 7
+    # A stage before any previous one starts in the middle.
+    assert warm_start_point(space, fits.iloc[1])[7:] == [10, 5, 0]
+
+
+def test_coarse_to_fine_order():
+    space = make_space()
+    order = coarse_to_fine_order(space)
+    assert sorted(order) == list(space.group_ids())
+    # Both ends of both stage axes, with every future variant, come first.
+    first = [point_of_group(space, g)[7:] for g in order[:12]]
+    assert sorted(first) == sorted(
+        [i, j, f] for i in (0, 19) for j in (0, 9) for f in range(3))
+    assert point_of_group(space, order[12])[7:9] in ([0, 8], [16, 0])
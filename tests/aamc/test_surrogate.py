@@ -0,0 +1,45 @@
+import datetime
+
+import pytest
+
+from aamc.params import MitigationPolicySpace, ParamSpace
+from aamc.surrogate import surrogate_search
+from penn_chime.parameters import Disposition
+
+pytest.importorskip("sklearn")
+
+
+def make_space():
+    dates = [datetime.date(2020, 4, 1), datetime.date(2020, 5, 1),
+             datetime.date(2020, 6, 1)]
+    rates = [[r / 100.0 for r in range(0, 100, 2)],
+             [r / 100.0 for r in range(0, 100, 4)]]
+    future = {r: [(r,), (.2,)] for r in rates[-1]}
+    policies = MitigationPolicySpace(dates, rates, future.__getitem__)
+    hospitalized = [Disposition(rate / 1000.0, days)
+                    for rate in (6, 8, 10, 12) for days in (6, 8, 10)]
+    return ParamSpace(
+        False, {}, [{"region_name": "A"}], [None], [.3], [None],
+        hospitalized, [.1], [.8], [0, 7], policies)
+
+
+# Partitions hold 30000 grid points: ranked in full, or by a sample.
+@pytest.mark.parametrize("pool_points", [100000, 5000])
+def test_surrogate_search_finds_minimum(pool_points):
+    space = make_space()
+    target = {0: (.66, .28), 7: (.14, .8)}
+
+    def evaluate(group_param_set_id):
+        p = space.get(group_param_set_id)
+        r1, r2, r3 = [r for (d, r) in p["mitigation_stages"]]
+        t1, t2 = target[p["end_date_days_back"]]
+        return 1000 * ((r1 - t1) ** 2 + (r2 - t2) ** 2 + (r3 - .2) ** 2) \
+            + (p["hospitalized"].days - 8) ** 2
+
+    scores = surrogate_search(
+        space, evaluate, sample_groups=300, candidates=100, pool_points=pool_points)
+    for days_back in (0, 7):
+        best = min((g for g in scores if space.get(g)["end_date_days_back"] == days_back),
+                   key=scores.get)
+        assert scores[best] < 1e-9
+    assert len(scores) < space.group_count / 20
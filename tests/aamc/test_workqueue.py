@@ -0,0 +1,109 @@
+import datetime
+import multiprocessing
+import os
+import time
+
+import pandas as pd
+import pytest
+
+from aamc import workqueue
+from aamc.params import ParamSpace
+from aamc.policies import policy_table_path
+from aamc.reporting import write_file_atomic
+from aamc.workqueue import WorkQueue
+from penn_chime.parameters import Disposition
+
+
+def make_space():
+    regions = [{"region_name": "A"}, {"region_name": "B"}]
+    base = {"current_date": datetime.date(2020, 6, 1), "hosp_census_lookback": [3, 2, 1]}
+    stages = [[(datetime.date(2020, 4, 1), r / 100.0)] for r in range(0, 100, 5)]
+    return ParamSpace(
+        False, base, regions, [None], [.3], [None],
+        [Disposition(.01, 8)], [.1], [.8], [0, 7], stages)
+
+
+def run_range(view, part_path, seconds=0):
+    time.sleep(seconds)
+    rows = [(p["param_set_id"], p["region_name"]) for p in view]
+    pd.DataFrame(rows, columns=["param_set_id", "region_name"]).to_csv(part_path, index=False)
+    policy_ids = sorted(set(p["policy_id"] for p in view))
+    pd.DataFrame({"policy_id": policy_ids, "policy_str": [str(i) for i in policy_ids]}) \
+        .to_csv(policy_table_path(part_path), index=False)
+
+
+def work(directory):
+    queue = WorkQueue(directory, heartbeat_secs=.05, lease_timeout_secs=5, poll_secs=.02)
+    queue.attach(make_space(), wait_secs=30)
+    return queue.run_worker(make_space(), lambda view, path: run_range(view, path, .2))
+
+
+def test_workers_share_the_sweep(tmp_path):
+    directory = str(tmp_path / "queue")
+    space = make_space()
+    with multiprocessing.get_context("spawn").Pool(3) as pool:
+        workers = pool.map_async(work, [directory] * 3)
+        queue = WorkQueue.publish(directory, space, range_groups=3, poll_secs=.02)
+        assert len(queue.ranges) == 14
+        ranges_run = workers.get(60)
+    assert sum(ranges_run) == 14
+    assert sorted(ranges_run)[-2] > 0  # the work was shared
+    assert queue.run_worker(space, run_range) == 0
+    assert os.listdir(os.path.join(directory, "leases")) == []
+
+    output_path = str(tmp_path / "PennModelFit_Combined_2020-06-01_1.csv")
+    queue.merge(output_path)
+    merged = pd.read_csv(output_path)
+    assert list(merged["param_set_id"]) == list(range(1, len(space) + 1))
+    policies = pd.read_csv(policy_table_path(output_path))
+    assert list(policies["policy_id"]) == list(range(1, 21))
+
+    # Publishing the same sweep again resumes it; a different one is refused.
+    assert WorkQueue.publish(directory, space, range_groups=3).all_done()
+    with pytest.raises(ValueError):
+        WorkQueue.publish(directory, space[:20], range_groups=3)
+
+
+def test_stale_lease_is_taken_over(tmp_path):
+    directory = str(tmp_path / "queue")
+    space = make_space()
+    dead = WorkQueue.publish(directory, space, range_groups=20, worker="dead")
+    assert dead.claim() == 0
+    live = WorkQueue(directory, worker="live", lease_timeout_secs=.2, poll_secs=.05)
+    live.attach(space)
+    assert live.claim() == 1
+    assert live.claim() is None  # range 0 is leased, and not yet seen to be stale
+    live.release(1)
+
+    assert live.run_worker(space, run_range) == 2
+    assert live.all_done() and not dead.holds(0)
+    assert not dead.beat(0, 1)
+
+
+def test_beat_after_takeover_keeps_one_holder(tmp_path, monkeypatch):
+    directory = str(tmp_path / "queue")
+    space = make_space()
+    slow = WorkQueue.publish(directory, space, range_groups=20, worker="slow")
+    assert slow.claim() == 0
+    taker = WorkQueue(directory, worker="taker")
+    taker.attach(space)
+
+    # The lease is taken over just after the slow worker checked it.
+    checks = iter([True])
+    holds = slow.holds
+    slow.holds = lambda k: next(checks, None) or holds(k)
+    assert taker._break_lease(0) and taker._create_lease(0)
+    assert slow.beat(0, 1)
+    assert not taker.beat(0, 1)
+    assert slow.holds(0) and not taker.holds(0)
+    assert os.listdir(os.path.join(directory, "leases")) == ["00000.lease"]
+
+    # The lease is taken over just after the slow worker wrote it.
+    def write_then_take_over(path, text, **kwargs):
+        write_file_atomic(path, text, **kwargs)
+        assert taker._break_lease(0) and taker._create_lease(0)
+
+    slow.holds = holds
+    monkeypatch.setattr(workqueue, "write_file_atomic", write_then_take_over)
+    assert not slow.beat(0, 2)
+    assert taker.holds(0)
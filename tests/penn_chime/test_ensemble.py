@@ -0,0 +1,93 @@
+from datetime import date
+
+import numpy as np
+import pytest
+
+import src.penn_chime.ensemble as ensemble
+from src.penn_chime.ensemble import (
+    Distribution, QuantileSketch, run_ensemble,
+)
+from src.penn_chime.models import SimSirModel
+from src.penn_chime.parameters import Parameters, Disposition
+
+
+def make_params(**kwargs):
+    values = dict(
+        current_date=date(2020, 3, 28),
+        current_hospitalized=100,
+        doubling_time=6.0,
+        market_share=0.05,
+        mitigation_stages=[(date(2020, 3, 20), 0.3), (date(2020, 4, 5), 0.5)],
+        relative_contact_rate=0.3,
+        population=500000,
+        hospitalized=Disposition(0.05, 7),
+        icu=Disposition(0.02, 9),
+        ventilated=Disposition(0.01, 10),
+        n_days=30,
+    )
+    values.update(kwargs)
+    return Parameters(**values)
+
+
+def test_distribution_parse():
+    assert Distribution.parse("0.05").sample(np.random.default_rng(), 3).tolist() == [0.05] * 3
+    d = Distribution.parse("uniform:2,3")
+    assert d.kind == "uniform" and d.args == (2.0, 3.0)
+    with pytest.raises(ValueError):
+        Distribution.parse("uniform:2")
+
+
+def test_quantile_sketch():
+    rows = np.arange(10.0)[:, None] * np.ones((1, 2))
+    sketch = QuantileSketch(size=20)
+    sketch.update(rows[:4])
+    sketch.update(rows[4:])
+    assert sketch.quantiles([50]).tolist() == [[4.5, 4.5]]
+
+    small = QuantileSketch(size=50, seed=1)
+    for start in range(0, 1000, 100):
+        small.update(np.arange(start, start + 100.0)[:, None])
+    assert small.rows.shape == (50, 1)
+    assert 300 < small.quantiles([50])[0, 0] < 700
+
+
+@pytest.mark.parametrize("mode", ["doubling_time", "date_first_hospitalized", "ramp"])
+def test_ensemble_without_uncertainty_matches_model(mode):
+    p = make_params()
+    if mode == "ramp":
+        p = p.replace(mitigation_ramp_days=4)
+    if mode == "date_first_hospitalized":
+        p = p.replace(doubling_time=None, date_first_hospitalized=date(2020, 2, 20))
+    m = SimSirModel(p)
+    bands = run_ensemble(p, {"doubling_time": Distribution("constant", m.doubling_time)}, draws=3)
+    census = m.census_df.set_index("day").loc[0:]
+    assert len(bands) == p.n_days + 1
+    assert np.allclose(bands.census_hospitalized_p5, census.census_hospitalized)
+    assert np.allclose(bands.census_icu_p95, census.census_icu)
+
+
+def test_ensemble_bands_are_ordered():
+    bands = run_ensemble(
+        make_params(),
+        {"hospitalized_rate": Distribution.parse("uniform:0.03,0.07"),
+         "doubling_time": Distribution.parse("normal:6,0.5"),
+         "relative_contact_rate": Distribution.parse("uniform:0.2,0.5")},
+        draws=300, batch_size=64, sketch_size=100)
+    assert (bands.census_hospitalized_p5 <= bands.census_hospitalized_p50).all()
+    assert (bands.census_hospitalized_p50 <= bands.census_hospitalized_p95).all()
+    assert (bands.census_hospitalized_p5 < bands.census_hospitalized_p95).any()
+
+
+def test_ensemble_fits_doubling_time_once(monkeypatch):
+    fits = []
+
+    def counting_model(p):
+        fits.append(p)
+        return SimSirModel(p)
+
+    monkeypatch.setattr(ensemble, "SimSirModel", counting_model)
+    p = make_params(doubling_time=None, date_first_hospitalized=date(2020, 2, 20))
+    run_ensemble(
+        p, {"hospitalized_rate": Distribution.parse("uniform:0.03,0.07")},
+        draws=40, batch_size=10)
+    assert len(fits) == 1
@@ -9,6 +9,7 @@ from src.penn_chime.models import (
     sir,
     sim_sir,
     get_growth_rate,
+    BetaSchedule,
     SimSirModel,
 )
 
@@ -77,6 +78,26 @@ def test_sim_sir():
     assert round(raw["recovered"][-1], 2) == 17.82
 
 
+def test_beta_schedule():
+    policy = [(0.3, 2), (0.2, 3), (0.1, 1)]
+    schedule = BetaSchedule.stages(-2, 6, 0.3, [(0, 0.2), (3, 0.1)])
+    assert schedule.betas.tolist() == BetaSchedule.from_policy(policy).betas.tolist()
+    assert schedule.betas.tolist() == [0.3, 0.3, 0.2, 0.2, 0.2, 0.1]
+
+    raw = sim_sir(5, 6, 7, 0.1, -2, schedule)
+    raw_policy = sim_sir(5, 6, 7, 0.1, -2, policy)
+    assert raw["day"].tolist() == list(range(-2, 5))
+    assert (raw["infected"] == raw_policy["infected"]).all()
+
+    ramped = BetaSchedule.stages(0, 6, 0.4, [(1, 0.1)], ramp_days=3)
+    assert np.allclose(ramped.betas, [0.4, 0.3, 0.2, 0.1, 0.1, 0.1])
+    # Stages past the end of the projection have no effect.
+    assert BetaSchedule.stages(0, 3, 0.4, [(5, 0.1)]).betas.tolist() == [0.4] * 3
+    # Stages before the start are already in effect (part way through a ramp).
+    assert np.allclose(
+        BetaSchedule.stages(2, 3, 0.4, [(1, 0.1)], ramp_days=3).betas, [0.2, 0.1, 0.1])
+
+
 def test_growth_rate():
     assert np.round(get_growth_rate(5) * 100.0, decimals=4) == 14.8698
     assert np.round(get_growth_rate(0) * 100.0, decimals=4) == 0.0
@@ -101,11 +122,15 @@ def test_model(model, param):
 
 
 def test_model_first_hosp_fit(param):
-    param.date_first_hospitalized = param.current_date - timedelta(days=43)
-    param.doubling_time = None
+    param = param.replace(
+        date_first_hospitalized=param.current_date - timedelta(days=43),
+        doubling_time=None)
 
     my_model = SimSirModel(param)
 
+    assert param.doubling_time is None  # the fit is not written back
+    assert my_model.date_first_hospitalized == param.date_first_hospitalized
+
     assert abs(my_model.intrinsic_growth_rate - 0.123) / 0.123 < 0.01
     assert abs(my_model.beta - 4.21501347256401e-07) < EPSILON
     assert abs(my_model.r_t - 2.32) / 2.32 < 0.01
@@ -0,0 +1,111 @@
+from datetime import date
+
+import numpy as np
+import pytest
+
+from src.penn_chime.models import SimSirModel
+from src.penn_chime.multiregion import FitCache, ModelRegion, MultiRegionModel
+from src.penn_chime.parameters import Parameters, Disposition
+
+
+REGIONS = [
+    ModelRegion("A", 600000, 0.30, 60),
+    ModelRegion("B", 900000, 0.07, 25),
+]
+
+
+def make_params(**kwargs):
+    values = dict(
+        current_date=date(2020, 4, 20),
+        current_hospitalized=60,
+        date_first_hospitalized=date(2020, 3, 12),
+        market_share=0.30,
+        mitigation_stages=[(date(2020, 3, 20), 0.3), (date(2020, 4, 25), 0.5)],
+        relative_contact_rate=0.3,
+        population=600000,
+        hospitalized=Disposition(0.05, 7),
+        icu=Disposition(0.02, 9),
+        ventilated=Disposition(0.01, 9),
+        n_days=20,
+    )
+    values.update(kwargs)
+    return Parameters(**values)
+
+
+@pytest.mark.parametrize("mode", ["date_first_hospitalized", "doubling_time"])
+def test_matches_one_model_per_region(mode):
+    p = make_params()
+    if mode == "doubling_time":
+        p = p.replace(
+            date_first_hospitalized=None, doubling_time=4.0,
+            current_date=date(2020, 3, 28),
+            mitigation_stages=[(date(2020, 3, 25), 0.3)])
+    m = MultiRegionModel(p, REGIONS)
+    for k, region in enumerate(REGIONS):
+        single = SimSirModel(p.replace(
+            population=region.population, market_share=region.market_share,
+            current_hospitalized=region.current_hospitalized))
+        assert m.i_day[k] == single.i_day
+        assert m.doubling_time[k] == pytest.approx(single.doubling_time)
+        assert list(m.raw[k]) == list(single.raw)
+        for key, values in single.raw.items():
+            if key == "date":
+                assert (m.raw[k][key] == values).all()
+            else:
+                assert np.allclose(m.raw[k][key], values, equal_nan=True), key
+
+
+def test_derived_regions_are_scaled():
+    # D would be simulated exactly as B is, so it is B scaled.
+    regions = REGIONS + [ModelRegion("D", 900000, 0.07, 25, derived_from="B", derived_scale=1.0)]
+    m = MultiRegionModel(make_params(), regions)
+    assert m.doubling_time[2] == m.doubling_time[1]
+    assert m.raw[2]["infected"] is m.raw[1]["infected"]
+    assert np.array_equal(m.raw[2]["census_icu"], m.raw[1]["census_icu"])
+
+    totals = m.aggregate()
+    assert len(totals["day"]) == len(m.raw[0]["day"])
+    assert np.allclose(
+        totals["census_hospitalized"],
+        sum(raw["census_hospitalized"] for raw in m.raw))
+
+
+def test_derived_regions_are_simulated_when_not_linear():
+    # C's market share gives it its own seed, so it is simulated.
+    p = make_params()
+    regions = REGIONS + [ModelRegion("C", 900000, 0.25, 89, derived_from="B", derived_scale=2.5)]
+    m = MultiRegionModel(p, regions)
+    single = SimSirModel(p.replace(population=900000, market_share=0.25, current_hospitalized=89))
+    assert m.doubling_time[2] == pytest.approx(single.doubling_time)
+    assert m.doubling_time[2] != m.doubling_time[1]
+    assert np.allclose(m.raw[2]["census_hospitalized"], single.raw["census_hospitalized"],
+                       equal_nan=True)
+
+
+@pytest.mark.parametrize("mode", ["date_first_hospitalized", "doubling_time"])
+def test_fit_cache(mode):
+    p = make_params()
+    if mode == "doubling_time":
+        p = p.replace(
+            date_first_hospitalized=None, doubling_time=4.0,
+            current_date=date(2020, 3, 28),
+            mitigation_stages=[(date(2020, 3, 25), 0.3)])
+    cache = FitCache()
+    first = MultiRegionModel(p, REGIONS, cache)
+    assert (cache.hits, cache.misses, len(cache)) == (0, 2, 2)
+
+    # A later stage does not change the fit.
+    later = list(p.mitigation_stages) + [(date(2020, 5, 1), 0.9)]
+    second = MultiRegionModel(p.replace(mitigation_stages=later), REGIONS, cache)
+    assert (cache.hits, cache.misses) == (2, 2)
+    assert second.doubling_time == first.doubling_time
+    assert second.i_day == first.i_day
+    assert np.allclose(
+        second.raw[0]["census_hospitalized"][:first.i_day[0] + 1],
+        first.raw[0]["census_hospitalized"][:first.i_day[0] + 1])
+
+    uncached = MultiRegionModel(p.replace(mitigation_stages=later), REGIONS)
+    assert uncached.doubling_time == second.doubling_time
+
+    MultiRegionModel(p.replace(hospitalized=Disposition(0.04, 7)), REGIONS, cache)
+    assert cache.misses == 4
@@ -0,0 +1,51 @@
+import pickle
+from datetime import date
+
+import pytest
+
+from src.penn_chime.parameters import Parameters, Disposition
+
+
+def make_params(**kwargs):
+    values = dict(
+        current_date=date(2020, 3, 28),
+        current_hospitalized=100,
+        doubling_time=6.0,
+        market_share=0.05,
+        mitigation_stages=[(date(2020, 3, 28), 0.15)],
+        relative_contact_rate=0.15,
+        population=500000,
+        hospitalized=Disposition(0.05, 7),
+        icu=Disposition(0.02, 9),
+        ventilated=Disposition(0.01, 10),
+        n_days=60,
+    )
+    values.update(kwargs)
+    return Parameters(**values)
+
+
+def test_parameters_are_immutable():
+    p = make_params()
+    with pytest.raises(AttributeError):
+        p.doubling_time = 3.0
+    assert not hasattr(p, "__dict__")
+
+
+def test_parameters_replace():
+    p = make_params()
+    q = p.replace(doubling_time=None, date_first_hospitalized=date(2020, 3, 1))
+    assert p.doubling_time == 6.0 and p.date_first_hospitalized is None
+    assert q.doubling_time is None and q.date_first_hospitalized == date(2020, 3, 1)
+    assert q.dispositions["icu"] == Disposition(0.02, 9)
+    with pytest.raises(ValueError):
+        p.replace(market_share=2.0)
+
+
+def test_parameters_hash_and_pickle():
+    p = make_params()
+    assert p == make_params() and hash(p) == hash(make_params())
+    assert p != make_params(n_days=30)
+    assert len({p, make_params(), make_params(n_days=30)}) == 2
+    q = pickle.loads(pickle.dumps(p))
+    assert q == p and q.dispositions == p.dispositions
+    assert Parameters.from_validated(**p.values()) == p